@@ -0,0 +1,121 @@
+"""
+Bulk user import vs one /register call per user.
+
+Both run in-process against FakeIdentityToolkit and FakeFirestore with the
+given latencies. `--register-sample` users go through /register one after the
+other (how onboarding worked before) and the rate is extrapolated to
+`--users`; then `--users` rows are streamed to POST /admin/users:bulkImport
+as NDJSON.
+
+Usage (from backend/):
+    python bench/bench_bulk_import.py --users 100000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+API_KEY = 'bench-api-key'
+ADMIN_UID = 'bench-admin'
+
+
+async def run(args):
+    import httpx
+    import jwt
+
+    import main
+    from fakes import FakeFirestore, FakeIdentityToolkit
+
+    db = FakeFirestore(latency=args.firestore_latency_ms / 1000)
+    toolkit = FakeIdentityToolkit(latency=args.toolkit_latency_ms / 1000, api_key=API_KEY)
+    main._firestore_client = db
+    main._firebase_initialized = True
+    main.WEB_API_KEY = API_KEY
+    main._http_client = main._build_http_client(toolkit.transport())
+    now = int(time.time())
+    admin = jwt.encode({'sub': ADMIN_UID, 'iat': now, 'exp': now + 86400}, main.JWT_SECRET, algorithm='HS256')
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        start = time.perf_counter()
+        for i in range(args.register_sample):
+            resp = await client.post('/register', json={'email': f'reg{i}@example.com', 'password': 'secret-password',
+                                                        'accountName': f'reg{i}'})
+            assert resp.status_code == 201, resp.text
+        per_user = (time.perf_counter() - start) / args.register_sample
+
+        async def upload():
+            chunk = []
+            for i in range(args.users):
+                chunk.append(json.dumps({'email': f'user{i}@example.com', 'password': 'secret-password',
+                                         'accountName': f'user{i}'}))
+                if len(chunk) == 1000:
+                    yield ('\n'.join(chunk) + '\n').encode()
+                    chunk = []
+            if chunk:
+                yield ('\n'.join(chunk) + '\n').encode()
+
+        rpc_before = db.rpc_count
+        start = time.perf_counter()
+        summary = None
+        async with client.stream('POST', '/admin/users:bulkImport', content=upload(),
+                                 headers={'Authorization': f'Bearer {admin}', 'Content-Type': 'application/x-ndjson'}) as resp:
+            async for line in resp.aiter_lines():
+                if line.startswith('{"summary"'):
+                    summary = json.loads(line)['summary']
+        elapsed = time.perf_counter() - start
+
+    return {
+        'config': {
+            'users': args.users,
+            'concurrency': main.BULK_IMPORT_CONCURRENCY,
+            'batch_size': main.BULK_IMPORT_BATCH_SIZE,
+            'toolkit_latency_ms': args.toolkit_latency_ms,
+            'firestore_latency_ms': args.firestore_latency_ms,
+        },
+        'register_one_by_one': {
+            'sample': args.register_sample,
+            'ms_per_user': round(per_user * 1000, 2),
+            'projected_minutes': round(per_user * args.users / 60, 1),
+        },
+        'bulk_import': {
+            'seconds': round(elapsed, 1),
+            'users_per_sec': round(args.users / elapsed, 1),
+            'firestore_rpcs': db.rpc_count - rpc_before,
+            'summary': summary,
+        },
+    }
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--register-sample', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--toolkit-latency-ms', type=float, default=30)
+    parser.add_argument('--firestore-latency-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    # Read by main at import.
+    os.environ['ADMIN_UIDS'] = ADMIN_UID
+    os.environ['BULK_IMPORT_CONCURRENCY'] = str(args.concurrency)
+    os.environ['BULK_IMPORT_MAX_ROWS'] = str(max(args.users, 100000))
+    os.environ['SEARCH_INDEX_ENABLED'] = '0'
+    os.environ.setdefault('LOG_MODE', 'production')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    warnings.simplefilter('ignore')
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,171 @@
+"""
+Load test for the chat fan-out hub (chat_hub.ChatHub) with a local fake message
+source standing in for the per-chat Firestore listeners.
+
+Connections are simulated as coroutines that consume a hub subscription:
+- idle: subscribed to chats that receive no messages,
+- active: subscribed to chats that do, reading as fast as messages arrive,
+- slow: subscribed to the few busiest chats but sleeping `--slow-delay-ms` per
+  message; they should be dropped once they fall CHAT_WS_BUFFER messages behind.
+
+A producer thread (like Firestore's listener thread) emits messages into the
+active chats at `--rate` messages/s. Reports upstream listener count, delivery
+latency percentiles, drops and peak memory as JSON.
+
+Usage (from backend/):
+    python bench/bench_chat_fanout.py --idle 5000 --active 2000 --slow 50 --chats 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from chat_hub import ChatHub  # noqa: E402
+
+
+class FakeMessageSource:
+    """Hub source: records one 'listener' per chat; `produce` emits from a background thread."""
+
+    def __init__(self):
+        self.emitters = {}
+        self.started = 0
+        self.stopped = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, chat_id, emit):
+        with self._lock:
+            self.emitters[chat_id] = emit
+            self.started += 1
+
+        def stop():
+            with self._lock:
+                self.emitters.pop(chat_id, None)
+                self.stopped += 1
+        return stop
+
+    def produce(self, chat_ids, hot_ids, rate, duration, stop_event):
+        """Emit `rate` messages/s for `duration` s; half of them go to the few `hot_ids` chats."""
+        interval = 1.0 / rate
+        deadline = time.perf_counter() + duration
+        seq = 0
+        sent = 0
+        while time.perf_counter() < deadline and not stop_event.is_set():
+            chat_id = random.choice(hot_ids if seq % 2 else chat_ids)
+            with self._lock:
+                emit = self.emitters.get(chat_id)
+            if emit is not None:
+                emit([{'id': f'm{seq}', 'chatId': chat_id, 'sentAt': time.perf_counter()}])
+                sent += 1
+            seq += 1
+            time.sleep(interval)
+        return sent
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args):
+    source = FakeMessageSource()
+    hub = ChatHub(source, args.buffer)
+    active_chats = [f'active-{i}' for i in range(args.chats)]
+    idle_chats = [f'idle-{i}' for i in range(args.chats)]
+    hot_chats = active_chats[:args.hot_chats]
+    latencies = []
+    received = {'active': 0, 'slow': 0, 'idle': 0}
+    subscribed = [0]
+
+    async def connection(kind, chat_id, delay):
+        subscription = await hub.subscribe(chat_id)
+        subscribed[0] += 1
+        try:
+            async for message in subscription:
+                if kind == 'active':
+                    latencies.append(time.perf_counter() - message['sentAt'])
+                received[kind] += 1
+                if delay:
+                    await asyncio.sleep(delay)
+        finally:
+            subscription.close()
+        return subscription.dropped
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    tasks = []
+    for i in range(args.idle):
+        tasks.append(asyncio.ensure_future(connection('idle', idle_chats[i % len(idle_chats)], 0)))
+    for i in range(args.active):
+        tasks.append(asyncio.ensure_future(connection('active', active_chats[i % len(active_chats)], 0)))
+    slow = []
+    for i in range(args.slow):
+        task = asyncio.ensure_future(connection('slow', hot_chats[i % len(hot_chats)], args.slow_delay_ms / 1000))
+        slow.append(task)
+        tasks.append(task)
+    # listeners start on the executor
+    while subscribed[0] < len(tasks):
+        await asyncio.sleep(0.01)
+    setup = time.perf_counter() - t0
+    listeners = len(source.emitters)
+    subscribers = hub.stats()['subscribers']
+
+    stop_event = threading.Event()
+    sent = await asyncio.get_running_loop().run_in_executor(
+        None, source.produce, active_chats, hot_chats, args.rate, args.duration, stop_event)
+    await asyncio.sleep(0.2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    slow_dropped = sum(1 for t in slow if t.done() and t.result())
+    await hub.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        'connections': {'idle': args.idle, 'active': args.active, 'slow': args.slow},
+        'subscribers': subscribers,
+        'upstream_listeners': listeners,
+        'setup_ms': round(setup * 1000, 1),
+        'messages_sent': sent,
+        'deliveries': received,
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+            'p95': round(_percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+            'p99': round(_percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+            'mean': round(statistics.mean(latencies) * 1000, 3) if latencies else None,
+        },
+        'slow_dropped': slow_dropped,
+        'hub_dropped': hub.dropped,
+        'listeners_stopped': source.stopped,
+        'peak_memory_mb': round(peak / 2 ** 20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--idle', type=int, default=5000)
+    parser.add_argument('--active', type=int, default=2000)
+    parser.add_argument('--slow', type=int, default=50)
+    parser.add_argument('--chats', type=int, default=500, help='number of active (and of idle) chats')
+    parser.add_argument('--hot-chats', type=int, default=5, help='active chats receiving half of the traffic; slow clients watch these')
+    parser.add_argument('--rate', type=float, default=500, help='messages per second into active chats')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--buffer', type=int, default=100, help='per-connection buffer (CHAT_WS_BUFFER)')
+    parser.add_argument('--slow-delay-ms', type=float, default=200)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Thundering-herd benchmark for single-flight coalescing.
+
+`--clients` concurrent requests for the same profile (GET /users/{uid}) and the
+same Firestore-backed search (GET /users/search with the index disabled) are
+sent against FakeFirestore, once with coalescing and once with it bypassed.
+Reports Firestore RPCs and latency for each.
+
+Usage (from backend/):
+    python bench/bench_coalescing.py --clients 200 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+
+async def _herd(client, db, clients, path, params=None):
+    rpc_before = db.rpc_count
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        resp = await client.get(path, params=params)
+        latencies.append(time.perf_counter() - start)
+        return resp.status_code
+
+    statuses = await asyncio.gather(*(one() for _ in range(clients)))
+    latencies.sort()
+    return {
+        'firestore_rpcs': db.rpc_count - rpc_before,
+        'statuses': sorted(set(statuses)),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
+
+
+async def run(args):
+    import httpx
+
+    import main
+    from fakes import FakeFirestore
+
+    db = FakeFirestore(latency=args.latency_ms / 1000)
+    for i in range(1000):
+        db.seed('users', f'u{i}', {'uid': f'u{i}', 'email': f'user{i}@example.com', 'accountName': f'user{i}'})
+    main._firestore_client = db
+    main._firebase_initialized = True
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for mode in ('coalesced', 'uncoalesced'):
+            main._profile_cache.clear()
+            main._search_flight.clear()
+            if mode == 'uncoalesced':
+                async def _direct(key, fn, *a, ttl=0.0):
+                    return await fn(*a)
+                main._profile_cache.get = main._load_profile
+                main._search_flight.do = _direct
+            results[mode] = {
+                'users_get': await _herd(client, db, args.clients, '/users/u42'),
+                'users_search': await _herd(client, db, args.clients, '/users/search', {'query': 'user1', 'limit': 20}),
+            }
+    results['stats'] = {'profiles': main._profile_cache._flight.stats(), 'users_search': main._search_flight.stats()}
+    return results
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    # The index would answer searches from memory; force the Firestore path being measured.
+    os.environ['SEARCH_INDEX_ENABLED'] = '0'
+    os.environ.setdefault('LOG_MODE', 'production')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    warnings.simplefilter('ignore')
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    bench()
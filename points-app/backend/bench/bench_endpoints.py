@@ -0,0 +1,195 @@
+"""
+Hermetic end-to-end benchmark of the main routes.
+
+The app runs in-process (httpx.ASGITransport, lifespan included) against the
+local stand-ins from fakes.py, so no Firebase project or network is needed:
+Identity Toolkit is a FakeIdentityToolkit behind httpx.MockTransport and
+Firestore is a FakeFirestore, each with injectable latency.
+
+Scenarios: login, refresh, users_search, users_get, friend_requests. Each one
+sends `--requests` requests from `--concurrency` workers and reports p50/p95/p99
+latency and throughput. The JSON report can be saved with `--output` and
+compared against an earlier run with `--baseline`.
+
+Usage (from backend/):
+    python bench/bench_endpoints.py --requests 2000 --concurrency 32 --output before.json
+    python bench/bench_endpoints.py --requests 2000 --concurrency 32 --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+SCENARIOS = ('login', 'refresh', 'users_search', 'users_get', 'friend_requests')
+API_KEY = 'bench-api-key'
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+async def _measure(client, n, concurrency, make_request):
+    """Run make_request(client, i) for i in range(n) on `concurrency` workers."""
+    counter = iter(range(n))
+    latencies = []
+    statuses = {}
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            resp = await make_request(client, i)
+            latencies.append(time.perf_counter() - start)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': n,
+        'concurrency': concurrency,
+        'throughput_rps': round(n / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+async def run(args):
+    import httpx
+    import jwt
+
+    import main
+    from fakes import FakeFirestore, FakeIdentityToolkit
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    users = args.users
+    db = FakeFirestore(latency=args.firestore_latency_ms / 1000)
+    toolkit = FakeIdentityToolkit(latency=args.toolkit_latency_ms / 1000, api_key=API_KEY)
+    for i in range(users):
+        uid, email = f'u{i}', f'user{i}@example.com'
+        db.seed('users', uid, {'uid': uid, 'email': email, 'accountName': f'user{i}'})
+        toolkit.add_user(uid, email, 'secret-password', f'user{i}')
+    main._firestore_client = db
+    main._firebase_initialized = True
+    main.WEB_API_KEY = API_KEY
+
+    now = int(time.time())
+    tokens = [jwt.encode({'sub': f'u{i}', 'email': f'user{i}@example.com', 'iat': now, 'exp': now + 3600},
+                         main.JWT_SECRET, algorithm='HS256') for i in range(users)]
+    refresh_tokens = [await main._create_refresh_token(f'u{i}', f'user{i}@example.com', f'user{i}') for i in range(users)]
+
+    def auth(i):
+        return {'Authorization': f'Bearer {tokens[i % users]}'}
+
+    requests = {
+        'login': lambda c, i: c.post('/login', json={'email': f'user{i % users}@example.com', 'password': 'secret-password'}),
+        'refresh': lambda c, i: c.post('/refresh', json={'refresh_token': refresh_tokens[i % users]}),
+        'users_search': lambda c, i: c.get('/users/search', params={'query': f'user{i % 100}', 'limit': 20}, headers=auth(i)),
+        'users_get': lambda c, i: c.get(f'/users/u{(i * 7919) % users}', headers=auth(i)),
+        # Distinct (sender, receiver) pairs for the first users * (users - 1) requests, so every one creates a request.
+        'friend_requests': lambda c, i: c.post('/friend_requests', headers=auth(i), json={
+            'senderId': f'u{i % users}', 'receiverId': f'u{(i % users + 1 + i // users) % users}'}),
+    }
+
+    results = {}
+    async with main.lifespan(main.app):
+        # lifespan built a real upstream client; swap in the fake Identity Toolkit
+        await main._http_client.aclose()
+        main._http_client = main._build_http_client(toolkit.transport())
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            for name in args.scenarios:
+                make_request = requests[name]
+                await _measure(client, min(args.warmup, args.requests), args.concurrency, make_request)
+                if name == 'friend_requests':
+                    # the warm-up created some of the pairs; measure on a clean collection
+                    for path in [p for p in db._docs if p.startswith('friend_requests/')]:
+                        db._delete(path)
+                results[name] = await _measure(client, args.requests, args.concurrency, make_request)
+                print(f'{name}: {results[name]["throughput_rps"]} req/s, p99 {results[name]["p99_ms"]} ms',
+                      file=sys.stderr)
+
+    return {
+        'commit': _git_commit(),
+        'config': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'users': users,
+            'firestore_latency_ms': args.firestore_latency_ms,
+            'toolkit_latency_ms': args.toolkit_latency_ms,
+            'search_index': os.environ.get('SEARCH_INDEX_ENABLED', '1'),
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline):
+    """Percent change vs `baseline` for throughput and latency percentiles (negative latency = faster)."""
+    deltas = {}
+    for name, current in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        deltas[name] = {
+            key: round((current[key] - before[key]) / before[key] * 100, 1) if before[key] else None
+            for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')
+        }
+    return {'baseline_commit': baseline.get('commit'), 'change_pct': deltas}
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--firestore-latency-ms', type=float, default=5)
+    parser.add_argument('--toolkit-latency-ms', type=float, default=30)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--no-search-index', action='store_true', help='serve /users/search from Firestore queries')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    args = parser.parse_args()
+
+    # Configured before main is imported: quiet logs and the search-index switch are read at import.
+    os.environ.setdefault('LOG_MODE', 'production')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['SEARCH_INDEX_ENABLED'] = '0' if args.no_search_index else os.environ.get('SEARCH_INDEX_ENABLED', '1')
+    warnings.simplefilter('ignore')
+
+    report = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    bench()
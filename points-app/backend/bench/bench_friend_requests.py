@@ -0,0 +1,136 @@
+"""
+Latency of friend-request creation: the previous sequential flow vs the
+concurrent/transactional pipeline, against FakeFirestore with simulated RPC
+latency.
+
+- legacy: three-field pending query in the executor, then the sender and
+  receiver profile reads and the write run one after another on the event loop
+  (the flow main.py used before the pipeline was rebuilt).
+- pipeline (cold/warm): POST /friend_requests handler with an empty / primed
+  profile cache.
+- bulk: one POST /friend_requests:batchCreate call vs the same number of singles.
+
+Usage (from backend/):
+    python bench/bench_friend_requests.py --latency-ms 5 --requests 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP  # noqa: E402
+
+import main  # noqa: E402
+from fakes import FakeFirestore  # noqa: E402
+
+
+async def legacy_create(db, sender, receiver):
+    requests_ref = db.collection('friend_requests')
+    loop = asyncio.get_running_loop()
+
+    def _query_pending():
+        q = requests_ref.where('senderId', '==', sender).where('receiverId', '==', receiver).where('status', '==', 'pending').limit(1).get()
+        return list(q)
+
+    if await loop.run_in_executor(None, _query_pending):
+        raise RuntimeError('duplicate')
+    sender_doc = db.collection('users').document(sender).get()
+    receiver_doc = db.collection('users').document(receiver).get()
+    payload = {'senderId': sender, 'receiverId': receiver, 'status': 'pending', 'createdAt': SERVER_TIMESTAMP}
+    payload['senderDisplayName'] = (sender_doc.to_dict() or {}).get('accountName')
+    payload['receiverDisplayName'] = (receiver_doc.to_dict() or {}).get('accountName')
+    requests_ref.document().set(payload)
+
+
+async def pipeline_create(db, sender, receiver):
+    req = main.FriendRequestCreate(senderId=sender, receiverId=receiver)
+    resp = await main.create_friend_request(req, {'sub': sender}, None)
+    assert resp.status_code == 201, resp.body
+
+
+def _setup(latency, users):
+    db = FakeFirestore(latency=latency)
+    for i in range(users):
+        db.seed('users', f'u{i}', {'uid': f'u{i}', 'email': f'u{i}@example.com', 'accountName': f'user{i}'})
+    main._firestore_client = db
+    main._firebase_initialized = True
+    main._profile_cache.clear()
+    return db
+
+
+async def _run(create, db, pairs, concurrency):
+    latencies = []
+    pending = iter(pairs)
+
+    async def worker():
+        for sender, receiver in pending:
+            t = time.perf_counter()
+            await create(db, sender, receiver)
+            latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'mean_ms': round(statistics.mean(latencies) * 1e3, 2),
+        'p99_ms': round(latencies[int(0.99 * (len(latencies) - 1))] * 1e3, 2),
+        'req_per_sec': round(len(pairs) / elapsed, 1),
+        'rpcs_per_request': round(db.rpc_count / len(pairs), 2),
+    }
+
+
+async def _bench(latency, n, concurrency, bulk):
+    users = n + 1
+    pairs = [(f'u{i % 50}', f'u{(i % 50) + 1 + i // 50}') for i in range(n)]
+    # pairs must be unique for the duplicate check not to fire
+    pairs = list(dict.fromkeys(p for p in pairs if p[0] != p[1]))
+    results = {}
+    for label, conc in (('sequential', 1), (f'concurrency_{concurrency}', concurrency)):
+        db = _setup(latency, users + 60)
+        results[f'legacy_{label}'] = await _run(legacy_create, db, pairs, conc)
+        db = _setup(latency, users + 60)
+        results[f'pipeline_cold_{label}'] = await _run(pipeline_create, db, pairs, conc)
+        db = _setup(latency, users + 60)
+        await main._get_profiles([f'u{i}' for i in range(users + 60)])
+        db.rpc_count = 0
+        results[f'pipeline_warm_{label}'] = await _run(pipeline_create, db, pairs, conc)
+
+    db = _setup(latency, bulk + 1)
+    receivers = [f'u{i}' for i in range(1, bulk + 1)]
+    t = time.perf_counter()
+    await main.create_friend_requests_bulk(main.FriendRequestBulkCreate(senderId='u0', receiverIds=receivers), {'sub': 'u0'})
+    results[f'bulk_{bulk}'] = {'total_ms': round((time.perf_counter() - t) * 1e3, 2), 'rpcs': db.rpc_count}
+    db = _setup(latency, bulk + 1)
+    t = time.perf_counter()
+    for r in receivers:
+        await pipeline_create(db, 'u0', r)
+    results[f'singles_{bulk}'] = {'total_ms': round((time.perf_counter() - t) * 1e3, 2), 'rpcs': db.rpc_count}
+    return results
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--bulk', type=int, default=50)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    warnings.simplefilter('ignore')
+    results = asyncio.run(_bench(args.latency_ms / 1000, args.requests, args.concurrency, args.bulk))
+    print(json.dumps({'rpc_latency_ms': args.latency_ms, **results}, indent=2))
+
+
+if __name__ == '__main__':
+    bench()
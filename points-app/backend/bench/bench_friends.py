@@ -0,0 +1,135 @@
+"""
+Friend list cost as the number of friendships grows: the app's query pattern
+vs GET /me/friends.
+
+For each `--friendships` total, FakeFirestore is filled with that many
+accepted friend_requests (one user has `--friends` of them) and the
+friend_lists documents are built with migrations/backfill_friend_lists.py.
+For that user it reports documents read and latency of:
+
+- queries: the two `status == accepted` queries messaging_page runs (senderId
+  and receiverId), plus the unfiltered stream of all accepted requests it
+  also keeps open.
+- endpoint: GET /me/friends with a cold cache (one document read) and warm.
+
+Document reads are the portable number: Firestore bills and transfers per
+document. FakeFirestore scans a collection to answer a query, so its query
+latency also grows with the collection size, which a real index would not.
+
+Usage (from backend/):
+    python bench/bench_friends.py --friendships 1000 10000 100000 --friends 50
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'migrations'))
+sys.path.insert(0, HERE)
+
+PROBE = 'probe'
+
+
+def _seed(db, total, friends):
+    users = max(100, total // 10)
+    pairs = {(f'u{i}', PROBE) for i in range(friends)}
+    while len(pairs) < total:
+        a, b = random.sample(range(users), 2)
+        pairs.add((f'u{a}', f'u{b}'))
+    for sender, receiver in pairs:
+        db.seed('friend_requests', f'{sender}_{receiver}', {
+            'senderId': sender, 'receiverId': receiver, 'status': 'accepted',
+            'senderDisplayName': sender, 'receiverDisplayName': receiver,
+        })
+
+
+def _query_pattern(db):
+    requests = db.collection('friend_requests')
+    start = time.perf_counter()
+    sent = list(requests.where('senderId', '==', PROBE).where('status', '==', 'accepted').stream())
+    received = list(requests.where('receiverId', '==', PROBE).where('status', '==', 'accepted').stream())
+    user_queries = time.perf_counter() - start
+    start = time.perf_counter()
+    everything = list(requests.where('status', '==', 'accepted').stream())
+    unfiltered = time.perf_counter() - start
+    return {
+        'user_queries_docs': len(sent) + len(received),
+        'user_queries_ms': round(user_queries * 1000, 2),
+        'unfiltered_stream_docs': len(everything),
+        'unfiltered_stream_ms': round(unfiltered * 1000, 2),
+    }
+
+
+async def _endpoint(client, db, headers, main):
+    main._friends_cache.clear()
+    rpc = db.rpc_count
+    start = time.perf_counter()
+    resp = await client.get('/me/friends', headers=headers)
+    cold = time.perf_counter() - start
+    cold_rpcs = db.rpc_count - rpc
+    start = time.perf_counter()
+    await client.get('/me/friends', headers=headers)
+    warm = time.perf_counter() - start
+    return {
+        'friends_returned': len(resp.json()),
+        'cold_docs': cold_rpcs,
+        'cold_ms': round(cold * 1000, 2),
+        'warm_docs': db.rpc_count - rpc - cold_rpcs,
+        'warm_ms': round(warm * 1000, 2),
+    }
+
+
+async def run(args):
+    import httpx
+    import jwt
+
+    import main
+    from backfill_friend_lists import backfill
+    from fakes import FakeFirestore
+
+    now = int(time.time())
+    token = jwt.encode({'sub': PROBE, 'iat': now, 'exp': now + 3600}, main.JWT_SECRET, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    results = []
+    for total in args.friendships:
+        db = FakeFirestore()
+        _seed(db, total, args.friends)
+        backfill(db)
+        db.latency = args.latency_ms / 1000
+        main._firestore_client = db
+        main._firebase_initialized = True
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            results.append({
+                'friendships': total,
+                'queries': _query_pattern(db),
+                'endpoint': await _endpoint(client, db, headers, main),
+            })
+        print(f'{total} friendships done', file=sys.stderr)
+    return {'friends': args.friends, 'latency_ms': args.latency_ms, 'results': results}
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--friendships', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--friends', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_MODE', 'production')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    warnings.simplefilter('ignore')
+    logging.disable(logging.INFO)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    bench()
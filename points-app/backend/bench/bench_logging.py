@@ -0,0 +1,102 @@
+"""
+Throughput of the authenticated routes under each logging configuration.
+
+Each configuration runs in its own interpreter (logging is configured at
+import) against FakeFirestore, with log output written to a temporary file:
+- debug-sync: LOG_MODE=dev, LOG_LEVEL=DEBUG, every request traced (the old behaviour)
+- production: LOG_MODE=production (INFO, QueueHandler, 1% debug sampling)
+- production-debug: production mode at DEBUG with 1% of requests traced
+
+Usage (from backend/):
+    python bench/bench_logging.py --requests 3000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CONFIGS = {
+    'debug-sync': {'LOG_MODE': 'dev', 'LOG_LEVEL': 'DEBUG', 'LOG_DEBUG_SAMPLE_RATE': '1'},
+    'production': {'LOG_MODE': 'production'},
+    'production-debug': {'LOG_MODE': 'production', 'LOG_LEVEL': 'DEBUG', 'LOG_DEBUG_SAMPLE_RATE': '0.01'},
+}
+
+
+async def _drive(n, concurrency):
+    import httpx
+    import jwt
+
+    import main
+    from fakes import FakeFirestore
+
+    # The benchmark's own client logs every request through httpx; keep it out of the measurement.
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    db = FakeFirestore()
+    for i in range(n + 1):
+        db.seed('users', f'u{i}', {'uid': f'u{i}', 'email': f'u{i}@example.com', 'accountName': f'user{i}'})
+    main._firestore_client = db
+    main._firebase_initialized = True
+
+    now = int(time.time())
+    token = jwt.encode({'sub': 'u0', 'email': 'u0@example.com', 'iat': now, 'exp': now + 3600}, main.JWT_SECRET, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        counter = iter(range(1, n + 1))
+        statuses = {}
+
+        async def worker():
+            for i in counter:
+                resp = await client.post('/friend_requests', headers=headers, json={'senderId': 'u0', 'receiverId': f'u{i}'})
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {'requests': n, 'seconds': round(elapsed, 3), 'req_per_sec': round(n / elapsed, 1), 'statuses': statuses}
+
+
+def _child(n, concurrency):
+    warnings.simplefilter('ignore')
+    sys.path.insert(0, os.path.join(HERE, '..'))
+    sys.path.insert(0, HERE)
+    result = asyncio.run(_drive(n, concurrency))
+    sys.stdout.write(json.dumps(result))
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.requests, args.concurrency)
+        return
+
+    results = {}
+    for name, env in CONFIGS.items():
+        with tempfile.TemporaryFile() as log_file:
+            proc = subprocess.run(
+                [sys.executable, __file__, '--child', '--requests', str(args.requests), '--concurrency', str(args.concurrency)],
+                env={**os.environ, **env}, stdout=subprocess.PIPE, stderr=log_file, check=True,
+            )
+            log_file.seek(0, os.SEEK_END)
+            result = json.loads(proc.stdout)
+            result['log_bytes'] = log_file.tell()
+        results[name] = result
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,206 @@
+"""
+Location points: ingest rate and query latency of the in-memory grid index.
+
+Points are spread around `--cities` random city centres (gaussian, ~`--spread-km`)
+so cell occupancy looks like real traffic rather than a uniform sphere.
+
+- ingest: PointIndex.upsert rate while loading `--points` points, resident
+  memory growth, then the rate of moving already indexed points.
+- put: end-to-end PUT /me/point through the app (ASGI, FakeFirestore) for
+  `--puts` requests from `--publishers` users; `firestore_rpcs` shows how the
+  buffered writer coalesces them into WriteBatch commits.
+- queries: for friend sets of each `--friends` size (friends live in the
+  caller's city), latency of a city-sized bbox, k-nearest and a delta poll,
+  next to a plain scan of the friend set (what the planner falls back to).
+
+Usage (from backend/):
+    python bench/bench_points.py --points 1000000 --friends 50,500,5000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import time
+import timeit
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+
+def _rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _city_points(rng, cities, n, spread_km):
+    spread = spread_km / 111.0
+    for i in range(n):
+        lat0, lng0 = cities[i % len(cities)]
+        lat = max(-90.0, min(90.0, rng.gauss(lat0, spread)))
+        lng = (rng.gauss(lng0, spread / max(0.1, math.cos(math.radians(lat0)))) + 180) % 360 - 180
+        yield f'u{i}', lat, lng
+
+
+def _per_call_us(fn, number):
+    return round(min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6, 1)
+
+
+def _ingest(index, args, rng, cities):
+    rss = _rss_mb()
+    rows = list(_city_points(rng, cities, args.points, args.spread_km))
+    start = time.perf_counter()
+    for uid, lat, lng in rows:
+        index.upsert(uid, lat, lng, 1.0)
+    elapsed = time.perf_counter() - start
+    moves = rows[:args.moves]
+    start = time.perf_counter()
+    for uid, lat, lng in moves:
+        index.upsert(uid, lat + 0.001, lng + 0.001, 2.0)
+    moved = time.perf_counter() - start
+    index.ready = True
+    return {
+        'points': len(index),
+        'cells': index.stats()['cells'],
+        'upserts_per_s': round(len(rows) / elapsed),
+        'moves_per_s': round(len(moves) / moved),
+        'rss_growth_mb': round(_rss_mb() - rss),
+    }
+
+
+def _queries(index, args, rng, cities):
+    from geo_index import haversine_km
+
+    lat0, lng0 = cities[0]
+    # every len(cities)-th uid lives in the caller's city
+    local = [f'u{i}' for i in range(0, args.points, len(cities))]
+    half = args.bbox_km / 2 / 111.0
+    bbox = (lat0 - half, lng0 - half / math.cos(math.radians(lat0)),
+            lat0 + half, lng0 + half / math.cos(math.radians(lat0)))
+    results = {}
+    for size in args.friends:
+        friends = frozenset(rng.sample(local, min(size, len(local))))
+        version = index.version
+        for uid in rng.sample(sorted(friends), max(1, len(friends) // 10)):
+            point = index.get(uid)
+            index.upsert(uid, point.lat + 0.0005, point.lng, point.updated + 1)
+
+        def scan_bbox():
+            return [p for p in map(index.get, friends) if p is not None
+                    and bbox[0] <= p.lat <= bbox[2] and bbox[1] <= p.lng <= bbox[3]]
+
+        def scan_nearest():
+            return sorted((haversine_km(lat0, lng0, p.lat, p.lng), p.uid)
+                          for p in map(index.get, friends) if p is not None)[:args.k]
+
+        assert sorted(p.uid for p in index.within(bbox, friends)) == sorted(p.uid for p in scan_bbox())
+        assert [p.uid for _, p in index.nearest(lat0, lng0, args.k, friends)] == [u for _, u in scan_nearest()]
+        number = max(5, 20000 // size)
+        results[f'friends_{size}'] = {
+            'bbox_us': _per_call_us(lambda: index.within(bbox, friends), number),
+            'bbox_scan_us': _per_call_us(scan_bbox, number),
+            'nearest_us': _per_call_us(lambda: index.nearest(lat0, lng0, args.k, friends), number),
+            'nearest_scan_us': _per_call_us(scan_nearest, number),
+            'delta_us': _per_call_us(lambda: index.changed_since(version, friends, bbox), number),
+            'in_bbox': len(scan_bbox()),
+        }
+    # Unrestricted queries (no friend set), e.g. for an admin view
+    results['all'] = {
+        'bbox_us': _per_call_us(lambda: index.within(bbox), 20),
+        'nearest_us': _per_call_us(lambda: index.nearest(lat0, lng0, args.k), 200),
+    }
+    return results
+
+
+async def _puts(args, rng, cities):
+    import httpx
+    import jwt
+
+    import main
+    from fakes import FakeFirestore
+
+    db = FakeFirestore(latency=args.latency_ms / 1000)
+    main._firestore_client = db
+    main._firebase_initialized = True
+    main._point_index.ready = True
+    expires = int(time.time()) + 3600
+    headers = [{'Authorization': 'Bearer ' + jwt.encode({'sub': f'p{i}', 'exp': expires}, main.JWT_SECRET,
+                                                          algorithm='HS256')} for i in range(args.publishers)]
+    bodies = [{'lat': lat, 'lng': lng} for _, lat, lng in _city_points(rng, cities, args.puts, args.spread_km)]
+    queue = list(enumerate(bodies))
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        async def worker():
+            while queue:
+                i, body = queue.pop()
+                resp = await client.put('/me/point', json=body, headers=headers[i % args.publishers])
+                assert resp.status_code == 202, resp.text
+                # the in-memory transport never yields; a real connection would between requests
+                await asyncio.sleep(0)
+
+        flusher = asyncio.create_task(main._flush_points_periodically())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        flusher.cancel()
+        await main._point_writer.close()
+    stats = main._point_writer.stats()
+    return {
+        'requests': args.puts,
+        'publishers': args.publishers,
+        'requests_per_s': round(args.puts / elapsed),
+        'firestore_rpcs': db.rpc_count,
+        'documents_written': stats['written'],
+        'coalesced': stats['coalesced'],
+    }
+
+
+def run(args):
+    from geo_index import PointIndex
+
+    import main
+
+    rng = random.Random(args.seed)
+    cities = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(args.cities)]
+    index = PointIndex(main.POINT_CELL_DEGREES)
+    results = {'ingest': _ingest(index, args, rng, cities)}
+    results['queries'] = _queries(index, args, rng, cities)
+    results['put'] = asyncio.run(_puts(args, rng, cities))
+    results['config'] = {'points': args.points, 'cities': args.cities, 'spread_km': args.spread_km,
+                         'cell_degrees': main.POINT_CELL_DEGREES, 'bbox_km': args.bbox_km, 'k': args.k,
+                         'flush_interval_s': main.POINT_FLUSH_INTERVAL, 'flush_batch': main.POINT_FLUSH_BATCH}
+    return results
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--cities', type=int, default=200)
+    parser.add_argument('--spread-km', type=float, default=15)
+    parser.add_argument('--moves', type=int, default=200000)
+    parser.add_argument('--friends', type=lambda v: [int(x) for x in v.split(',')], default=[50, 500, 5000])
+    parser.add_argument('--bbox-km', type=float, default=10)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--puts', type=int, default=5000)
+    parser.add_argument('--publishers', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ['SEARCH_INDEX_ENABLED'] = '0'
+    os.environ.setdefault('LOG_MODE', 'production')
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    warnings.simplefilter('ignore')
+    logging.disable(logging.CRITICAL)
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,145 @@
+"""
+Upstream fault scenarios with and without the resilience layer.
+
+Runs in-process against FakeFirestore / FakeIdentityToolkit with injected
+faults (fakes.Faults) and reports latency percentiles and status codes:
+
+- slow_tail: `--slow-rate` of Firestore reads take `--slow-ms` longer.
+  GET /users/{uid} (distinct uids, so the profile cache never answers) with
+  hedging off vs FIRESTORE_HEDGE_DELAY=`--hedge-ms`.
+- outage: every Firestore RPC fails after `--outage-ms`. The same requests with
+  the circuit breaker disabled vs enabled; `firestore_rpcs` is the load that
+  still reached the unhealthy dependency.
+- hung_login: Identity Toolkit stops answering. POST /login with an
+  X-Request-Timeout of `--deadline` seconds: the request ends with 504 at the
+  deadline instead of waiting for the upstream.
+
+Usage (from backend/):
+    python bench/bench_resilience.py --requests 400 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import warnings
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+API_KEY = 'bench-api-key'
+
+
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1)
+    return {'p50_ms': pick(0.50), 'p99_ms': pick(0.99), 'max_ms': round(ordered[-1] * 1000, 1)}
+
+
+async def _drive(client, paths, concurrency, **kwargs):
+    latencies, statuses = [], {}
+    queue = list(paths)
+
+    async def worker():
+        while queue:
+            path = queue.pop()
+            start = time.perf_counter()
+            resp = await client.get(path, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {**_percentiles(latencies), 'statuses': statuses}
+
+
+async def run(args):
+    import httpx
+
+    import main
+    from fakes import Faults, FakeFirestore, FakeIdentityToolkit
+
+    faults = Faults(seed=1)
+    db = FakeFirestore(latency=args.latency_ms / 1000, faults=faults)
+    for i in range(args.requests * 5):
+        db.seed('users', f'u{i}', {'uid': f'u{i}', 'email': f'u{i}@example.com', 'accountName': f'user {i}'})
+    toolkit_faults = Faults(seed=2)
+    toolkit = FakeIdentityToolkit(api_key=API_KEY, faults=toolkit_faults)
+    toolkit.add_user('login-uid', 'login@example.com', 'secret-password')
+    main._firestore_client = db
+    main._firebase_initialized = True
+    main.WEB_API_KEY = API_KEY
+    main._http_client = main._build_http_client(toolkit.transport())
+    breaker = main._breakers['firestore']
+    uids = iter(range(args.requests * 5))
+
+    def paths():
+        return [f'/users/u{next(uids)}' for _ in range(args.requests)]
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        # Warm-up: spin up the executor threads and connections outside the measurements.
+        await _drive(client, paths(), args.concurrency)
+        faults.slow_rate, faults.slow_latency = args.slow_rate, args.slow_ms / 1000
+        main.FIRESTORE_HEDGE_DELAY = 0
+        without = await _drive(client, paths(), args.concurrency)
+        main.FIRESTORE_HEDGE_DELAY = args.hedge_ms / 1000
+        rpcs = db.rpc_count
+        hedged = await _drive(client, paths(), args.concurrency)
+        results['slow_tail'] = {'no_hedging': without,
+                                'hedged': {**hedged, 'firestore_rpcs': db.rpc_count - rpcs}}
+        main.FIRESTORE_HEDGE_DELAY = 0
+        faults.slow_rate = 0
+
+        faults.error_rate, faults.slow_rate, faults.slow_latency = 1.0, 1.0, args.outage_ms / 1000
+        outage = {}
+        for name, threshold in (('no_breaker', 0), ('breaker', main.BREAKER_FAILURE_THRESHOLD)):
+            breaker.failure_threshold = threshold
+            breaker.success()
+            rpcs = db.rpc_count
+            outage[name] = {**await _drive(client, paths(), args.concurrency), 'firestore_rpcs': db.rpc_count - rpcs}
+        results['outage'] = outage
+        faults.error_rate = faults.slow_rate = 0
+
+        toolkit_faults.slow_rate, toolkit_faults.slow_latency = 1.0, 60.0
+        start = time.perf_counter()
+        resp = await client.post('/login', json={'email': 'login@example.com', 'password': 'secret-password'},
+                                 headers={'X-Request-Timeout': str(args.deadline)})
+        results['hung_login'] = {'deadline_s': args.deadline, 'status': resp.status_code,
+                                 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+                                 'upstream_hang_s': toolkit_faults.slow_latency}
+
+    results['config'] = {'requests': args.requests, 'concurrency': args.concurrency, 'latency_ms': args.latency_ms,
+                         'slow_rate': args.slow_rate, 'slow_ms': args.slow_ms, 'hedge_ms': args.hedge_ms,
+                         'outage_ms': args.outage_ms, 'breaker_threshold': main.BREAKER_FAILURE_THRESHOLD}
+    return results
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--slow-rate', type=float, default=0.05)
+    parser.add_argument('--slow-ms', type=float, default=500)
+    parser.add_argument('--hedge-ms', type=float, default=25)
+    parser.add_argument('--outage-ms', type=float, default=200)
+    parser.add_argument('--deadline', type=float, default=1.0)
+    args = parser.parse_args()
+
+    os.environ['SEARCH_INDEX_ENABLED'] = '0'
+    os.environ.setdefault('LOG_MODE', 'production')
+    os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+    warnings.simplefilter('ignore')
+    logging.disable(logging.CRITICAL)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,154 @@
+"""
+Access-token revocation: memory use and verification overhead.
+
+- memory: bytes per revocation in RevocationShards for each `--revocations`
+  count (expiries spread over one hour, like 1-hour access tokens), the cost
+  of a hit and a miss lookup, and the time `sweep` takes to drop one window.
+- verify: warm-cache `_verify_access_token` per call with the revocation and
+  generation check disabled, with an empty MemoryTokenStore, and with the
+  largest revocation set loaded; the difference is the check's overhead.
+- sqlite: the same lookup against SQLiteTokenStore (`--sqlite-revocations`).
+
+Usage (from backend/):
+    python bench/bench_revocation.py --revocations 1000000 3000000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import secrets
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from token_store import MemoryTokenStore, RevocationShards, SQLiteTokenStore  # noqa: E402
+
+HOUR = 3600
+
+
+def _jtis(n):
+    return [secrets.token_urlsafe(12) for _ in range(n)]
+
+
+def _per_call_us(fn, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1e6
+
+
+def bench_memory(n, lookups, now):
+    jtis = _jtis(n)
+    expiries = [now + i * HOUR // n for i in range(n)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    shards = RevocationShards()
+    for jti, exp in zip(jtis, expiries):
+        shards.add(jti, exp)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    step = max(1, n // lookups)
+    hits = [(jtis[i], expiries[i]) for i in range(0, n, step)]
+    misses = [(jti, exp) for jti, (_, exp) in zip(_jtis(len(hits)), hits)]
+    start = time.perf_counter()
+    dropped = shards.sweep(now + shards.shard_seconds)
+    sweep_ms = (time.perf_counter() - start) * 1000
+    return {
+        'revocations': n,
+        'bytes_per_revocation': round(used / n, 1),
+        'mb_total': round(used / 2**20, 1),
+        'hit_lookup_us': round(_per_call_us(shards.contains, hits), 3),
+        'miss_lookup_us': round(_per_call_us(shards.contains, misses), 3),
+        'sweep_one_window_ms': round(sweep_ms, 2),
+        'swept': dropped,
+    }
+
+
+def bench_verify(n, iterations, now):
+    import jwt
+
+    import main
+
+    tokens = []
+    for i in range(min(iterations, 1000)):
+        claims = {'sub': f'uid{i}', 'email': f'user{i}@example.com', 'iat': now, 'exp': now + HOUR,
+                  'jti': secrets.token_urlsafe(12), 'gen': 0}
+        tokens.append('Bearer ' + jwt.encode(claims, main.JWT_SECRET, algorithm='HS256'))
+    calls = [tokens[i % len(tokens)] for i in range(iterations)]
+
+    async def run():
+        verify = main._verify_access_token
+        for header in tokens:
+            await verify(None, header)
+        start = time.perf_counter()
+        for header in calls:
+            await verify(None, header)
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    check = main._check_not_revoked
+    async def no_check(payload):
+        pass
+
+    main._check_not_revoked = no_check
+    unchecked = asyncio.run(run())
+    main._check_not_revoked = check
+    main._token_store = MemoryTokenStore()
+    empty = asyncio.run(run())
+    for jti in _jtis(n):
+        main._token_store.revoke_access(jti, now + HOUR)
+    loaded = asyncio.run(run())
+    return {
+        'iterations': iterations,
+        'no_check_us': round(unchecked, 3),
+        'empty_store_us': round(empty, 3),
+        f'{n}_revocations_us': round(loaded, 3),
+        'check_overhead_us': round(loaded - unchecked, 3),
+    }
+
+
+def bench_sqlite(n, lookups, now):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteTokenStore(os.path.join(tmp, 'tokens.sqlite3'))
+        jtis = _jtis(n)
+        store._conn.execute('BEGIN')
+        for jti in jtis:
+            store.revoke_access(jti, now + HOUR)
+        store._conn.execute('COMMIT')
+        hits = [(jti, now + HOUR) for jti in jtis[:lookups]]
+        result = {
+            'revocations': n,
+            'hit_lookup_us': round(_per_call_us(store.is_access_revoked, hits), 2),
+            'generation_lookup_us': round(_per_call_us(store.generation, [(f'uid{i}',) for i in range(lookups)]), 2),
+            'file_mb': round(os.path.getsize(os.path.join(tmp, 'tokens.sqlite3')) / 2**20, 1),
+        }
+        store.close()
+    return result
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--revocations', type=int, nargs='+', default=[1000000, 3000000])
+    parser.add_argument('--lookups', type=int, default=200000)
+    parser.add_argument('--iterations', type=int, default=50000)
+    parser.add_argument('--sqlite-revocations', type=int, default=200000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    warnings.simplefilter('ignore')
+
+    now = int(time.time())
+    print(json.dumps({
+        'memory': [bench_memory(n, args.lookups, now) for n in args.revocations],
+        'verify': bench_verify(max(args.revocations), args.iterations, now),
+        'sqlite': bench_sqlite(args.sqlite_revocations, min(args.lookups, args.sqlite_revocations), now),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,100 @@
+"""
+Query latency of the in-process user search index at 100k and 1M users.
+
+For each size: build time, approximate memory (tracemalloc), p50/p95/p99
+latency of prefix queries of 1-5 characters, and upsert latency for
+incremental listener updates.
+
+Usage (from backend/):
+    python bench/bench_search_index.py --sizes 100000 1000000 --queries 20000 --limit 20
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from search_index import UserSearchIndex  # noqa: E402
+
+SYLLABLES = ['al', 'an', 'be', 'ca', 'da', 'el', 'fa', 'go', 'ha', 'is', 'jo', 'ka', 'li', 'ma', 'no', 'ol', 'pa',
+             'ra', 'sa', 'te', 'vi', 'wa', 'ya', 'zo']
+
+
+def _users(n, rng):
+    for i in range(n):
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        name = name.capitalize() + str(rng.randint(0, 999))
+        email = f'{name.lower()}.{rng.choice(string.ascii_lowercase)}{i}@example.com'
+        yield (f'uid{i:08d}', name, email)
+
+
+def _percentiles(samples):
+    samples.sort()
+    pick = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))]  # noqa: E731
+    return {'p50_us': round(pick(0.50) * 1e6, 1), 'p95_us': round(pick(0.95) * 1e6, 1), 'p99_us': round(pick(0.99) * 1e6, 1)}
+
+
+def bench_size(n, queries, limit, measure_memory):
+    rng = random.Random(n)
+    rows = list(_users(n, rng))
+    index = UserSearchIndex()
+
+    if measure_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    index.load(rows)
+    build_s = time.perf_counter() - start
+    memory = None
+    if measure_memory:
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    prefixes = []
+    for _ in range(queries):
+        _, name, email = rng.choice(rows)
+        source = name if rng.random() < 0.7 else email
+        prefixes.append(source[: rng.randint(1, 5)])
+
+    latencies = []
+    matched = 0
+    for prefix in prefixes:
+        t = time.perf_counter()
+        matched += len(index.search(prefix, limit))
+        latencies.append(time.perf_counter() - t)
+
+    upserts = []
+    for uid, name, email in rng.sample(rows, min(2000, n)):
+        t = time.perf_counter()
+        index.upsert(uid, name + 'x', email)
+        upserts.append(time.perf_counter() - t)
+
+    result = {
+        'users': n,
+        'build_seconds': round(build_s, 2),
+        'query': _percentiles(latencies),
+        'avg_results': round(matched / queries, 1),
+        'upsert': _percentiles(upserts),
+    }
+    if memory is not None:
+        result['index_mb'] = round(memory / 2**20, 1)
+    return result
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--queries', type=int, default=20_000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc (faster builds)')
+    args = parser.parse_args()
+    print(json.dumps([bench_size(n, args.queries, args.limit, not args.no_memory) for n in args.sizes], indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,109 @@
+"""
+Response serialization and bytes on the wire for the list endpoints.
+
+For a search page (`--rows` UserSearchResult rows) and a /users:batchGet body
+(`--users` profiles) it reports, per response:
+
+- dict_path_us: jsonable_encoder + json.dumps, what JSONResponse did for these
+  routes before they declared response models.
+- model_path_us: validating the dicts into the declared response model and
+  dumping it to JSON bytes with pydantic-core, as FastAPI now does.
+- orjson_us: orjson.dumps on the plain dicts, for reference (if installed).
+- bytes: identity, gzip (COMPRESSION_GZIP_LEVEL) and br
+  (COMPRESSION_BROTLI_QUALITY, if the brotli package is installed).
+
+Usage (from backend/):
+    python bench/bench_serialization.py --rows 100 --users 300
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+import warnings
+from typing import List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+
+def _search_rows(n):
+    return [{'userId': f'uid{i:06d}x7Qp2LmZ', 'accountName': f'Alice Example {i}',
+             'email': f'alice.example{i}@example.com'} for i in range(n)]
+
+
+def _batch_get_body(n):
+    users = {f'uid{i:06d}x7Qp2LmZ': {'uid': f'uid{i:06d}x7Qp2LmZ', 'email': f'user{i}@example.com',
+                                     'accountName': f'User Number {i}'} for i in range(n)}
+    return {'users': users, 'notFound': ['missing-1', 'missing-2']}
+
+
+def _per_call_us(fn, number):
+    return round(min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6, 1)
+
+
+def _measure(name, content, adapter, number):
+    import gzip
+
+    from fastapi.encoders import jsonable_encoder
+
+    import compression
+    import main
+
+    def dict_path():
+        return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None,
+                          separators=(',', ':')).encode('utf-8')
+
+    def model_path():
+        return adapter.dump_json(adapter.validate_python(content))
+
+    body = model_path()
+    assert json.loads(body) == json.loads(dict_path()), name
+    result = {
+        'dict_path_us': _per_call_us(dict_path, number),
+        'model_path_us': _per_call_us(model_path, number),
+    }
+    try:
+        import orjson
+        result['orjson_us'] = _per_call_us(lambda: orjson.dumps(content), number)
+    except ImportError:
+        pass
+    sizes = {'identity': len(body), 'gzip': len(gzip.compress(body, compresslevel=main.COMPRESSION_GZIP_LEVEL))}
+    if compression.brotli is not None:
+        sizes['br'] = len(compression.brotli.compress(body, quality=main.COMPRESSION_BROTLI_QUALITY))
+    result['bytes'] = sizes
+    return result
+
+
+def run(args):
+    from pydantic import TypeAdapter
+
+    import main
+
+    return {
+        'search': _measure('search', _search_rows(args.rows), TypeAdapter(List[main.UserSearchResult]),
+                           args.number),
+        'batch_get': _measure('batch_get', _batch_get_body(args.users), TypeAdapter(main.BatchGetUsersResponse),
+                              args.number),
+        'config': {'rows': args.rows, 'users': args.users, 'minimum_size': main.COMPRESSION_MIN_SIZE},
+    }
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault('LOG_MODE', 'production')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    warnings.simplefilter('ignore')
+    logging.disable(logging.INFO)
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,85 @@
+"""
+Worker cold-start cost: `import main` time and time from process start to the
+first successful request.
+
+- import: median wall time of `import main` in a fresh interpreter.
+- first request: starts `uvicorn main:app` and polls /ping (liveness) and
+  /ready (readiness, once the lifespan warm-up has finished) until each returns
+  200; reports the time from spawning the process. /ready is reported as null
+  when the app does not have it.
+
+Usage (from backend/):
+    python bench/bench_startup.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ENV = {**os.environ, 'LOG_MODE': 'production', 'LOG_LEVEL': 'WARNING'}
+
+
+def _import_time():
+    code = 'import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=BACKEND, env=ENV, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _first_request(timeout=30.0):
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+                            cwd=BACKEND, env=ENV, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {'ping': None, 'ready': None}
+    try:
+        with httpx.Client(base_url=f'http://127.0.0.1:{port}', timeout=1.0) as client:
+            while time.perf_counter() - started < timeout and None in results.values():
+                for name in [n for n, v in results.items() if v is None]:
+                    try:
+                        resp = client.get(f'/{name}')
+                    except httpx.TransportError:
+                        break
+                    if resp.status_code == 200:
+                        results[name] = time.perf_counter() - started
+                    elif name == 'ready' and resp.status_code == 404:
+                        results[name] = 'missing'
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return results
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    imports = [_import_time() for _ in range(args.runs)]
+    firsts = [_first_request() for _ in range(args.runs)]
+    ping = [r['ping'] for r in firsts if isinstance(r['ping'], float)]
+    ready = [r['ready'] for r in firsts if isinstance(r['ready'], float)]
+    print(json.dumps({
+        'runs': args.runs,
+        'import_ms': round(statistics.median(imports) * 1000, 1),
+        'first_ping_ms': round(statistics.median(ping) * 1000, 1) if ping else None,
+        'first_ready_ms': round(statistics.median(ready) * 1000, 1) if ready else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,108 @@
+"""
+Benchmark the refresh-token store backends.
+
+Reports lookups per second (hits and misses) and resident memory per million
+tokens for the in-memory store, plus lookup/insert rates for the SQLite store.
+
+Usage (from backend/):
+    python bench/bench_token_store.py --tokens 1000000 --lookups 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import secrets
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from token_store import MemoryTokenStore, RefreshEntry, SQLiteTokenStore  # noqa: E402
+
+
+def _fill(store, n, now):
+    tokens = []
+    for i in range(n):
+        token = secrets.token_urlsafe(48)
+        store.put(token, RefreshEntry(f'uid{i}', f'user{i}@example.com', None, now + random.randint(1, 30 * 86400)))
+        tokens.append(token)
+    return tokens
+
+
+def _lookups(store, tokens, count):
+    sample = [random.choice(tokens) for _ in range(count // 2)] + [secrets.token_urlsafe(48) for _ in range(count // 2)]
+    random.shuffle(sample)
+    start = time.perf_counter()
+    for token in sample:
+        if store.get(token) is None:
+            store.is_revoked(token)
+    return count / (time.perf_counter() - start)
+
+
+def bench_memory(n, lookups):
+    now = int(time.time())
+    tracemalloc.start()
+    store = MemoryTokenStore()
+    # Keep the client-side token strings out of the measurement: generate, then subtract.
+    before = tracemalloc.get_traced_memory()[0]
+    tokens = _fill(store, n, now)
+    after = tracemalloc.get_traced_memory()[0]
+    token_bytes = sum(sys.getsizeof(t) for t in tokens) + sys.getsizeof(tokens)
+    tracemalloc.stop()
+    store_bytes = after - before - token_bytes
+
+    rate = _lookups(store, tokens, lookups)
+    for token in tokens[: n // 10]:
+        store.revoke(token)
+    start = time.perf_counter()
+    removed = store.sweep(now + 31 * 86400)
+    sweep_s = time.perf_counter() - start
+    return {
+        'backend': 'memory',
+        'tokens': n,
+        'lookups_per_sec': round(rate),
+        'bytes_per_token': round(store_bytes / n, 1),
+        'mb_per_million_tokens': round(store_bytes / n * 1_000_000 / 2**20, 1),
+        'sweep_seconds': round(sweep_s, 3),
+        'swept': removed,
+        'remaining': len(store),
+    }
+
+
+def bench_sqlite(n, lookups):
+    now = int(time.time())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tokens.sqlite3')
+        store = SQLiteTokenStore(path)
+        start = time.perf_counter()
+        tokens = _fill(store, n, now)
+        insert_rate = n / (time.perf_counter() - start)
+        rate = _lookups(store, tokens, lookups)
+        store.sweep(now)
+        size = os.path.getsize(path) + os.path.getsize(path + '-wal')
+        store.close()
+    return {
+        'backend': 'sqlite',
+        'tokens': n,
+        'inserts_per_sec': round(insert_rate),
+        'lookups_per_sec': round(rate),
+        'disk_mb_per_million_tokens': round(size / n * 1_000_000 / 2**20, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=1_000_000)
+    parser.add_argument('--sqlite-tokens', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    args = parser.parse_args()
+
+    results = [bench_memory(args.tokens, args.lookups), bench_sqlite(args.sqlite_tokens, args.lookups)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
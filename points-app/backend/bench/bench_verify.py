@@ -0,0 +1,85 @@
+"""
+Micro-benchmark of the `_verify_access_token` dependency.
+
+Measures the cost per call with a cold cache (every token seen for the first
+time) and a warm cache (a client reusing its token), with logging disabled so
+only verification is measured. Pass --with-logging to keep the app's log config.
+
+Usage (from backend/):
+    python bench/bench_verify.py --iterations 20000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import jwt  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import main  # noqa: E402
+
+
+def _make_token(i):
+    now = int(time.time())
+    return jwt.encode({'sub': f'uid{i}', 'email': f'user{i}@example.com', 'iat': now, 'exp': now + 3600},
+                      main.JWT_SECRET, algorithm='HS256')
+
+
+def _make_request(token):
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/friend_requests',
+        'headers': [(b'authorization', f'Bearer {token}'.encode()), (b'user-agent', b'bench')],
+        'query_string': b'',
+    }
+    return Request(scope)
+
+
+async def _run(requests_and_headers):
+    verify = main._verify_access_token
+    start = time.perf_counter()
+    for request, header in requests_and_headers:
+        await verify(request, header)
+    return (time.perf_counter() - start) / len(requests_and_headers)
+
+
+def bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--with-logging', action='store_true')
+    args = parser.parse_args()
+    if not args.with_logging:
+        logging.disable(logging.CRITICAL)
+    warnings.simplefilter('ignore')
+
+    n = args.iterations
+    main._verified_token_cache.maxsize = max(main._verified_token_cache.maxsize, n)
+    cold = []
+    for i in range(n):
+        token = _make_token(i)
+        cold.append((_make_request(token), f'Bearer {token}'))
+
+    main._verified_token_cache.clear()
+    cold_s = asyncio.run(_run(cold))
+    # Same tokens again: every lookup is now a cache hit.
+    warm_s = asyncio.run(_run(cold))
+
+    print(json.dumps({
+        'iterations': n,
+        'cold_us_per_call': round(cold_s * 1e6, 2),
+        'warm_us_per_call': round(warm_s * 1e6, 2),
+        'speedup': round(cold_s / warm_s, 1),
+        'cache': main._verified_token_cache.stats(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,450 @@
+"""
+Local stand-ins for the Firebase services the backend talks to.
+
+FakeFirestore mimics the subset of the synchronous google-cloud-firestore
+client that main.py uses. Every RPC (get, stream, set, ...) blocks for
+`latency` seconds, as the real client would while waiting on the network.
+
+FakeIdentityToolkit answers the Identity Toolkit REST calls (signUp,
+signInWithPassword) through an httpx.MockTransport, after an asyncio sleep of
+`latency` seconds; plug it in with `main._build_http_client(toolkit.transport())`.
+
+Both accept `faults=Faults(...)` to inject extra latency and errors into a
+fraction of calls: Firestore RPCs raise ServiceUnavailable, Identity Toolkit
+calls answer 503. Settings can be changed while a run is in progress.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import httpx
+
+from google.api_core.exceptions import Aborted, ServiceUnavailable
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+
+
+class Faults:
+    """Fault injection: `slow_rate` of calls take `slow_latency` extra seconds, `error_rate` of calls fail."""
+
+    def __init__(self, error_rate=0.0, slow_rate=0.0, slow_latency=0.0, seed=None):
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.injected_errors = 0
+        self.injected_delays = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(extra latency, fail) for one call."""
+        with self._lock:
+            delay = self.slow_latency if self.slow_rate and self._random.random() < self.slow_rate else 0.0
+            fail = bool(self.error_rate) and self._random.random() < self.error_rate
+            self.injected_delays += delay > 0
+            self.injected_errors += fail
+        return delay, fail
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, f'{self.path}/{name}')
+
+    def get(self, transaction=None):
+        self._db._rpc()
+        if transaction is not None:
+            transaction._track(self.path)
+        return self._db._snapshot(self.path)
+
+    def set(self, data, merge=False):
+        self._db._rpc()
+        self._db._write(self.path, data, merge=merge)
+
+    def update(self, data):
+        self._db._rpc()
+        if self._db._docs.get(self.path) is None:
+            raise KeyError(f'No document to update: {self.path}')
+        self._db._write(self.path, data, merge=True)
+
+    def delete(self):
+        self._db._rpc()
+        self._db._delete(self.path)
+
+
+class FakeQuery:
+    _OPS = {
+        '==': lambda a, b: a == b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a is not None and a < b,
+        '<=': lambda a, b: a is not None and a <= b,
+        '>': lambda a, b: a is not None and a > b,
+        '>=': lambda a, b: a is not None and a >= b,
+        'in': lambda a, b: a in b,
+        'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    }
+
+    def __init__(self, db, path, filters=(), orders=(), limit_=None, cursor=None):
+        self._db = db
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_
+        self._cursor = cursor
+
+    def _copy(self, **kw):
+        args = dict(filters=self._filters, orders=self._orders, limit_=self._limit, cursor=self._cursor)
+        args.update(kw)
+        return FakeQuery(self._db, self._path, **args)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, n):
+        return self._copy(limit_=n)
+
+    def start_after(self, values):
+        if isinstance(values, dict):
+            values = [values.get(f) for f, _ in self._orders]
+        return self._copy(cursor=tuple(values))
+
+    @staticmethod
+    def _value(path, data, field):
+        return path.rsplit('/', 1)[-1] if field == '__name__' else data.get(field)
+
+    def _sort_key(self, item):
+        path, data = item
+        return tuple(self._value(path, data, f) for f, _ in self._orders) + (path,)
+
+    def _accepts(self, data):
+        return all(self._OPS[op](data.get(f), v) for f, op, v in self._filters)
+
+    def _matches(self):
+        rows = []
+        for path, data in list(self._db._collections.get(self._path, {}).items()):
+            if self._accepts(data):
+                rows.append((path, data))
+        if self._orders:
+            descending = self._orders[0][1] == 'DESCENDING'
+            rows = [r for r in rows if all(self._value(r[0], r[1], f) is not None for f, _ in self._orders)]
+            rows.sort(key=self._sort_key, reverse=descending)
+            if self._cursor is not None:
+                n = len(self._cursor)
+                if descending:
+                    rows = [r for r in rows if self._sort_key(r)[:n] < self._cursor]
+                else:
+                    rows = [r for r in rows if self._sort_key(r)[:n] > self._cursor]
+        else:
+            rows.sort()
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        return [FakeSnapshot(FakeDocumentReference(self._db, p), dict(d), self._db._times.get(p)) for p, d in rows]
+
+    def stream(self, transaction=None):
+        self._db._rpc()
+        for snap in self._matches():
+            yield snap
+
+    def get(self, transaction=None):
+        self._db._rpc()
+        return self._matches()
+
+    def on_snapshot(self, callback):
+        """Deliver the matching documents as ADDED, then later changes to matching documents."""
+        return self._db._watch(self._path, callback, self)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+        self.id = path.rsplit('/', 1)[-1]
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._db, f'{self._path}/{doc_id or uuid.uuid4().hex[:20]}')
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+
+class FakeWatch:
+    def __init__(self, db, path, callback, query=None):
+        self._db = db
+        self._path = path
+        self._callback = callback
+        self._query = query
+
+    def unsubscribe(self):
+        with self._db._lock:
+            watchers = self._db._watchers.get(self._path, [])
+            if self in watchers:
+                watchers.remove(self)
+
+
+class FakeWriteBatch:
+    """Buffers writes and applies them together on commit (one RPC)."""
+
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(('set', ref.path, data, merge))
+
+    def update(self, ref, data):
+        self._writes.append(('update', ref.path, data, True))
+
+    def delete(self, ref):
+        self._writes.append(('delete', ref.path, None, False))
+
+    def _apply(self):
+        for op, path, data, merge in self._writes:
+            if op == 'delete':
+                self._db._delete(path)
+            else:
+                self._db._write(path, data, merge=merge)
+        self._writes = []
+
+    def commit(self):
+        self._db._rpc()
+        with self._db._lock:
+            self._apply()
+
+
+class FakeTransaction(FakeWriteBatch):
+    """Optimistic transaction compatible with @firestore.transactional.
+
+    Reads record the version of each document; commit raises Aborted (and the
+    decorator retries) if any of them changed in the meantime.
+    """
+
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, db):
+        super().__init__(db)
+        self._id = None
+        self._reads = {}
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def _track(self, path):
+        self._reads.setdefault(path, self._db._versions.get(path, 0))
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        self._db._rpc()
+        with self._db._lock:
+            for path, version in self._reads.items():
+                if self._db._versions.get(path, 0) != version:
+                    self._clean_up()
+                    raise Aborted('Transaction contention on ' + path)
+            self._apply()
+        self._clean_up()
+        return []
+
+
+def _change(kind, snapshot):
+    return SimpleNamespace(type=SimpleNamespace(name=kind), document=snapshot)
+
+
+class FakeFirestore:
+    """In-memory Firestore stand-in. `latency` is the simulated RPC round trip in seconds."""
+
+    def __init__(self, latency=0.0, faults=None):
+        self.latency = latency
+        self.faults = faults
+        self.rpc_count = 0
+        self._docs = {}
+        self._times = {}
+        # collection path -> {document path: data}, so queries only scan their own collection
+        self._collections = {}
+        self._watchers = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def _rpc(self):
+        with self._lock:
+            self.rpc_count += 1
+        delay, fail = self.faults.draw() if self.faults is not None else (0.0, False)
+        if self.latency or delay:
+            time.sleep(self.latency + delay)
+        if fail:
+            raise ServiceUnavailable('Injected fault')
+
+    def _snapshot(self, path):
+        data = self._docs.get(path)
+        return FakeSnapshot(FakeDocumentReference(self, path), dict(data) if data is not None else None, self._times.get(path))
+
+    def _write(self, path, data, merge=False):
+        now = datetime.now(timezone.utc)
+        resolved = {k: (now if v is SERVER_TIMESTAMP else v) for k, v in data.items()}
+        with self._lock:
+            existed = self._docs.get(path) is not None
+            base = dict(self._docs.get(path) or {}) if merge else {}
+            base.update(resolved)
+            self._docs[path] = base
+            self._times[path] = now
+            self._collections.setdefault(path.rsplit('/', 1)[0], {})[path] = base
+            self._versions[path] = self._versions.get(path, 0) + 1
+        self._notify(path, 'MODIFIED' if existed else 'ADDED')
+
+    def _delete(self, path):
+        with self._lock:
+            data = self._docs.pop(path, None)
+            self._times.pop(path, None)
+            self._versions[path] = self._versions.get(path, 0) + 1
+            self._collections.get(path.rsplit('/', 1)[0], {}).pop(path, None)
+        if data is not None:
+            self._notify(path, 'REMOVED', data)
+
+    def _watch(self, collection_path, callback, query=None):
+        """Deliver the current documents as ADDED, then every later change, synchronously."""
+        watch = FakeWatch(self, collection_path, callback, query)
+        with self._lock:
+            docs = (query or FakeCollection(self, collection_path))._matches()
+            self._watchers.setdefault(collection_path, []).append(watch)
+        callback(docs, [_change('ADDED', d) for d in docs], datetime.now(timezone.utc))
+        return watch
+
+    def _notify(self, path, kind, removed_data=None):
+        watchers = list(self._watchers.get(path.rsplit('/', 1)[0], ()))
+        if not watchers:
+            return
+        if removed_data is not None:
+            snap = FakeSnapshot(FakeDocumentReference(self, path), dict(removed_data))
+        else:
+            snap = self._snapshot(path)
+        for watch in watchers:
+            if watch._query is not None and kind != 'REMOVED' and not watch._query._accepts(snap.to_dict()):
+                continue
+            watch._callback([], [_change(kind, snap)], datetime.now(timezone.utc))
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self._rpc()
+        for ref in references:
+            if transaction is not None:
+                transaction._track(ref.path)
+            yield self._snapshot(ref.path)
+
+    def transaction(self, **kwargs):
+        return FakeTransaction(self)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def seed(self, collection, doc_id, data):
+        """Insert a document without counting an RPC or sleeping."""
+        self._write(f'{collection}/{doc_id}', data)
+
+
+class FakeIdentityToolkit:
+    """In-memory Identity Toolkit accounts API. `latency` is the simulated round trip in seconds."""
+
+    def __init__(self, latency=0.0, api_key=None, faults=None):
+        self.latency = latency
+        self.api_key = api_key
+        self.faults = faults
+        self.calls = 0
+        # email -> {'localId', 'email', 'password', 'displayName'}
+        self._accounts = {}
+
+    def add_user(self, uid, email, password, display_name=None):
+        self._accounts[email.lower()] = {'localId': uid, 'email': email, 'password': password, 'displayName': display_name}
+
+    def transport(self):
+        return httpx.MockTransport(self._handle)
+
+    @staticmethod
+    def _error(message, status=400):
+        return httpx.Response(status, json={'error': {'code': status, 'message': message}})
+
+    async def _handle(self, request):
+        self.calls += 1
+        delay, fail = self.faults.draw() if self.faults is not None else (0.0, False)
+        if self.latency or delay:
+            await asyncio.sleep(self.latency + delay)
+        if fail:
+            return self._error('UNAVAILABLE: injected fault', status=503)
+        if self.api_key is not None and request.url.params.get('key') != self.api_key:
+            return self._error('API key not valid. Please pass a valid API key.')
+        method = request.url.path.rsplit(':', 1)[-1]
+        body = json.loads(request.content or b'{}')
+        email = (body.get('email') or '').lower()
+        if method == 'signInWithPassword':
+            account = self._accounts.get(email)
+            if account is None:
+                return self._error('EMAIL_NOT_FOUND')
+            if account['password'] != body.get('password'):
+                return self._error('INVALID_PASSWORD')
+            return httpx.Response(200, json=self._token_response(account, registered=True))
+        if method == 'signUp':
+            if email in self._accounts:
+                return self._error('EMAIL_EXISTS')
+            account = {'localId': uuid.uuid4().hex[:28], 'email': body.get('email'),
+                       'password': body.get('password'), 'displayName': body.get('displayName')}
+            self._accounts[email] = account
+            return httpx.Response(200, json=self._token_response(account))
+        return self._error(f'Unsupported method {method}', status=404)
+
+    @staticmethod
+    def _token_response(account, registered=False):
+        response = {
+            'kind': 'identitytoolkit#VerifyPasswordResponse',
+            'localId': account['localId'],
+            'email': account['email'],
+            'displayName': account['displayName'] or '',
+            'idToken': f"fake-id-token-{account['localId']}",
+            'refreshToken': f"fake-refresh-{account['localId']}",
+            'expiresIn': '3600',
+        }
+        if registered:
+            response['registered'] = True
+        return response
@@ -0,0 +1,177 @@
+"""
+Small in-process caches used on request hot paths.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Union
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded LRU mapping where every entry carries its own absolute expiry.
+
+    Not thread-safe; it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int, clock: Callable[[], float] = time.time):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float) -> None:
+        if self.maxsize <= 0:
+            return
+        data = self._data
+        data[key] = (value, expires_at)
+        data.move_to_end(key)
+        while len(data) > self.maxsize:
+            data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async calls into one.
+
+    `do(key, fn, *args)` awaits `fn(*args)` unless a call for `key` is already
+    in flight, in which case it waits for that call's result (or exception).
+    With `ttl` > 0 the result is kept for that many seconds and served to later
+    callers too; `ttl` may also be a function of the result. Errors are never kept.
+    Keys are typically (operation, *arguments).
+    """
+
+    def __init__(self, maxsize: int = 1024, clock: Callable[[], float] = time.time):
+        self._results = TTLCache(maxsize, clock)
+        self._clock = clock
+        self._inflight: dict = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args,
+                 ttl: Union[float, Callable[[Any], float]] = 0.0) -> Any:
+        hit = self._results.get(key, _MISSING)
+        if hit is not _MISSING:
+            return hit
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            self.calls += 1
+            value = await fn(*args)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unobserved failure does not log "exception was never retrieved".
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            # Only store if nobody forgot the key while the call was running.
+            if self._inflight.get(key) is future:
+                self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return a kept result without calling anything; `default` if absent."""
+        return self._results.get(key, default)
+
+    def set(self, key: Hashable, value: Any, ttl: Union[float, Callable[[Any], float]]) -> None:
+        ttl = ttl(value) if callable(ttl) else ttl
+        if ttl > 0:
+            self._results.set(key, value, self._clock() + ttl)
+
+    def forget(self, key: Hashable) -> None:
+        self._results.pop(key)
+        # A call already in flight may have read stale data; do not let it store its result.
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        return {**self._results.stats(), 'calls': self.calls, 'coalesced': self.coalesced,
+                'in_flight': len(self._inflight)}
+
+
+class ReadThroughCache:
+    """Async read-through cache in front of a slow loader (e.g. a Firestore point read).
+
+    - `loader(key)` returns the value, or None when the key does not exist;
+      misses are cached too, for `negative_ttl` seconds.
+    - Concurrent misses for the same key share one in-flight load (SingleFlight).
+    - Loader errors are propagated to every waiter and never cached.
+    """
+
+    def __init__(self, loader: Callable[[Hashable], Awaitable[Any]], maxsize: int, ttl: float,
+                 negative_ttl: float, clock: Callable[[], float] = time.time):
+        self._loader = loader
+        self._flight = SingleFlight(maxsize, clock)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def _ttl_for(self, value: Any) -> float:
+        return self.ttl if value is not None else self.negative_ttl
+
+    async def get(self, key: Hashable) -> Any:
+        return await self._flight.do(key, self._loader, key, ttl=self._ttl_for)
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (None for a cached miss) without loading; `default` if absent."""
+        return self._flight.peek(key, default)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._flight.set(key, value, self._ttl_for)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._flight.forget(key)
+
+    def clear(self) -> None:
+        self._flight.clear()
+
+    def stats(self) -> dict:
+        stats = self._flight.stats()
+        stats['loads'] = stats.pop('calls')
+        return stats
@@ -0,0 +1,206 @@
+"""
+In-process fan-out of new chat messages to connected clients.
+
+One upstream listener is kept per chat that has at least one subscriber, no
+matter how many clients are watching it:
+
+- `source(chat_id, emit)` starts the upstream listener and returns a callable
+  that stops it. `emit(messages)` may be called from any thread (Firestore
+  delivers snapshots on its own thread); the hub hops onto the event loop.
+- Both calls block (opening a Firestore listener starts a gRPC stream and
+  threads; closing one joins its consumer thread), so they run on `executor`.
+  A chat's listener is only started once its previous one has stopped, and
+  is stopped only once its start has finished.
+- Every subscription has a bounded buffer. A subscriber that falls
+  `buffer_size` messages behind is dropped: its buffer is discarded and its
+  iterator ends, so one slow client cannot make the hub hold unbounded memory.
+- The upstream listener is stopped when the last subscriber of a chat leaves.
+
+The hub itself is used from the event loop only.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger('chat_hub')
+
+_CLOSED = object()
+
+Source = Callable[[str, Callable[[List[dict]], None]], Callable[[], None]]
+
+
+class Subscription:
+    """A client's view of one chat: `async for message in subscription`."""
+
+    def __init__(self, hub: 'ChatHub', chat_id: str, buffer_size: int):
+        self.hub = hub
+        self.chat_id = chat_id
+        self.dropped = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size + 1)  # +1 for the close marker
+        self._buffer_size = buffer_size
+
+    def _offer(self, message: dict) -> bool:
+        """Queue `message`; returns False (and closes) when the subscriber is too far behind."""
+        if self._queue.qsize() >= self._buffer_size:
+            self.dropped = True
+            self._close()
+            return False
+        self._queue.put_nowait(message)
+        return True
+
+    def _close(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_CLOSED)
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        item = await self._queue.get()
+        if item is _CLOSED:
+            # Leave the marker in place so repeated iteration also stops.
+            self._queue.put_nowait(_CLOSED)
+            raise StopAsyncIteration
+        return item
+
+
+class _Channel:
+    __slots__ = ('subscribers', 'stop', 'delivered', 'started')
+
+    def __init__(self):
+        self.subscribers: Set[Subscription] = set()
+        self.stop = None
+        self.delivered = 0
+        # task starting the upstream listener
+        self.started: Optional[asyncio.Future] = None
+
+
+class ChatHub:
+    def __init__(self, source: Source, buffer_size: int = 100, executor: Optional[Executor] = None):
+        self._source = source
+        self.buffer_size = buffer_size
+        # where the blocking source and stop calls run (None: the loop's default executor)
+        self._executor = executor
+        self._channels: Dict[str, _Channel] = {}
+        # chat ID -> task stopping its previous upstream listener
+        self._stopping: Dict[str, asyncio.Task] = {}
+        self._loop = None
+        self.dropped = 0
+
+    async def subscribe(self, chat_id: str) -> Subscription:
+        """Register a subscriber, starting the chat's upstream listener if it is the first one.
+
+        Returns once the listener is running; raises if starting it failed.
+        """
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self, chat_id, self.buffer_size)
+        channel = self._channels.get(chat_id)
+        if channel is None:
+            channel = self._channels[chat_id] = _Channel()
+            channel.started = asyncio.ensure_future(self._start(chat_id, channel))
+        channel.subscribers.add(subscription)
+        try:
+            await asyncio.shield(channel.started)
+        except BaseException:
+            self.unsubscribe(subscription)
+            raise
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        channel = self._channels.get(subscription.chat_id)
+        if channel is None or subscription not in channel.subscribers:
+            return
+        channel.subscribers.discard(subscription)
+        subscription._close()
+        if not channel.subscribers:
+            del self._channels[subscription.chat_id]
+            self._schedule_stop(subscription.chat_id, channel)
+
+    async def _start(self, chat_id: str, channel: _Channel) -> None:
+        previous = self._stopping.get(chat_id)
+        if previous is not None:
+            await asyncio.wait([previous])
+        channel.stop = await self._loop.run_in_executor(self._executor, self._source, chat_id,
+                                                        self._emitter(chat_id, channel))
+        logger.debug('Started upstream listener for chat %s', chat_id)
+
+    def _schedule_stop(self, chat_id: str, channel: _Channel) -> None:
+        task = asyncio.ensure_future(self._stop(chat_id, channel))
+        self._stopping[chat_id] = task
+
+        def _done(_):
+            if self._stopping.get(chat_id) is task:
+                del self._stopping[chat_id]
+
+        task.add_done_callback(_done)
+
+    async def _stop(self, chat_id: str, channel: _Channel) -> None:
+        started = channel.started
+        if started is not None:
+            await asyncio.wait([started])
+            if started.cancelled() or started.exception() is not None:
+                return
+        if channel.stop is None:
+            return
+        try:
+            await self._loop.run_in_executor(self._executor, channel.stop)
+        except Exception:
+            logger.debug('Failed to stop upstream listener for chat %s', chat_id, exc_info=True)
+        logger.debug('Stopped upstream listener for chat %s', chat_id)
+
+    def _emitter(self, chat_id: str, channel: _Channel) -> Callable[[List[dict]], None]:
+        loop = self._loop
+
+        def deliver(messages: List[dict]) -> None:
+            # Late snapshots of a listener being stopped must not reach its successor's subscribers.
+            if self._channels.get(chat_id) is channel:
+                self.publish(chat_id, messages)
+
+        def emit(messages: List[dict]) -> None:
+            try:
+                loop.call_soon_threadsafe(deliver, messages)
+            except RuntimeError:
+                # event loop already closed
+                pass
+
+        return emit
+
+    def publish(self, chat_id: str, messages: List[dict]) -> None:
+        """Deliver `messages` to every subscriber of `chat_id` (event loop only)."""
+        channel = self._channels.get(chat_id)
+        if channel is None:
+            return
+        for subscription in list(channel.subscribers):
+            for message in messages:
+                if not subscription._offer(message):
+                    self.dropped += 1
+                    channel.subscribers.discard(subscription)
+                    logger.info('Dropped slow subscriber of chat %s', chat_id)
+                    break
+        channel.delivered += len(messages)
+        if not channel.subscribers:
+            del self._channels[chat_id]
+            self._schedule_stop(chat_id, channel)
+
+    def stats(self) -> dict:
+        return {
+            'chats': len(self._channels),
+            'subscribers': sum(len(c.subscribers) for c in self._channels.values()),
+            'dropped': self.dropped,
+        }
+
+    async def close(self) -> None:
+        """End all subscriptions and wait until every upstream listener has stopped."""
+        channels, self._channels = self._channels, {}
+        for chat_id, channel in channels.items():
+            for subscription in channel.subscribers:
+                subscription._close()
+            self._schedule_stop(chat_id, channel)
+        if self._stopping:
+            await asyncio.wait(list(self._stopping.values()))
@@ -0,0 +1,139 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+`br` is used when the optional `brotli` package is installed and the client
+prefers it (at least as much as gzip); gzip otherwise. Only textual bodies
+(JSON, NDJSON, text/*) are compressed, and complete bodies only above
+`minimum_size` bytes. Streamed bodies (e.g. NDJSON) are compressed chunk by
+chunk with a flush after each one, so rows still reach the client as they are
+produced.
+"""
+
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def choose_encoding(accept_encoding: str, allow_brotli: bool = True) -> Optional[str]:
+    """'br', 'gzip' or None for an Accept-Encoding header value (q-values respected)."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+    wildcard = weights.get('*', 0.0)
+    gzip_q = weights.get('gzip', wildcard)
+    br_q = weights.get('br', wildcard) if allow_brotli and brotli is not None else 0.0
+    if br_q > 0 and br_q >= gzip_q:
+        return 'br'
+    if gzip_q > 0:
+        return 'gzip'
+    return None
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b'') -> bytes:
+        return self._z.compress(data) + self._z.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(quality=quality)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._c.process(data) + self._c.flush()
+
+    def finish(self, data: bytes = b'') -> bytes:
+        return self._c.process(data) + self._c.finish()
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware compressing eligible HTTP responses with gzip or brotli."""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _compressor(self, encoding: str):
+        return _Brotli(self.brotli_quality) if encoding == 'br' else _Gzip(self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                # held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more = message.get('more_body', False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start['headers'])
+                content_type = headers.get('content-type', '')
+                if ('content-encoding' in headers or start['status'] in (204, 304)
+                        or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or (not more and len(body) < self.minimum_size)):
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = self._compressor(encoding)
+                headers['Content-Encoding'] = encoding
+                headers.add_vary_header('Accept-Encoding')
+                if more:
+                    del headers['content-length']
+                    await send(start)
+                else:
+                    body = compressor.finish(body)
+                    headers['Content-Length'] = str(len(body))
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+            data = compressor.chunk(body) if more else compressor.finish(body)
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+
+        await self.app(scope, receive, send_wrapper)
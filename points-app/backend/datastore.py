@@ -0,0 +1,216 @@
+"""
+Data-access executor for the blocking Firestore / Firebase Admin clients.
+
+Every blocking call goes through `FirestoreExecutor.run`, which runs it on a
+dedicated thread pool instead of the event loop's default executor:
+
+- Calls are admitted per lane (e.g. 'auth', 'read', 'search'). Each lane has
+  its own concurrency limit, so a burst on one lane cannot take the threads
+  another lane needs, and a bounded wait queue; calls beyond it fail fast.
+- Each call has a deadline covering both queueing and execution, shortened to
+  what is left of the request deadline (see resilience.py).
+- An optional circuit breaker fails calls fast while the upstream is unhealthy.
+  Calls that time out while running, or raise an error `is_failure` accepts,
+  count against it.
+- `stats()` exposes in-flight and queued gauges plus rejection/timeout counters.
+- An optional `observer(lane, wait_seconds, run_seconds)` is called on the event
+  loop after every call: wait covers lane admission plus pick-up by a thread.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+import resilience
+
+_DEFAULT = object()
+
+
+class DatastoreOverloaded(HTTPException):
+    """The lane's wait queue is full; the client should retry shortly."""
+
+    def __init__(self, lane: str, retry_after: int = 1):
+        super().__init__(status_code=503, detail=f'Datastore busy ({lane}); retry shortly',
+                         headers={'Retry-After': str(retry_after)})
+
+
+class DatastoreTimeout(HTTPException):
+    def __init__(self, lane: str):
+        super().__init__(status_code=504, detail=f'Datastore call timed out ({lane})')
+
+
+class _CallTimeout(Exception):
+    """A call that was running when its timeout expired (counts against the breaker)."""
+
+    def __init__(self, error: DatastoreTimeout):
+        self.error = error
+
+
+class _Lane:
+    __slots__ = ('name', 'limit', 'semaphore', 'in_flight', 'queued', 'completed', 'rejected', 'timeouts')
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+
+def parse_lanes(spec: str) -> Dict[str, int]:
+    """Parse 'auth=8,read=16,search=8' into {'auth': 8, ...}."""
+    lanes = {}
+    for part in (spec or '').split(','):
+        name, sep, limit = part.strip().partition('=')
+        if sep and name:
+            lanes[name.strip()] = int(limit)
+    return lanes
+
+
+class FirestoreExecutor:
+    def __init__(self, lanes: Dict[str, int], max_queue: int = 256, default_timeout: Optional[float] = 10.0,
+                 default_lane: str = 'read', observer: Optional[Callable[[str, float, float], None]] = None,
+                 breaker: Optional[resilience.CircuitBreaker] = None,
+                 is_failure: Optional[Callable[[BaseException], bool]] = None):
+        if default_lane not in lanes:
+            lanes = {**lanes, default_lane: 8}
+        self.max_workers = sum(lanes.values())
+        self._pool = self._new_pool()
+        self._lanes = {name: _Lane(name, limit) for name, limit in lanes.items()}
+        self._loop = None
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.default_lane = default_lane
+        self.observer = observer
+        self.breaker = breaker
+        self.is_failure = is_failure
+
+    async def run(self, fn: Callable, *args, lane: Optional[str] = None, timeout=_DEFAULT, **kwargs):
+        """Run `fn(*args, **kwargs)` on the pool within `lane`.
+
+        `timeout` (seconds) defaults to the executor's default; pass None to wait
+        indefinitely (e.g. for long-lived streams). Finite timeouts are shortened
+        to the request deadline. Raises DatastoreOverloaded when the lane's queue
+        is full, DatastoreTimeout past the timeout, DeadlineExceeded past the
+        request deadline and CircuitOpen while the breaker is open.
+        """
+        if asyncio.get_running_loop() is not self._loop:
+            self._bind_loop()
+        state = self._lanes.get(lane or self.default_lane) or self._lanes[self.default_lane]
+        if timeout is _DEFAULT:
+            timeout = self.default_timeout
+        by_request = timeout is not None and resilience.deadline_is_binding(timeout)
+        if timeout is not None:
+            timeout = resilience.clip(timeout)
+        breaker = self.breaker
+        if breaker is not None:
+            breaker.allow()
+        try:
+            result = await self._run(state, timeout, by_request, fn, args, kwargs)
+        except _CallTimeout as exc:
+            if breaker is not None:
+                breaker.failure()
+            raise exc.error from None
+        except (HTTPException, asyncio.CancelledError):
+            # Rejected or abandoned locally: says nothing about the dependency.
+            if breaker is not None:
+                breaker.release()
+            raise
+        except Exception as exc:
+            if breaker is not None:
+                if self.is_failure is None or self.is_failure(exc):
+                    breaker.failure()
+                else:
+                    breaker.success()
+            raise
+        if breaker is not None:
+            breaker.success()
+        return result
+
+    async def _run(self, state: _Lane, timeout: Optional[float], by_request: bool, fn, args, kwargs):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        submitted = time.perf_counter()
+
+        if state.semaphore.locked():
+            if state.queued >= self.max_queue:
+                state.rejected += 1
+                raise DatastoreOverloaded(state.name)
+            state.queued += 1
+            try:
+                await asyncio.wait_for(state.semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                state.timeouts += 1
+                raise resilience.DeadlineExceeded() if by_request else DatastoreTimeout(state.name)
+            finally:
+                state.queued -= 1
+        else:
+            await state.semaphore.acquire()
+
+        state.in_flight += 1
+
+        started = [None]
+
+        def _call():
+            started[0] = time.perf_counter()
+            return fn(*args, **kwargs)
+
+        def _release(_):
+            # The slot is held until the thread is really done, even if the caller timed out,
+            # so abandoned calls still count against the lane.
+            state.in_flight -= 1
+            state.completed += 1
+            state.semaphore.release()
+            if self.observer is not None and started[0] is not None:
+                self.observer(state.name, started[0] - submitted, time.perf_counter() - started[0])
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, _call)
+        future.add_done_callback(_release)
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), remaining)
+        except asyncio.TimeoutError:
+            state.timeouts += 1
+            if by_request:
+                raise resilience.DeadlineExceeded()
+            raise _CallTimeout(DatastoreTimeout(state.name))
+
+    def _bind_loop(self):
+        # asyncio primitives belong to one event loop; a new loop (e.g. a fresh
+        # asyncio.run in a script) starts with fresh lanes.
+        self._loop = asyncio.get_running_loop()
+        self._lanes = {name: _Lane(name, s.limit) for name, s in self._lanes.items()}
+
+    def stats(self) -> dict:
+        return {
+            'max_workers': self.max_workers,
+            'lanes': {
+                name: {
+                    'limit': s.limit,
+                    'in_flight': s.in_flight,
+                    'queued': s.queued,
+                    'completed': s.completed,
+                    'rejected': s.rejected,
+                    'timeouts': s.timeouts,
+                }
+                for name, s in self._lanes.items()
+            },
+        }
+
+    def shutdown(self) -> None:
+        """Cancel queued calls and let the worker threads exit once their current call returns.
+
+        The executor stays usable: the replacement pool starts threads only when
+        called again, e.g. when the app is started again in the same process.
+        """
+        pool, self._pool = self._pool, self._new_pool()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _new_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='firestore')
@@ -0,0 +1,298 @@
+"""
+In-process spatial index of users' latest location points.
+
+Points are bucketed into a fixed grid of `cell_degrees` x `cell_degrees`
+cells (latitude x longitude), one set of uids per non-empty cell:
+
+- `within(bbox)` visits the cells overlapping the box.
+- `nearest(lat, lng, k)` visits rings of cells around the origin until it has
+  k points and no unvisited ring can hold a closer one, or it has seen every
+  point. Once the rings cost more than a scan of the candidates would (few
+  points, or all of them far away), it scans instead.
+
+Both take an optional `among` set of uids (the caller's friends). When that
+set is smaller than the work the grid would do, it is scanned directly
+instead, so a query costs O(min(points in the visited cells, len(among))).
+
+Every change takes the next value of a per-index version counter, so
+`changed_since(version, among)` returns what changed for those uids after a
+version, including removals (kept as bounded tombstones). Versions are only
+meaningful within one index instance, identified by `epoch`.
+
+The index is thread-safe: main.py feeds it from a Firestore on_snapshot
+listener thread while request handlers query and update it on the event loop.
+"""
+
+import heapq
+import math
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Collection, Iterable, List, NamedTuple, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class Point(NamedTuple):
+    uid: str
+    lat: float
+    lng: float
+    # Epoch seconds of the write, as set by the writer; newer writes win.
+    updated: float
+    # Index version of the last change to this point.
+    version: int
+    accuracy: Optional[float] = None
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _in_box(lat: float, lng: float, bbox: Tuple[float, float, float, float]) -> bool:
+    min_lat, min_lng, max_lat, max_lng = bbox
+    if not min_lat <= lat <= max_lat:
+        return False
+    if min_lng <= max_lng:
+        return min_lng <= lng <= max_lng
+    # crosses the antimeridian
+    return lng >= min_lng or lng <= max_lng
+
+
+class PointIndex:
+    def __init__(self, cell_degrees: float = 0.05, max_tombstones: int = 100000):
+        self.cell_degrees = cell_degrees
+        self.epoch = uuid.uuid4().hex[:8]
+        self._rows = math.ceil(180 / cell_degrees)
+        self._cols = math.ceil(360 / cell_degrees)
+        self._lock = threading.Lock()
+        self._points = {}
+        # cell key -> set of uids
+        self._cells = {}
+        self._version = 0
+        # uid -> version of its removal; versions up to _horizon may have lost theirs
+        self._tombstones = OrderedDict()
+        self._max_tombstones = max_tombstones
+        self._horizon = 0
+        self.ready = False
+
+    def __len__(self):
+        return len(self._points)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _row(self, lat: float) -> int:
+        return min(self._rows - 1, max(0, int((lat + 90) // self.cell_degrees)))
+
+    def _col(self, lng: float) -> int:
+        return int((lng + 180) // self.cell_degrees) % self._cols
+
+    def _cell(self, lat: float, lng: float) -> int:
+        return self._row(lat) * self._cols + self._col(lng)
+
+    def load(self, points: Iterable[Tuple[str, float, float, float, Optional[float]]]) -> None:
+        """Add (uid, lat, lng, updated, accuracy) rows (newer local points win) and mark the index ready."""
+        with self._lock:
+            for uid, lat, lng, updated, accuracy in points:
+                self._upsert_locked(uid, lat, lng, updated, accuracy)
+            # Loaded points are not tracked individually for clients polling from before the load.
+            self._horizon = self._version
+            self.ready = True
+
+    def upsert(self, uid: str, lat: float, lng: float, updated: float,
+               accuracy: Optional[float] = None) -> Optional[Point]:
+        """Store uid's point unless the stored one is at least as new; returns the new point or None."""
+        with self._lock:
+            return self._upsert_locked(uid, lat, lng, updated, accuracy)
+
+    def _upsert_locked(self, uid, lat, lng, updated, accuracy):
+        old = self._points.get(uid)
+        if old is not None:
+            if old.updated >= updated:
+                return None
+            old_cell = self._cell(old.lat, old.lng)
+        else:
+            old_cell = None
+            self._tombstones.pop(uid, None)
+        self._version += 1
+        point = Point(uid, lat, lng, updated, self._version, accuracy)
+        self._points[uid] = point
+        cell = self._cell(lat, lng)
+        if cell != old_cell:
+            if old_cell is not None:
+                self._discard_locked(old_cell, uid)
+            members = self._cells.get(cell)
+            if members is None:
+                self._cells[cell] = {uid}
+            else:
+                members.add(uid)
+        return point
+
+    def _discard_locked(self, cell, uid):
+        members = self._cells[cell]
+        members.discard(uid)
+        if not members:
+            del self._cells[cell]
+
+    def remove(self, uid: str, before: Optional[float] = None) -> bool:
+        """Remove uid's point (only if not updated after `before`, when given); returns whether it was removed."""
+        with self._lock:
+            old = self._points.get(uid)
+            if old is None or (before is not None and old.updated > before):
+                return False
+            del self._points[uid]
+            self._discard_locked(self._cell(old.lat, old.lng), uid)
+            self._version += 1
+            self._tombstones[uid] = self._version
+            while len(self._tombstones) > self._max_tombstones:
+                _, version = self._tombstones.popitem(last=False)
+                self._horizon = max(self._horizon, version)
+            return True
+
+    def get(self, uid: str) -> Optional[Point]:
+        return self._points.get(uid)
+
+    def _box_cells(self, bbox):
+        min_lat, min_lng, max_lat, max_lng = bbox
+        rows = range(self._row(min_lat), self._row(max_lat) + 1)
+        first = int((min_lng + 180) // self.cell_degrees)
+        last = int((max_lng + 180) // self.cell_degrees)
+        if min_lng > max_lng:
+            last += self._cols
+        cols = list(dict.fromkeys(col % self._cols for col in range(first, last + 1)))
+        return rows, cols
+
+    def within(self, bbox: Tuple[float, float, float, float], among: Optional[Collection[str]] = None) -> List[Point]:
+        """Points inside (min_lat, min_lng, max_lat, max_lng); min_lng > max_lng crosses the antimeridian."""
+        with self._lock:
+            rows, cols = self._box_cells(bbox)
+            n_cells = len(rows) * len(cols)
+            candidates = None
+            if among is None and n_cells > len(self._cells):
+                candidates = self._points.keys()
+            elif among is not None and n_cells >= len(among):
+                candidates = among
+            else:
+                cells = [self._cells.get(row * self._cols + col) for row in rows for col in cols]
+                cells = [c for c in cells if c]
+                if among is not None and sum(len(c) for c in cells) > len(among):
+                    candidates = among
+                else:
+                    found = []
+                    for members in cells:
+                        for uid in members:
+                            if among is not None and uid not in among:
+                                continue
+                            point = self._points[uid]
+                            if _in_box(point.lat, point.lng, bbox):
+                                found.append(point)
+                    return found
+            points = self._points
+            return [p for p in (points.get(uid) for uid in candidates)
+                    if p is not None and _in_box(p.lat, p.lng, bbox)]
+
+    def nearest(self, lat: float, lng: float, k: int, among: Optional[Collection[str]] = None,
+                max_km: Optional[float] = None) -> List[Tuple[float, Point]]:
+        """Up to k (distance_km, point) pairs closest to (lat, lng), nearest first."""
+        if k <= 0:
+            return []
+        with self._lock:
+            candidates = self._points.keys() if among is None else among
+            # Ring search until it has visited as many points as a scan of the candidates would.
+            result = self._ring_search(lat, lng, k, among, max_km, budget=len(candidates))
+            if result is not None:
+                return result
+            pairs = []
+            for uid in candidates:
+                point = self._points.get(uid)
+                if point is not None:
+                    distance = haversine_km(lat, lng, point.lat, point.lng)
+                    if max_km is None or distance <= max_km:
+                        pairs.append((distance, point))
+            return heapq.nsmallest(k, pairs, key=lambda pair: pair[0])
+
+    def _ring_search(self, lat, lng, k, among, max_km, budget):
+        row0, col0 = self._row(lat), self._col(lng)
+        cell_km = self.cell_degrees * _KM_PER_DEGREE
+        # max-heap of the best k as (-distance, uid)
+        best = []
+        visited = seen = 0
+        max_ring = max(self._rows, self._cols // 2)
+        for ring in range(max_ring + 1):
+            for row, col in self._ring_cells(row0, col0, ring):
+                members = self._cells.get(row * self._cols + col)
+                # cost: one per cell probed plus one per point in it
+                visited += 1 + len(members) if members else 1
+                if budget is not None and visited > budget:
+                    return None
+                if not members:
+                    continue
+                seen += len(members)
+                for uid in members:
+                    if among is not None and uid not in among:
+                        continue
+                    point = self._points[uid]
+                    distance = haversine_km(lat, lng, point.lat, point.lng)
+                    if max_km is not None and distance > max_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, uid))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, uid))
+            # Anything beyond this ring is at least `ring` cells away along one axis; east-west
+            # cells shrink with latitude, so bound with the highest latitude the next ring reaches.
+            extreme = min(90.0, abs(lat) + (ring + 1) * self.cell_degrees)
+            bound = ring * cell_km * math.cos(math.radians(extreme))
+            if (len(best) == k and bound >= -best[0][0]) or (max_km is not None and bound > max_km) \
+                    or seen == len(self._points):
+                break
+        pairs = sorted((-negative, uid) for negative, uid in best)
+        return [(distance, self._points[uid]) for distance, uid in pairs]
+
+    def _ring_cells(self, row0, col0, ring):
+        if ring == 0:
+            yield row0, col0
+            return
+        cols = [(col0 + offset) % self._cols for offset in range(-ring, ring + 1)]
+        if 2 * ring + 1 > self._cols:
+            cols = sorted(set(cols))
+        for row in (row0 - ring, row0 + ring):
+            if 0 <= row < self._rows:
+                for col in cols:
+                    yield row, col
+        for row in range(max(0, row0 - ring + 1), min(self._rows, row0 + ring)):
+            yield row, (col0 - ring) % self._cols
+            if ring * 2 < self._cols:
+                yield row, (col0 + ring) % self._cols
+
+    def changed_since(self, version: int, among: Collection[str],
+                      bbox: Optional[Tuple[float, float, float, float]] = None
+                      ) -> Optional[Tuple[List[Point], List[str]]]:
+        """(changed points, removed uids) among `among` after `version`; None if that is too old to tell.
+
+        With `bbox`, changed points now outside it are reported as removed.
+        """
+        with self._lock:
+            if version < self._horizon or version > self._version:
+                return None
+            changed, removed = [], []
+            for uid in among:
+                point = self._points.get(uid)
+                if point is not None:
+                    if point.version > version:
+                        if bbox is None or _in_box(point.lat, point.lng, bbox):
+                            changed.append(point)
+                        else:
+                            removed.append(uid)
+                elif self._tombstones.get(uid, 0) > version:
+                    removed.append(uid)
+            return changed, removed
+
+    def stats(self) -> dict:
+        return {'points': len(self._points), 'cells': len(self._cells), 'version': self._version,
+                'tombstones': len(self._tombstones)}
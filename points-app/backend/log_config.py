@@ -0,0 +1,113 @@
+"""
+Logging setup for the backend.
+
+Two modes, selected with LOG_MODE:
+- dev (default): plain text written synchronously to stderr, like basicConfig.
+- production: JSON lines; request threads only enqueue records on a
+  QueueHandler and a QueueListener thread does the formatting and I/O.
+
+Debug traces on hot paths are additionally sampled per route (see DebugSampler)
+and headers are passed through `redact_headers` before being logged.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from typing import Mapping, Optional
+
+_REDACTED_HEADERS = frozenset({'authorization', 'auth-header', 'cookie', 'set-cookie', 'proxy-authorization'})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the fields our log pipeline indexes."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = 'DEBUG', mode: str = 'dev') -> Optional[logging.handlers.QueueListener]:
+    """Configure the root logger. Returns the QueueListener in production mode."""
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    stream = logging.StreamHandler()
+    if mode != 'production':
+        stream.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(stream)
+        return None
+
+    stream.setFormatter(JsonFormatter())
+    # httpx logs every upstream request URL at INFO, and Identity Toolkit URLs carry the API key.
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    records = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(records))
+    listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def redact_headers(headers: Mapping[str, str]) -> dict:
+    """Copy `headers` with credentials replaced, for debug logging."""
+    return {k: ('[REDACTED]' if k.lower() in _REDACTED_HEADERS else v) for k, v in headers.items()}
+
+
+def redact_credential(value: Optional[str]) -> Optional[str]:
+    """Keep only the auth scheme and length of an Authorization value."""
+    if not value:
+        return value
+    scheme = value.split(None, 1)[0] if ' ' in value.strip() else ''
+    return f'{scheme} [REDACTED len={len(value)}]'.strip()
+
+
+def route_template(scope) -> str:
+    """The matched route's path template for an ASGI scope, or 'unmatched'.
+
+    Keyed like the metrics labels, so per-route settings match templated
+    routes and the set of keys stays bounded whatever paths clients send.
+    """
+    return getattr(scope.get('route'), 'path_format', None) or 'unmatched'
+
+
+class DebugSampler:
+    """Decides whether a request's debug trace should be emitted.
+
+    `rates` maps a route template (as declared, e.g. /users/{uid}; see
+    `route_template`) to a probability in [0, 1]; routes not listed use
+    `default_rate`. The logger level is checked first so nothing is sampled (or
+    formatted) when DEBUG is off.
+    """
+
+    def __init__(self, logger: logging.Logger, default_rate: float = 1.0, rates: Optional[Mapping[str, float]] = None):
+        self.logger = logger
+        self.default_rate = default_rate
+        self.rates = dict(rates or {})
+
+    @classmethod
+    def from_spec(cls, logger: logging.Logger, default_rate: float, spec: str) -> 'DebugSampler':
+        """Parse a spec like '/friend_requests=0.1,/users/search=0'."""
+        rates = {}
+        for part in (spec or '').split(','):
+            route, sep, rate = part.strip().partition('=')
+            if sep and route:
+                rates[route.strip()] = float(rate)
+        return cls(logger, default_rate, rates)
+
+    def __call__(self, route: str) -> bool:
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        rate = self.rates.get(route, self.default_rate)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
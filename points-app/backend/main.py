@@ -9,32 +9,436 @@ Notes:
 - This implementation is intentionally minimal for the checkpoint.
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Header, status, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, EmailStr, constr, validator
-from typing import Optional
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, EmailStr, ValidationError, confloat, constr, validator
+from contextlib import asynccontextmanager
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, NamedTuple, Optional
+import asyncio
+import base64
+import codecs
+import collections
+import csv
+import hashlib
+import importlib
+import json
 import os
+import resilience
 import httpx
 import jwt
 import secrets
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
-import firebase_admin
-from firebase_admin import credentials, firestore
+from cache import ReadThroughCache, SingleFlight, TTLCache
+from chat_hub import ChatHub
+from compression import CompressionMiddleware
+from datastore import FirestoreExecutor, parse_lanes
+from geo_index import PointIndex
+from metrics import DependencyMetrics, MetricsMiddleware, Registry
+from resilience import CircuitBreaker, DeadlineExceeded, DeadlineMiddleware, hedged, without_deadline
+from search_index import UserSearchIndex
+from log_config import DebugSampler, configure_logging, redact_credential, redact_headers, route_template
+from token_store import RefreshEntry, create_token_store
 
 load_dotenv()
 
+
+class _LazyModule:
+    """Placeholder for a Firebase Admin module until `_load_firebase_modules` has run.
+
+    Importing the Admin SDK pulls in gRPC and the Firestore client, which is most
+    of the import time of this module, so it happens in the lifespan instead.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        _load_firebase_modules()
+        return getattr(importlib.import_module(self._name), attr)
+
+
+firebase_admin = _LazyModule('firebase_admin')
+auth = _LazyModule('firebase_admin.auth')
+credentials = _LazyModule('firebase_admin.credentials')
+firestore = _LazyModule('firebase_admin.firestore')
+
+
+def _load_firebase_modules() -> None:
+    """Import the Admin SDK and bind the real modules in place of the placeholders."""
+    global firebase_admin, auth, credentials, firestore
+    if not isinstance(firestore, _LazyModule):
+        return
+    import firebase_admin as admin_module
+    from firebase_admin import auth as auth_module, credentials as credentials_module, firestore as firestore_module
+    firebase_admin, auth, credentials, firestore = admin_module, auth_module, credentials_module, firestore_module
+
 WEB_API_KEY = os.getenv('FIREBASE_WEB_API_KEY')
 JWT_SECRET = os.getenv('JWT_SECRET', 'change-me')
 
-app = FastAPI(title='Points Auth Backend')
-
-logging.basicConfig(level=logging.DEBUG)
+IDENTITY_TOOLKIT_URL = os.getenv('IDENTITY_TOOLKIT_URL', 'https://identitytoolkit.googleapis.com/v1')
+
+# Upstream HTTP client pool settings. A single client is shared by every
+# Identity Toolkit call so connections (and TLS sessions) are reused.
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+HTTP_WRITE_TIMEOUT = float(os.getenv('HTTP_WRITE_TIMEOUT', '5'))
+HTTP_POOL_TIMEOUT = float(os.getenv('HTTP_POOL_TIMEOUT', '2'))
+HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', '0').lower() in ('1', 'true', 'yes')
+
+# Upper bound for each lifespan warm-up step (Identity Toolkit connection, first Firestore read)
+STARTUP_WARMUP_TIMEOUT = float(os.getenv('STARTUP_WARMUP_TIMEOUT', '5'))
+
+# Refresh-token store: 'memory' (single process) or 'sqlite' (shared by all workers on a host).
+TOKEN_STORE = os.getenv('TOKEN_STORE', 'memory')
+TOKEN_STORE_PATH = os.getenv('TOKEN_STORE_PATH', os.path.join(os.path.dirname(__file__), 'tokens.sqlite3'))
+TOKEN_SWEEP_INTERVAL = float(os.getenv('TOKEN_SWEEP_INTERVAL', '60'))
+
+# Access-token verification. JWT_LEEWAY (seconds) allows for clock skew in dev;
+# JWT_DEBUG_DIAGNOSTICS logs unverified claims of every uncached token.
+try:
+    JWT_LEEWAY = int(os.getenv('JWT_LEEWAY', '0'))
+except ValueError:
+    JWT_LEEWAY = 0
+JWT_DEBUG_DIAGNOSTICS = os.getenv('JWT_DEBUG_DIAGNOSTICS', '0').lower() in ('1', 'true', 'yes')
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+
+# users/{uid} profile cache: size, TTL for found profiles and for missing users (seconds)
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', '60'))
+PROFILE_NEGATIVE_TTL = float(os.getenv('PROFILE_NEGATIVE_TTL', '10'))
+
+# POST /users:batchGet: max uids per call, and uids per Firestore get_all round trip
+BATCH_GET_MAX_UIDS = int(os.getenv('BATCH_GET_MAX_UIDS', '300'))
+BATCH_GET_CHUNK_SIZE = int(os.getenv('BATCH_GET_CHUNK_SIZE', '100'))
+
+# POST /friend_requests:batchCreate: max receivers per call
+FRIEND_REQUEST_BULK_MAX = int(os.getenv('FRIEND_REQUEST_BULK_MAX', '100'))
+
+# friend_inboxes/{uid}: request summaries kept per user; GET /me/friend_requests page size
+FRIEND_INBOX_RECENT = int(os.getenv('FRIEND_INBOX_RECENT', '20'))
+FRIEND_REQUESTS_DEFAULT_LIMIT = int(os.getenv('FRIEND_REQUESTS_DEFAULT_LIMIT', '20'))
+FRIEND_REQUESTS_MAX_LIMIT = int(os.getenv('FRIEND_REQUESTS_MAX_LIMIT', '100'))
+
+# GET /me/friends: per-user cache of the friend_lists adjacency document
+FRIENDS_CACHE_SIZE = int(os.getenv('FRIENDS_CACHE_SIZE', '10000'))
+FRIENDS_CACHE_TTL = float(os.getenv('FRIENDS_CACHE_TTL', '30'))
+
+# Location points (PUT /me/point, GET /me/friends/points): grid cell size in degrees of the in-memory
+# index. Writes are coalesced per user and flushed to Firestore every POINT_FLUSH_INTERVAL seconds,
+# or as soon as POINT_FLUSH_BATCH users are pending (one WriteBatch commit each)
+POINT_CELL_DEGREES = float(os.getenv('POINT_CELL_DEGREES', '0.05'))
+POINT_FLUSH_INTERVAL = float(os.getenv('POINT_FLUSH_INTERVAL', '1'))
+POINT_FLUSH_BATCH = min(int(os.getenv('POINT_FLUSH_BATCH', '500')), 500)
+# Removals remembered for delta responses; polls older than the oldest one get a full response
+POINT_TOMBSTONES = int(os.getenv('POINT_TOMBSTONES', '100000'))
+POINT_NEAREST_DEFAULT_K = int(os.getenv('POINT_NEAREST_DEFAULT_K', '10'))
+POINT_NEAREST_MAX_K = int(os.getenv('POINT_NEAREST_MAX_K', '100'))
+
+# Response compression (gzip, or brotli when the package is installed) for bodies of at least COMPRESSION_MIN_SIZE bytes
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+
+# POST /admin/users:bulkImport. ADMIN_UIDS is a comma-separated allow-list of admin uids.
+ADMIN_UIDS = frozenset(uid.strip() for uid in os.getenv('ADMIN_UIDS', '').split(',') if uid.strip())
+BULK_IMPORT_CONCURRENCY = int(os.getenv('BULK_IMPORT_CONCURRENCY', '32'))
+# profiles per WriteBatch commit (Firestore allows at most 500 writes per batch)
+BULK_IMPORT_BATCH_SIZE = min(int(os.getenv('BULK_IMPORT_BATCH_SIZE', '500')), 500)
+BULK_IMPORT_MAX_ROWS = int(os.getenv('BULK_IMPORT_MAX_ROWS', '100000'))
+# result lines queued for a client that reads the response slower than the import produces it
+BULK_IMPORT_RESULT_BUFFER = int(os.getenv('BULK_IMPORT_RESULT_BUFFER', '1000'))
+
+# GET /me/chats: page size, per-user inbox cache and last-message fan-out per request
+CHAT_INBOX_DEFAULT_LIMIT = int(os.getenv('CHAT_INBOX_DEFAULT_LIMIT', '50'))
+CHAT_INBOX_MAX_LIMIT = int(os.getenv('CHAT_INBOX_MAX_LIMIT', '200'))
+CHAT_INBOX_CACHE_SIZE = int(os.getenv('CHAT_INBOX_CACHE_SIZE', '1000'))
+CHAT_INBOX_CACHE_TTL = float(os.getenv('CHAT_INBOX_CACHE_TTL', '15'))
+CHAT_INBOX_FANOUT = int(os.getenv('CHAT_INBOX_FANOUT', '8'))
+
+# GET /chats/{id}/messages page size; messages buffered per WebSocket before the client is dropped
+CHAT_HISTORY_DEFAULT_LIMIT = int(os.getenv('CHAT_HISTORY_DEFAULT_LIMIT', '50'))
+CHAT_HISTORY_MAX_LIMIT = int(os.getenv('CHAT_HISTORY_MAX_LIMIT', '200'))
+CHAT_WS_BUFFER = int(os.getenv('CHAT_WS_BUFFER', '100'))
+
+# /users/search: in-process prefix index fed by a Firestore listener on `users`
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', '1').lower() in ('1', 'true', 'yes')
+SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', '50'))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+# Identical concurrent Firestore-backed searches share one query; results are reused for this long (0 = only coalesce)
+SEARCH_COALESCE_TTL = float(os.getenv('SEARCH_COALESCE_TTL', '1'))
+
+# Dedicated pool for blocking Firestore / Admin SDK calls. Each lane gets its own
+# share of the threads (pool size = sum of lanes) and a bounded wait queue, so a
+# burst of search traffic cannot starve registration or profile reads.
+FIRESTORE_LANES = parse_lanes(os.getenv('FIRESTORE_LANES', 'auth=4,read=16,write=8,search=8'))
+FIRESTORE_MAX_QUEUE = int(os.getenv('FIRESTORE_MAX_QUEUE', '256'))
+FIRESTORE_TIMEOUT = float(os.getenv('FIRESTORE_TIMEOUT', '10'))
+
+# Max documents buffered between a Firestore stream's worker thread and the event loop
+FIRESTORE_STREAM_BUFFER = int(os.getenv('FIRESTORE_STREAM_BUFFER', '64'))
+
+# Time budget of one HTTP request for all of its upstream calls (clients may ask for less
+# with X-Request-Timeout, in seconds); 0 disables the deadline
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', '10'))
+# Idempotent Firestore reads start a second copy after this many seconds without an answer; 0 disables.
+# Off by default: each hedge is another billed read.
+FIRESTORE_HEDGE_DELAY = float(os.getenv('FIRESTORE_HEDGE_DELAY', '0'))
+# Per-dependency circuit breakers: open after this many consecutive failures (0 disables) and
+# fail fast with 503 + Retry-After for BREAKER_RESET_TIMEOUT seconds before probing again
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '10'))
+
+# IMPORTANT: iat validation is disabled because some tokens (e.g. Firebase-issued)
+# may have 'iat' values that are slightly in the future due to clock skew
+# between issuer and validator. We still validate 'exp' (expiry) and 'nbf'
+# (not-before) if present.
+_JWT_DECODE_OPTIONS = {
+    'verify_signature': True,
+    'verify_exp': True,
+    'verify_nbf': True,
+    # Turn off iat verification to avoid ImmatureSignatureError
+    'verify_iat': False,
+}
+
+# Logging: LOG_MODE=dev|production, LOG_LEVEL (defaults to DEBUG in dev, INFO in production).
+# LOG_DEBUG_SAMPLE_RATE / LOG_DEBUG_SAMPLE_ROUTES control how many requests emit
+# their hot-path debug traces, e.g. LOG_DEBUG_SAMPLE_ROUTES=/friend_requests=0.1
+LOG_MODE = os.getenv('LOG_MODE', 'dev').lower()
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO' if LOG_MODE == 'production' else 'DEBUG').upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.01' if LOG_MODE == 'production' else '1'))
+
+configure_logging(LOG_LEVEL, LOG_MODE)
 logger = logging.getLogger('main')
-logger.setLevel(logging.DEBUG)
+_debug_sampled = DebugSampler.from_spec(logger, LOG_DEBUG_SAMPLE_RATE, os.getenv('LOG_DEBUG_SAMPLE_ROUTES', ''))
+
+_http_client: Optional[httpx.AsyncClient] = None
+# Set by the lifespan warm-up; reported by /ready
+_ready = False
+_token_store = create_token_store(TOKEN_STORE, TOKEN_STORE_PATH)
+# Blocking stores (SQLite) are called from their own small pool, never on the event loop
+_token_store_pool = (ThreadPoolExecutor(max_workers=2, thread_name_prefix='token-store')
+                     if _token_store.blocking else None)
+
+# Metrics exposed on /metrics. Upstream calls are timed explicitly at their call sites
+# (_upstream.time); executor wait/run time comes from the datastore observer.
+_metrics = Registry()
+_upstream = DependencyMetrics(_metrics)
+_datastore_wait = _metrics.histogram('datastore_wait_seconds',
+                                     'Time Firestore calls spent waiting for a lane slot and a thread.', ('lane',))
+_datastore_run = _metrics.histogram('datastore_call_duration_seconds',
+                                    'Time Firestore calls spent running on the executor.', ('lane',))
+_jwt_decode = _metrics.histogram('jwt_decode_duration_seconds', 'Access-token signature verification time (cache misses).')
+
+
+def _observe_datastore(lane: str, wait: float, run: float) -> None:
+    _datastore_wait.observe(wait, lane)
+    _datastore_run.observe(run, lane)
+
+
+def _is_upstream_failure(exc: BaseException) -> bool:
+    """Whether a Firestore / Admin SDK error means the service is unhealthy (5xx, network), not a bad call."""
+    code = getattr(exc, 'code', None)
+    return (isinstance(code, int) and code >= 500) or isinstance(exc, (ConnectionError, TimeoutError)) \
+        or type(exc).__name__ == 'RetryError'
+
+
+_breakers = {
+    'firestore': CircuitBreaker('Firestore', BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT),
+    'identity_toolkit': CircuitBreaker('Identity Toolkit', BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT),
+}
+# Every Admin SDK call (Firestore, plus the rare Auth rollback) goes through this pool and its breaker.
+_datastore = FirestoreExecutor(FIRESTORE_LANES, FIRESTORE_MAX_QUEUE, FIRESTORE_TIMEOUT, observer=_observe_datastore,
+                               breaker=_breakers['firestore'], is_failure=_is_upstream_failure)
+# sha256(token) -> verified claims, expiring at the token's exp
+_verified_token_cache = TTLCache(TOKEN_CACHE_SIZE)
+
+
+def _build_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Create the shared upstream client using the configured pool limits.
+
+    `transport` is only used to plug in a stand-in (e.g. httpx.MockTransport) for local runs.
+    """
+    http2 = HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning('HTTP2_ENABLED is set but the h2 package is not installed; using HTTP/1.1')
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=HTTP_CONNECT_TIMEOUT,
+        read=HTTP_READ_TIMEOUT,
+        write=HTTP_WRITE_TIMEOUT,
+        pool=HTTP_POOL_TIMEOUT,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2, transport=transport)
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it if the lifespan hook has not run (e.g. in scripts)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+async def _token_store_call(fn, *args):
+    """Call a _token_store method; off the event loop when the store blocks."""
+    if _token_store_pool is None:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(_token_store_pool, fn, *args)
+
+
+def _close_token_store() -> None:
+    """Wait for in-flight token-store calls, then close the store (on shutdown; blocking)."""
+    if _token_store_pool is not None:
+        _token_store_pool.shutdown()
+    _token_store.close()
+
+
+async def _sweep_tokens_periodically():
+    """Evict expired refresh tokens and revocation markers so the store does not grow without bound."""
+    while True:
+        await asyncio.sleep(TOKEN_SWEEP_INTERVAL)
+        try:
+            removed = await _token_store_call(_token_store.sweep, int(datetime.utcnow().timestamp()))
+            if removed:
+                logger.debug('Token sweeper removed %s expired entries', removed)
+        except Exception:
+            logger.exception('Token sweep failed')
+
+
+async def _warm_up() -> None:
+    """Open upstream connections before traffic arrives, then mark the worker ready.
+
+    Failures are logged and do not block readiness: they only mean the first
+    real request pays for the connection.
+    """
+    global _ready
+    loop = asyncio.get_running_loop()
+    steps = {'firebase_modules': loop.run_in_executor(None, _load_firebase_modules)}
+    if WEB_API_KEY:
+        # Any response will do: the point is a pooled, TLS-established connection.
+        steps['identity_toolkit'] = _get_http_client().head(IDENTITY_TOOLKIT_URL)
+    if _firebase_initialized and _firestore_client is not None:
+        steps['firestore'] = _datastore.run(lambda: _firestore_client.collection('users').limit(1).get(), lane='read')
+    started = loop.time()
+    results = await asyncio.gather(
+        *(asyncio.wait_for(step, STARTUP_WARMUP_TIMEOUT) for step in steps.values()), return_exceptions=True)
+    for name, result in zip(steps, results):
+        if isinstance(result, BaseException):
+            logger.warning('Warm-up of %s failed: %r', name, result)
+    _start_search_index()
+    _start_point_index()
+    _ready = True
+    logger.info('Worker ready (warm-up took %.0f ms)', (loop.time() - started) * 1000)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _http_client
+    # The Admin SDK import/initialization and the HTTP client (TLS context) are independent; build both at once.
+    loop = asyncio.get_running_loop()
+    _http_client, _ = await asyncio.gather(
+        loop.run_in_executor(None, _build_http_client),
+        loop.run_in_executor(None, _init_firebase),
+    )
+    logger.info('Upstream HTTP client ready (max_connections=%s, max_keepalive=%s)',
+                HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE)
+    sweeper = asyncio.create_task(_sweep_tokens_periodically())
+    point_flusher = asyncio.create_task(_flush_points_periodically())
+    warm_up = asyncio.create_task(_warm_up())
+    try:
+        yield
+    finally:
+        global _ready
+        _ready = False
+        warm_up.cancel()
+        sweeper.cancel()
+        point_flusher.cancel()
+        _stop_search_index()
+        _stop_point_index()
+        try:
+            await asyncio.wait_for(_point_writer.close(), FIRESTORE_TIMEOUT)
+        except Exception:
+            logger.exception('Failed to flush buffered points on shutdown')
+        try:
+            await asyncio.wait_for(_chat_hub.close(), FIRESTORE_TIMEOUT)
+        except Exception:
+            logger.exception('Failed to stop chat listeners on shutdown')
+        client, _http_client = _http_client, None
+        if client is not None:
+            await client.aclose()
+        logger.info('Upstream HTTP client closed')
+        try:
+            await loop.run_in_executor(None, _close_token_store)
+        except Exception:
+            logger.exception('Failed to close the token store')
+        # Last: the steps above may still need Firestore calls.
+        _datastore.shutdown()
+
+
+async def _identity_toolkit_post(method: str, payload: dict) -> httpx.Response:
+    """POST to an Identity Toolkit `accounts:<method>` endpoint over the shared client.
+
+    Bounded by the request deadline and guarded by the Identity Toolkit breaker:
+    transport errors and 5xx responses count as failures.
+    """
+    url = f'{IDENTITY_TOOLKIT_URL}/accounts:{method}'
+    budget = resilience.clip(None)
+    breaker = _breakers['identity_toolkit']
+    breaker.allow()
+    try:
+        with _upstream.time('identity_toolkit', method) as timing:
+            post = _get_http_client().post(url, params={'key': WEB_API_KEY}, json=payload)
+            resp = await (post if budget is None else asyncio.wait_for(post, budget))
+            if resp.status_code >= 500:
+                timing.fail()
+    except asyncio.TimeoutError:
+        breaker.release()
+        raise DeadlineExceeded() from None
+    except httpx.TransportError:
+        breaker.failure()
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    if resp.status_code >= 500:
+        breaker.failure()
+    else:
+        breaker.success()
+    return resp
+
+
+def _firestore_read(fn, *args):
+    """Run an idempotent Firestore read on the read lane, hedged after FIRESTORE_HEDGE_DELAY when enabled."""
+    return hedged(lambda: _datastore.run(fn, *args, lane='read'), FIRESTORE_HEDGE_DELAY)
+
+
+async def _timed(dependency: str, operation: str, awaitable):
+    """Await `awaitable`, recording it as an upstream call (for use inside asyncio.gather)."""
+    with _upstream.time(dependency, operation):
+        return await awaitable
+
+
+app = FastAPI(title='Points Auth Backend', lifespan=lifespan)
 
 # Configure CORS to allow preflight requests from the Flutter client during development.
 # You can set a comma-separated list of origins in the environment variable CORS_ORIGINS.
@@ -52,6 +456,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_level=COMPRESSION_GZIP_LEVEL,
+                   brotli_quality=COMPRESSION_BROTLI_QUALITY)
+app.add_middleware(DeadlineMiddleware, default_timeout=REQUEST_TIMEOUT)
+app.add_middleware(MetricsMiddleware, registry=_metrics)
 
 class LoginRequest(BaseModel):
     email: EmailStr
@@ -68,11 +476,130 @@ class RegisterRequest(BaseModel):
         return v.strip()
 
 
+class ImportRow(BaseModel):
+    """One bulkImport row: the /register fields, with accountName optional."""
+    email: EmailStr
+    password: constr(min_length=1)
+    accountName: Optional[constr(min_length=3, max_length=30)] = None
+
+    @validator('accountName')
+    def strip_account_name(cls, v: Optional[str]) -> Optional[str]:
+        return v.strip() if v is not None else v
+
+
 class FriendRequestCreate(BaseModel):
     senderId: str
     receiverId: str
 
 
+class FriendRequestBulkCreate(BaseModel):
+    senderId: str
+    receiverIds: List[str]
+
+
+class DirectChatCreate(BaseModel):
+    peerId: str
+
+
+class ChatMessageCreate(BaseModel):
+    text: str
+
+
+class BatchGetUsersRequest(BaseModel):
+    uids: List[str]
+
+
+# Response models. Routes declaring one are serialized straight to JSON bytes by pydantic-core.
+
+class UserResponse(BaseModel):
+    uid: str
+    email: Optional[str] = None
+    accountName: Optional[str] = None
+
+
+class UserSearchResult(BaseModel):
+    userId: str
+    accountName: Optional[str] = None
+    email: Optional[str] = None
+
+
+class BatchGetUsersResponse(BaseModel):
+    users: Dict[str, UserResponse]
+    notFound: List[str]
+
+
+class FriendRequestCreated(BaseModel):
+    message: str
+    requestId: str
+
+
+class FriendRequestBulkResult(BaseModel):
+    receiverId: str
+    status: str
+    requestId: Optional[str] = None
+
+
+class FriendRequestBulkResponse(BaseModel):
+    results: List[FriendRequestBulkResult]
+
+
+class FriendRequestResponded(BaseModel):
+    requestId: str
+    status: str
+
+
+class FriendRequestSummary(BaseModel):
+    id: str
+    senderId: Optional[str] = None
+    receiverId: Optional[str] = None
+    status: Optional[str] = None
+    createdAt: Optional[str] = None
+    senderDisplayName: Optional[str] = None
+    senderEmail: Optional[str] = None
+    receiverDisplayName: Optional[str] = None
+    receiverEmail: Optional[str] = None
+
+
+class FriendRequestCounts(BaseModel):
+    pending: int
+    sent: int
+    accepted: int
+
+
+class FriendRequestsPage(BaseModel):
+    counts: FriendRequestCounts
+    requests: List[FriendRequestSummary]
+
+
+class FriendResponse(BaseModel):
+    uid: str
+    accountName: Optional[str] = None
+    email: Optional[str] = None
+    since: Optional[str] = None
+
+
+class PointUpdate(BaseModel):
+    lat: confloat(ge=-90, le=90)
+    lng: confloat(ge=-180, le=180)
+    accuracy: Optional[confloat(ge=0)] = None
+
+
+class PointResponse(BaseModel):
+    uid: str
+    lat: float
+    lng: float
+    accuracy: Optional[float] = None
+    updatedAt: str
+    distanceKm: Optional[float] = None
+
+
+class PointsPage(BaseModel):
+    version: str
+    full: bool
+    points: List[PointResponse]
+    removed: List[str]
+
+
 @app.post('/login')
 async def login(req: LoginRequest):
     """Authenticate with Firebase REST API and return our own JWT on success."""
@@ -80,15 +607,13 @@ async def login(req: LoginRequest):
         logger.error('FIREBASE_WEB_API_KEY not configured')
         raise HTTPException(status_code=500, detail='FIREBASE_WEB_API_KEY not configured')
 
-    firebase_url = f'https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={WEB_API_KEY}'
     req_payload = {'email': req.email, 'password': req.password, 'returnSecureToken': True}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(firebase_url, json=req_payload, timeout=10.0)
-        except httpx.RequestError as e:
-            logger.exception('Error contacting Firebase')
-            raise HTTPException(status_code=502, detail=f'Error contacting Firebase: {e}')
+    try:
+        resp = await _identity_toolkit_post('signInWithPassword', req_payload)
+    except httpx.RequestError as e:
+        logger.exception('Error contacting Firebase')
+        raise HTTPException(status_code=502, detail=f'Error contacting Firebase: {e}')
 
     # Handle non-200 responses from Firebase
     if resp.status_code != 200:
@@ -113,13 +638,8 @@ async def login(req: LoginRequest):
         logger.error('Missing uid/email in Firebase response: %s', data)
         raise HTTPException(status_code=500, detail='Invalid response from Firebase')
 
-    now = datetime.utcnow()
-    token_payload = {
-        'sub': uid,
-        'email': email,
-        'iat': int(now.timestamp()),
-        'exp': int((now + timedelta(hours=1)).timestamp())
-    }
+    generation = await _token_store_call(_token_store.generation, uid)
+    token_payload = _access_token_claims(uid, email, generation)
 
     try:
         token = jwt.encode(token_payload, JWT_SECRET, algorithm='HS256')
@@ -130,7 +650,7 @@ async def login(req: LoginRequest):
         raise HTTPException(status_code=500, detail='Failed to create access token')
 
     # Issue a refresh token and store it (preserve accountName if present)
-    refresh = _create_refresh_token(uid, email, account_name)
+    refresh = await _create_refresh_token(uid, email, account_name, generation=generation)
 
     return {
         'access_token': token,
@@ -152,15 +672,13 @@ async def register(req: RegisterRequest):
         logger.error('FIREBASE_WEB_API_KEY not configured')
         raise HTTPException(status_code=500, detail='FIREBASE_WEB_API_KEY not configured')
 
-    firebase_url = f'https://identitytoolkit.googleapis.com/v1/accounts:signUp?key={WEB_API_KEY}'
     payload = {'email': req.email, 'password': req.password, 'returnSecureToken': True}
 
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.post(firebase_url, json=payload, timeout=10.0)
-        except httpx.RequestError as e:
-            logger.exception('Error contacting Firebase for register')
-            raise HTTPException(status_code=502, detail=f'Error contacting Firebase: {e}')
+    try:
+        resp = await _identity_toolkit_post('signUp', payload)
+    except httpx.RequestError as e:
+        logger.exception('Error contacting Firebase for register')
+        raise HTTPException(status_code=502, detail=f'Error contacting Firebase: {e}')
 
     if resp.status_code != 200:
         try:
@@ -183,28 +701,36 @@ async def register(req: RegisterRequest):
         logger.error('Firestore not initialized; cannot persist user')
         # Attempt to delete the created Firebase user to avoid inconsistent state
         try:
-            firebase_admin.auth.delete_user(uid)
+            with _upstream.time('firebase_auth', 'delete_user'):
+                await _datastore.run(auth.delete_user, uid, lane='auth')
         except Exception:
             logger.exception('Failed to delete Firebase user after missing Firestore')
         raise HTTPException(status_code=501, detail='Firestore not configured; user creation rolled back')
 
     try:
         users_ref = _firestore_client.collection('users')
-        users_ref.document(uid).set({
-            'uid': uid,
-            'email': email,
-            'accountName': req.accountName,
-            'createdAt': firestore.SERVER_TIMESTAMP,
-        })
+        with _upstream.time('firestore', 'users.set'):
+            await _datastore.run(users_ref.document(uid).set, {
+                'uid': uid,
+                'email': email,
+                'accountName': req.accountName,
+                'createdAt': firestore.SERVER_TIMESTAMP,
+            }, lane='auth')
     except Exception:
         logger.exception('Failed to write user to Firestore; rolling back')
         # Rollback: delete the user from Firebase Auth
         try:
-            firebase_admin.auth.delete_user(uid)
+            with _upstream.time('firebase_auth', 'delete_user'):
+                await _datastore.run(auth.delete_user, uid, lane='auth')
         except Exception:
             logger.exception('Failed to delete Firebase user during rollback')
         raise HTTPException(status_code=500, detail='Failed to persist user data; user creation rolled back')
 
+    # Drop any cached miss for this uid so /users/{uid} sees the new profile immediately
+    _profile_cache.invalidate(uid)
+    if _search_index.ready:
+        _search_index.upsert(uid, req.accountName, email)
+
     # Return created user info including accountName
     return JSONResponse(status_code=201, content={'uid': uid, 'email': email, 'accountName': req.accountName})
 
@@ -214,30 +740,170 @@ async def ping():
     return {'ok': True}
 
 
-# Simple in-memory blacklist for revoked tokens (development only).
-# In production use a persistent store (Redis, database) with TTL.
-_revoked_tokens = set()
+def _lane_samples(field: str):
+    return [((name,), lane[field]) for name, lane in _datastore.stats()['lanes'].items()]
+
+
+def _cache_samples(field: str):
+    caches = {'verified_tokens': _verified_token_cache, 'profiles': _profile_cache, 'chat_inboxes': _inbox_cache,
+              'friends': _friends_cache, 'users_search': _search_flight}
+    return [((name,), stats[field]) for name, stats in ((n, c.stats()) for n, c in caches.items()) if field in stats]
+
+
+# Read at scrape time, so these cost nothing per request.
+_metrics.callback('datastore_in_flight', 'Firestore calls running per lane.', ('lane',),
+                  lambda: _lane_samples('in_flight'))
+_metrics.callback('datastore_queued', 'Firestore calls waiting for a lane slot.', ('lane',),
+                  lambda: _lane_samples('queued'))
+_metrics.callback('datastore_rejected_total', 'Firestore calls rejected because the lane queue was full.', ('lane',),
+                  lambda: _lane_samples('rejected'), kind='counter')
+_metrics.callback('datastore_timeouts_total', 'Firestore calls that exceeded their deadline.', ('lane',),
+                  lambda: _lane_samples('timeouts'), kind='counter')
+_metrics.callback('cache_hits_total', 'In-process cache hits.', ('cache',), lambda: _cache_samples('hits'), kind='counter')
+_metrics.callback('cache_misses_total', 'In-process cache misses.', ('cache',), lambda: _cache_samples('misses'), kind='counter')
+_metrics.callback('cache_entries', 'Entries held by in-process caches.', ('cache',), lambda: _cache_samples('size'))
+_metrics.callback('cache_coalesced_total', 'Reads that joined an identical in-flight upstream read.', ('cache',),
+                  lambda: _cache_samples('coalesced'), kind='counter')
+_metrics.callback('circuit_breaker_open', 'Whether the dependency\'s circuit breaker is open (1) or half-open (0.5).',
+                  ('dependency',), lambda: [((name,), {'open': 1, 'half_open': 0.5}.get(b.state, 0))
+                                             for name, b in _breakers.items()])
+_metrics.callback('circuit_breaker_rejected_total', 'Calls failed fast by an open circuit breaker.', ('dependency',),
+                  lambda: [((name,), b.rejected) for name, b in _breakers.items()], kind='counter')
+_metrics.callback('points_indexed', 'Location points held by the in-memory index.', (), lambda: [((), len(_point_index))])
+_metrics.callback('points_pending_writes', 'Users whose latest point is buffered for the next Firestore flush.', (),
+                  lambda: [((), _point_writer.stats()['pending'])])
+_metrics.callback('points_coalesced_total', 'Point writes superseded in the buffer before reaching Firestore.', (),
+                  lambda: [((), _point_writer.stats()['coalesced'])], kind='counter')
+_metrics.callback('chat_ws_subscribers', 'Connected chat WebSocket clients.', (),
+                  lambda: [((), _chat_hub.stats()['subscribers'])])
+
+
+@app.get('/ready')
+async def ready():
+    """Readiness probe: 200 once the lifespan warm-up has finished, 503 before (and during shutdown).
+
+    /ping stays a pure liveness check.
+    """
+    body = {
+        'ready': _ready,
+        'firebase': _firebase_initialized,
+        'searchIndex': _search_index.ready,
+        'pointIndex': _point_index.ready,
+    }
+    return JSONResponse(status_code=200 if _ready else 503, content=body)
+
+
+@app.get('/metrics')
+async def metrics():
+    """Prometheus text exposition of request, upstream, executor and cache metrics."""
+    return Response(content=_metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
 
-# In-memory store for refresh tokens: token -> {uid, email, expires}
-_refresh_tokens = {}
-# Blacklist for revoked refresh tokens
-_revoked_refresh_tokens = set()
+@app.get('/debug/datastore')
+async def datastore_stats():
+    """Queue-depth / in-flight gauges of the Firestore executor lanes."""
+    return _datastore.stats()
 
-# Initialize Firebase Admin if service account is present
+
+# Firebase Admin is initialized by the lifespan (_init_firebase), not at import
 _firestore_client = None
 _firebase_initialized = False
 service_account_path = os.path.join(os.path.dirname(__file__), 'secrets', 'firebase-admin.json')
-if os.path.exists(service_account_path):
+
+
+def _init_firebase() -> None:
+    """Initialize the Admin SDK and Firestore client if a service account is present (blocking)."""
+    global _firestore_client, _firebase_initialized
+    if _firebase_initialized:
+        # already initialized, or a stand-in client was installed (bench/)
+        return
+    if not os.path.exists(service_account_path):
+        logger.warning('Firebase service account not found at %s', service_account_path)
+        return
     try:
-        cred = credentials.Certificate(service_account_path)
-        firebase_admin.initialize_app(cred)
+        _load_firebase_modules()
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app(credentials.Certificate(service_account_path))
         _firestore_client = firestore.client()
         _firebase_initialized = True
         logger.info('Initialized Firebase Admin SDK')
     except Exception:
         logger.exception('Failed to initialize Firebase Admin SDK')
-else:
-    logger.warning('Firebase service account not found at %s', service_account_path)
+
+
+class UserProfile(NamedTuple):
+    data: dict
+    updated: Optional[datetime]
+
+
+async def _load_profile(uid: str) -> Optional[UserProfile]:
+    """Point-read users/{uid} off the event loop; None if the user does not exist."""
+    ref = _firestore_client.collection('users').document(uid)
+    with _upstream.time('firestore', 'users.get'):
+        doc = await _firestore_read(ref.get)
+    if not doc.exists:
+        return None
+    return UserProfile(doc.to_dict() or {}, getattr(doc, 'update_time', None))
+
+
+_NOT_CACHED = object()
+
+# Read-through cache of users/{uid}, shared by /users/{uid} and friend-request denormalization.
+# Missing users are cached for PROFILE_NEGATIVE_TTL; /register invalidates the new uid.
+_profile_cache = ReadThroughCache(_load_profile, PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL, PROFILE_NEGATIVE_TTL)
+
+
+_search_index = UserSearchIndex()
+# Firestore-fallback search pages, keyed by ('users.search', query, limit, cursor)
+_search_flight = SingleFlight(1024)
+_search_watch = None
+
+
+def _on_users_snapshot(docs, changes, read_time):
+    """Firestore listener callback for `users` (runs on the listener's thread).
+
+    The first snapshot bulk-loads the index; later ones apply incremental changes.
+    """
+    try:
+        if not _search_index.ready:
+            rows = []
+            for doc in docs:
+                data = doc.to_dict() or {}
+                rows.append((doc.id, data.get('accountName'), data.get('email')))
+            _search_index.load(rows)
+            logger.info('User search index loaded (%s users)', len(rows))
+            return
+        for change in changes:
+            doc = change.document
+            if change.type.name == 'REMOVED':
+                _search_index.remove(doc.id)
+            else:
+                data = doc.to_dict() or {}
+                _search_index.upsert(doc.id, data.get('accountName'), data.get('email'))
+    except Exception:
+        logger.exception('Failed to apply users snapshot to the search index')
+
+
+def _start_search_index():
+    global _search_watch
+    if not SEARCH_INDEX_ENABLED or not _firebase_initialized or _firestore_client is None:
+        return
+    try:
+        _search_watch = _firestore_client.collection('users').on_snapshot(_on_users_snapshot)
+    except Exception:
+        logger.exception('Failed to start users listener; /users/search will query Firestore')
+
+
+def _stop_search_index():
+    global _search_watch
+    watch, _search_watch = _search_watch, None
+    if watch is not None:
+        try:
+            watch.unsubscribe()
+        except Exception:
+            logger.debug('Failed to unsubscribe users listener', exc_info=True)
 
 
 class LogoutRequest(BaseModel):
@@ -245,41 +911,74 @@ class LogoutRequest(BaseModel):
 
 
 @app.post('/auth/logout')
-async def logout(req: LogoutRequest):
-    """Validate the provided JWT and add it to the in-memory blacklist.
+async def logout(req: LogoutRequest, authorization: Optional[str] = Header(None)):
+    """Revoke the refresh token and, if one is sent in `Authorization`, the access token.
 
     Request body: {"refresh_token": "<token>"}
+
+    The refresh token is checked first: an unknown refresh token (401) or one
+    issued to another user than the access token's (403) revokes nothing.
     """
     token = req.refresh_token
     if not token:
         raise HTTPException(status_code=400, detail='refresh_token is required')
+    claims = _logout_access_claims(authorization) if authorization else None
+
+    entry = await _token_store_call(_token_store.get, token)
+    if entry is None:
+        # If refresh token already revoked, treat as success
+        if not await _token_store_call(_token_store.is_revoked, token):
+            # token not recognized
+            raise HTTPException(status_code=401, detail='Invalid refresh token')
+    elif claims is not None and claims.get('sub') != entry.uid:
+        raise HTTPException(status_code=403, detail='Refresh token belongs to another user')
+    else:
+        # Revoke: the store keeps a revocation marker until the token would have expired
+        if await _token_store_call(_token_store.revoke, token) is not None:
+            logger.info('Revoked refresh token for uid=%s', entry.uid)
 
-    # If refresh token already revoked, treat as success
-    if token in _revoked_refresh_tokens:
-        return {'message': 'Logged out successfully'}
+    if claims is not None:
+        await _revoke_access_token(claims)
+    return {'message': 'Logged out successfully'}
 
-    # Check presence in refresh store
-    entry = _refresh_tokens.get(token)
-    if not entry:
-        # token not recognized
-        raise HTTPException(status_code=401, detail='Invalid refresh token')
 
-    # Revoke: remove from store and add to revoked set
+def _logout_access_claims(authorization: str) -> Optional[dict]:
+    """Claims of the access token in an Authorization header; None if it is invalid or expired."""
+    token = _bearer_token(authorization)
     try:
-        del _refresh_tokens[token]
-    except KeyError:
-        pass
-    _revoked_refresh_tokens.add(token)
-    logger.info('Revoked refresh token for uid=%s', entry.get('uid'))
+        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'], options=_JWT_DECODE_OPTIONS, leeway=JWT_LEEWAY)
+    except Exception:
+        return None
 
-    return {'message': 'Logged out successfully'}
+
+async def _revoke_access_token(claims: dict) -> None:
+    """Revoke the access token with these (verified) claims until it would have expired."""
+    jti, exp = claims.get('jti'), claims.get('exp')
+    if isinstance(jti, str) and isinstance(exp, (int, float)):
+        await _token_store_call(_token_store.revoke_access, jti, int(exp + JWT_LEEWAY))
+
+
+def _access_token_claims(uid: str, email: str, generation: int, hours: int = 1) -> dict:
+    """Claims for a new access token. `jti` allows revoking it alone; `gen` ties it to the user's token generation."""
+    now = datetime.utcnow()
+    return {
+        'sub': uid,
+        'email': email,
+        'iat': int(now.timestamp()),
+        'exp': int((now + timedelta(hours=hours)).timestamp()),
+        'jti': secrets.token_urlsafe(12),
+        'gen': generation,
+    }
 
 
-def _create_refresh_token(uid: str, email: str, account_name: Optional[str] = None, days: int = 30):
+async def _create_refresh_token(uid: str, email: str, account_name: Optional[str] = None, days: int = 30,
+                          generation: Optional[int] = None):
     token = secrets.token_urlsafe(48)
     expires = int((datetime.utcnow() + timedelta(days=days)).timestamp())
+    if generation is None:
+        generation = await _token_store_call(_token_store.generation, uid)
     # accountName may be optional
-    _refresh_tokens[token] = {'uid': uid, 'email': email, 'expires': expires, 'accountName': account_name}
+    await _token_store_call(_token_store.put, token, RefreshEntry(uid, email, account_name, expires, generation))
     return token
 
 
@@ -293,44 +992,74 @@ async def refresh_token(body: dict):
     if not token:
         raise HTTPException(status_code=400, detail='refresh_token is required')
 
-    if token in _revoked_refresh_tokens:
-        raise HTTPException(status_code=401, detail='Refresh token revoked')
-
-    entry = _refresh_tokens.get(token)
-    if not entry:
+    entry = await _token_store_call(_token_store.get, token)
+    if entry is None:
+        if await _token_store_call(_token_store.is_revoked, token):
+            raise HTTPException(status_code=401, detail='Refresh token revoked')
         raise HTTPException(status_code=401, detail='Invalid refresh token')
 
-    if entry.get('expires', 0) < int(datetime.utcnow().timestamp()):
-        # expired
-        # ensure it's removed
-        try:
-            del _refresh_tokens[token]
-        except KeyError:
-            pass
+    if entry.expires < int(datetime.utcnow().timestamp()):
+        # expired but not swept yet; ensure it's removed
+        await _token_store_call(_token_store.delete, token)
         raise HTTPException(status_code=401, detail='Refresh token expired')
 
+    generation = await _token_store_call(_token_store.generation, entry.uid)
+    if entry.generation < generation:
+        # issued before a logout_all
+        await _token_store_call(_token_store.delete, token)
+        raise HTTPException(status_code=401, detail='Refresh token revoked')
+
     # Create new access token
-    now = datetime.utcnow()
-    payload = {
-        'sub': entry['uid'],
-        'email': entry['email'],
-        'iat': int(now.timestamp()),
-        'exp': int((now + timedelta(hours=1)).timestamp())
-    }
+    payload = _access_token_claims(entry.uid, entry.email, generation)
     access = jwt.encode(payload, JWT_SECRET, algorithm='HS256')
     if isinstance(access, bytes):
         access = access.decode('utf-8')
 
-    return {'access_token': access, 'token_type': 'bearer', 'uid': entry['uid'], 'email': entry['email'], 'accountName': entry.get('accountName')}
+    return {'access_token': access, 'token_type': 'bearer', 'uid': entry.uid, 'email': entry.email, 'accountName': entry.account_name}
+
+
+def _log_token_diagnostics(token: str) -> None:
+    """Log server time and unverified token claims to detect clock skew (JWT_DEBUG_DIAGNOSTICS only)."""
+    try:
+        server_ts = int(datetime.utcnow().timestamp())
+        logger.debug('Server UTC timestamp: %s', server_ts)
+        # Get unverified claims (no signature/exp/iat verification) to inspect iat/exp
+        unverified = jwt.decode(token, options={"verify_signature": False, "verify_exp": False, "verify_iat": False})
+        logger.debug('Unverified token claims: %s', unverified)
+        token_iat = unverified.get('iat')
+        token_exp = unverified.get('exp')
+        if token_iat is not None:
+            logger.debug('Token iat=%s, exp=%s (server_ts=%s)', token_iat, token_exp, server_ts)
+    except Exception:
+        logger.debug('Failed to decode token without verification for diagnostics', exc_info=True)
+
+
+def _bearer_token(raw: str) -> str:
+    """The token in an Authorization header value; 401 if there is none."""
+    # Normalize and strip possible surrounding quotes
+    raw = raw.strip().strip('"').strip("'")
+
+    parts = raw.split()
+    # Accept both 'Bearer <token>' and raw token formats (dev/debugging convenience)
+    if len(parts) >= 2 and parts[0].lower() == 'bearer':
+        return parts[1]
+    if len(parts) == 1:
+        return parts[0]
+    logger.warning('Invalid authorization header format: %s', redact_credential(raw))
+    raise HTTPException(status_code=401, detail='Invalid authorization header')
 
 
-def _verify_access_token(request: Request, authorization: Optional[str] = Header(None)) -> dict:
+async def _verify_access_token(request: Request, authorization: Optional[str] = Header(None)) -> dict:
     """Verify HS256 access token from Authorization header.
 
     This dependency reads the standard `Authorization` header (case-insensitive),
     falls back to inspecting request.headers, strips surrounding quotes, accepts
     either 'Bearer <token>' or just the raw token (useful for debugging), and
     logs the raw header and decoded payload for traceability.
+
+    Verified claims are cached per token digest until the token's `exp`, so a
+    client reusing its token skips the HMAC check. The returned dict is shared
+    between requests and must not be mutated.
     """
     # Try header provided by FastAPI Header param first
     raw = authorization
@@ -339,71 +1068,37 @@ def _verify_access_token(request: Request, authorization: Optional[str] = Header
     if not raw and request is not None:
         raw = request.headers.get('authorization') or request.headers.get('Authorization') or request.headers.get('auth-header')
 
-    # Helpful debug: log request path/method and headers (may contain Authorization)
-    try:
-        logger.debug('Incoming request: %s %s', request.method, request.url.path)
-        # Convert headers to a regular dict for clearer logging
-        logger.debug('Request headers: %s', dict(request.headers))
-    except Exception:
-        logger.debug('Could not log request headers')
-
-    logger.debug('Authorization header raw: %s', raw)
+    # Helpful debug: log request path/method and headers (credentials redacted), sampled per route
+    trace = request is not None and _debug_sampled(route_template(request.scope))
+    if trace:
+        try:
+            logger.debug('Incoming request: %s %s', request.method, request.url.path)
+            logger.debug('Request headers: %s', redact_headers(request.headers))
+        except Exception:
+            logger.debug('Could not log request headers')
+        logger.debug('Authorization header raw: %s', redact_credential(raw))
 
     if not raw:
         logger.warning('Authorization header missing')
         raise HTTPException(status_code=401, detail='Authorization header missing')
 
-    # Normalize and strip possible surrounding quotes
-    raw = raw.strip().strip('"').strip("'")
-
-    parts = raw.split()
-    token = None
-    # Accept both 'Bearer <token>' and raw token formats (dev/debugging convenience)
-    if len(parts) >= 2 and parts[0].lower() == 'bearer':
-        token = parts[1]
-    elif len(parts) == 1:
-        token = parts[0]
-    else:
-        logger.warning('Invalid authorization header format: %s', raw)
-        raise HTTPException(status_code=401, detail='Invalid authorization header')
+    token = _bearer_token(raw)
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = _verified_token_cache.get(key)
+    if payload is not None:
+        await _check_not_revoked(payload)
+        return payload
 
-    # Log server time and unverified token claims to detect clock skew
-    try:
-        server_ts = int(datetime.utcnow().timestamp())
-        logger.debug('Server UTC timestamp: %s', server_ts)
-        # Get unverified claims (no signature/exp/iat verification) to inspect iat/exp
-        unverified = jwt.decode(token, options={"verify_signature": False, "verify_exp": False, "verify_iat": False})
-        logger.debug('Unverified token claims: %s', unverified)
-        token_iat = unverified.get('iat')
-        token_exp = unverified.get('exp')
-        if token_iat is not None:
-            logger.debug('Token iat=%s, exp=%s (server_ts=%s)', token_iat, token_exp, server_ts)
-    except Exception:
-        logger.debug('Failed to decode token without verification for diagnostics', exc_info=True)
+    if JWT_DEBUG_DIAGNOSTICS:
+        _log_token_diagnostics(token)
 
-    # Allow optional leeway for dev debugging via env var JWT_LEEWAY (seconds). Default 0.
     try:
-        leeway = int(os.getenv('JWT_LEEWAY', '0'))
-    except Exception:
-        leeway = 0
-
-    try:
-        # IMPORTANT: disable iat validation because some tokens (e.g. Firebase-issued)
-        # may have 'iat' values that are slightly in the future due to clock skew
-        # between issuer and validator. We still want to validate 'exp' (expiry)
-        # and 'nbf' (not-before) if present. PyJWT allows disabling specific
-        # claim validations via the `options` parameter.
-        options = {
-            'verify_signature': True,
-            'verify_exp': True,
-            'verify_nbf': True,
-            # Turn off iat verification to avoid ImmatureSignatureError
-            'verify_iat': False,
-        }
-
         # Decode with explicit options and optional leeway (seconds)
-        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'], options=options, leeway=leeway)
-        logger.debug('Decoded JWT payload: %s', payload)
+        started = time.perf_counter()
+        payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'], options=_JWT_DECODE_OPTIONS, leeway=JWT_LEEWAY)
+        _jwt_decode.observe(time.perf_counter() - started)
+        if trace:
+            logger.debug('Decoded JWT claims: sub=%s exp=%s', payload.get('sub'), payload.get('exp'))
     except jwt.ExpiredSignatureError:
         logger.exception('Token expired while decoding')
         raise HTTPException(status_code=401, detail='Token expired')
@@ -414,198 +1109,1874 @@ def _verify_access_token(request: Request, authorization: Optional[str] = Header
     except Exception as e:
         logger.exception('Invalid token while decoding: %s', e)
         raise HTTPException(status_code=401, detail='Invalid token')
+
+    # Tokens without exp are never cached: there is no point at which the entry would become stale.
+    exp = payload.get('exp')
+    if isinstance(exp, (int, float)):
+        _verified_token_cache.set(key, payload, exp + JWT_LEEWAY)
+    await _check_not_revoked(payload)
     return payload
 
 
-@app.post('/friend_requests')
-async def create_friend_request(req: FriendRequestCreate, token_payload: dict = Depends(_verify_access_token), request: Request = None):
-    """Create a friend request document in Firestore.
+async def _check_not_revoked(payload: dict) -> None:
+    """Reject tokens revoked by jti or issued before the user's current generation.
 
-    Rules:
-    - Caller must be authenticated.
-    - senderId must match authenticated sub (uid).
-    - senderId != receiverId.
-    - No existing pending request from sender to receiver.
+    Runs on cache hits too, since the verified-token cache only stands in for the signature check.
+    Both lookups are one store call (one pool hop and one lock acquisition with SQLite).
     """
-    # Trace: log body + auth payload early for debugging
+    jti, exp = payload.get('jti'), payload.get('exp')
+    if not isinstance(exp, (int, float)):
+        jti, exp = None, 0
+    revoked, generation = await _token_store_call(_token_store.access_state, payload.get('sub'), jti,
+                                                  int(exp + JWT_LEEWAY))
+    if revoked or payload.get('gen', 0) < generation:
+        raise HTTPException(status_code=401, detail='Token revoked')
+
+
+@app.post('/auth/logout_all')
+async def logout_all(payload: dict = Depends(_verify_access_token)):
+    """Log the caller out everywhere: every access and refresh token issued so far stops working."""
+    uid = payload.get('sub')
+    generation = await _token_store_call(_token_store.bump_generation, uid)
+    logger.info('Bumped token generation for uid=%s to %s', uid, generation)
+    return {'message': 'Logged out everywhere', 'generation': generation}
+
+
+def _friend_request_id(sender: str, receiver: str) -> str:
+    """Deterministic document ID: at most one request per direction, found with a point read."""
+    return f'{sender}_{receiver}'
+
+
+def _raise_if_duplicate(existing: Optional[dict], reverse: Optional[dict] = None) -> None:
+    """409 if the request, or the one in the opposite direction, is pending or accepted."""
+    request_status = (existing or {}).get('status')
+    reverse_status = (reverse or {}).get('status')
+    if 'accepted' in (request_status, reverse_status):
+        raise HTTPException(status_code=409, detail='Users are already friends')
+    if request_status == 'pending':
+        raise HTTPException(status_code=409, detail='A pending friend request already exists')
+    if reverse_status == 'pending':
+        raise HTTPException(status_code=409, detail='The receiver has already sent you a friend request; accept it instead')
+
+
+async def _profile_data_or_none(uid: str) -> Optional[dict]:
+    """Profile fields for denormalization; lookup failures are logged and ignored."""
     try:
-        logger.info('create_friend_request called; body=%s auth_payload=%s', req.dict(), token_payload)
-        logger.debug('Request headers at friend_requests: %s', dict(request.headers) if request is not None else None)
+        cached = await _profile_cache.get(uid)
     except Exception:
-        logger.debug('Failed logging friend request debug info')
+        logger.debug('Failed to read profile for %s', uid, exc_info=True)
+        return None
+    return cached.data if cached is not None else None
 
-    if not _firebase_initialized or _firestore_client is None:
-        raise HTTPException(status_code=501, detail='Firestore not configured on backend')
 
-    sender = (req.senderId or '').strip()
-    receiver = (req.receiverId or '').strip()
+def _extract_name_and_email(profile):
+    if not profile:
+        return (None, None)
+    name = profile.get('accountName') or profile.get('displayName') or profile.get('name') or profile.get('email')
+    email = profile.get('email')
+    return (name, email)
 
-    if not sender or not receiver:
-        raise HTTPException(status_code=400, detail='senderId and receiverId are required')
 
-    # Ensure the authenticated user is the sender
-    auth_sub = token_payload.get('sub')
-    if auth_sub != sender:
-        raise HTTPException(status_code=403, detail='senderId does not match authenticated user')
+def _friend_request_payload(sender: str, receiver: str, sender_profile: Optional[dict], receiver_profile: Optional[dict]) -> dict:
+    """Friend request document with denormalized sender/receiver metadata."""
+    sender_name, sender_email = _extract_name_and_email(sender_profile)
+    receiver_name, receiver_email = _extract_name_and_email(receiver_profile)
+    payload = {
+        'senderId': sender,
+        'receiverId': receiver,
+        'status': 'pending',
+        # Explicit rather than SERVER_TIMESTAMP: the inbox summaries carry the same value,
+        # so pages served from friend_inboxes and from queries share one keyset.
+        'createdAt': datetime.now(timezone.utc),
+    }
+    if sender_name:
+        payload['senderDisplayName'] = sender_name
+    if sender_email:
+        payload['senderEmail'] = sender_email
+    if receiver_name:
+        payload['receiverDisplayName'] = receiver_name
+    if receiver_email:
+        payload['receiverEmail'] = receiver_email
+    return payload
 
-    if sender == receiver:
-        raise HTTPException(status_code=400, detail='Cannot send friend request to yourself')
 
-    try:
-        users_ref = _firestore_client.collection('friend_requests')
+_FRIEND_REQUEST_FIELDS = ('senderId', 'receiverId', 'status', 'createdAt', 'senderDisplayName', 'senderEmail',
+                          'receiverDisplayName', 'receiverEmail')
 
-        # Check for existing pending request from sender -> receiver
-        import asyncio
-        loop = asyncio.get_event_loop()
 
-        def _query_pending():
-            q = users_ref.where('senderId', '==', sender).where('receiverId', '==', receiver).where('status', '==', 'pending').limit(1).get()
-            return list(q)
+def _friend_request_summary(request_id: str, data: dict) -> dict:
+    """The request fields kept in friend_inboxes and returned by GET /me/friend_requests."""
+    summary = {'id': request_id}
+    summary.update((field, data[field]) for field in _FRIEND_REQUEST_FIELDS if data.get(field) is not None)
+    return summary
 
-        pending_docs = await loop.run_in_executor(None, _query_pending)
-        if pending_docs:
-            raise HTTPException(status_code=409, detail='A pending friend request already exists')
 
-        # Read sender and receiver profiles to denormalize display names and emails
-        sender_profile = None
-        receiver_profile = None
-        try:
-            sender_doc = _firestore_client.collection('users').document(sender).get()
-            if sender_doc.exists:
-                sender_profile = sender_doc.to_dict()
-        except Exception:
-            logger.debug('Failed to read sender profile for %s', sender, exc_info=True)
+def _recent_order(summary: dict):
+    return (_timestamp_seconds(summary.get('createdAt')), summary['id'])
 
-        try:
-            receiver_doc = _firestore_client.collection('users').document(receiver).get()
-            if receiver_doc.exists:
-                receiver_profile = receiver_doc.to_dict()
-        except Exception:
-            logger.debug('Failed to read receiver profile for %s', receiver, exc_info=True)
-
-        def _extract_name_and_email(profile):
-            if not profile:
-                return (None, None)
-            name = profile.get('accountName') or profile.get('displayName') or profile.get('name') or profile.get('email')
-            email = profile.get('email')
-            return (name, email)
-
-        sender_name, sender_email = _extract_name_and_email(sender_profile)
-        receiver_name, receiver_email = _extract_name_and_email(receiver_profile)
-
-        # Create friend request with denormalized sender/receiver metadata
-        doc_ref = users_ref.document()
-        payload = {
-            'senderId': sender,
-            'receiverId': receiver,
-            'status': 'pending',
-            'createdAt': firestore.SERVER_TIMESTAMP,
-        }
-        if sender_name:
-            payload['senderDisplayName'] = sender_name
-        if sender_email:
-            payload['senderEmail'] = sender_email
-        if receiver_name:
-            payload['receiverDisplayName'] = receiver_name
-        if receiver_email:
-            payload['receiverEmail'] = receiver_email
 
-        doc_ref.set(payload)
+def _inbox_update(inbox: dict, counts: Optional[dict] = None, summary: Optional[dict] = None,
+                  remove: Optional[str] = None) -> None:
+    """Apply counter deltas and put (or drop) a summary in an inbox document, in place.
 
-        return JSONResponse(status_code=201, content={'message': 'Friend request created', 'requestId': doc_ref.id})
+    `recent` holds the FRIEND_INBOX_RECENT newest requests involving the user,
+    newest first by (createdAt, ID), the order GET /me/friend_requests pages in.
+    A summary that is older than a full list simply falls off the end again.
+    """
+    for field, delta in (counts or {}).items():
+        inbox[field] = max(0, int(inbox.get(field) or 0) + delta)
+    drop = {s['id'] for s in (summary, {'id': remove}) if s is not None and s.get('id')}
+    recent = [entry for entry in inbox.get('recent') or [] if entry.get('id') not in drop]
+    if summary is not None:
+        recent.append(summary)
+        recent.sort(key=_recent_order, reverse=True)
+    inbox['recent'] = recent[:FRIEND_INBOX_RECENT]
 
-    except HTTPException:
-        raise
-    except Exception:
-        logger.exception('Failed to create friend request from %s to %s', sender, receiver)
-        raise HTTPException(status_code=500, detail='Failed to create friend request')
 
+class _Inboxes:
+    """friend_inboxes documents read in a transaction and written back when it commits."""
 
-@app.get('/users/search')
-async def users_search(query: str):
-    """Search users by accountName or email using prefix matching.
+    def __init__(self, uids, snapshots: dict):
+        collection = _firestore_client.collection('friend_inboxes')
+        self.refs = {uid: collection.document(uid) for uid in uids}
+        self._docs = {uid: _snapshot_data(snapshots, ref) or {} for uid, ref in self.refs.items()}
+        self._touched = set()
 
-    Note: Firestore does not support arbitrary substring contains efficiently.
-    This endpoint performs prefix (startsWith) matches using range queries.
-    """
-    if not _firebase_initialized or _firestore_client is None:
-        raise HTTPException(status_code=501, detail='Firestore not configured on the backend')
+    def update(self, uid: str, **changes) -> None:
+        _inbox_update(self._docs[uid], **changes)
+        self._touched.add(uid)
 
-    q = (query or '').strip()
-    if not q:
-        return []
+    def write(self, transaction) -> None:
+        for uid in self._touched:
+            transaction.set(self.refs[uid], {**self._docs[uid], 'updatedAt': firestore.SERVER_TIMESTAMP})
 
-    # For prefix queries, use range trick: field >= q and field <= q + '\uf8ff'
-    end = q + '\uf8ff'
-    results = {}
 
-    try:
-        users_ref = _firestore_client.collection('users')
+def _friend_list_refs(*uids):
+    collection = _firestore_client.collection('friend_lists')
+    return [collection.document(uid) for uid in uids]
 
-        # Try searching accountName field (case-sensitive). Projects should maintain a lowercased index if needed.
-        acct_query = users_ref.where('accountName', '>=', q).where('accountName', '<=', end).limit(50).stream()
-        async for doc in _aiter_firestore_stream(acct_query):
-            data = doc.to_dict()
-            results[doc.id] = {'userId': doc.id, 'accountName': data.get('accountName'), 'email': data.get('email')}
 
-        # Search email field
-        email_query = users_ref.where('email', '>=', q).where('email', '<=', end).limit(50).stream()
-        async for doc in _aiter_firestore_stream(email_query):
-            data = doc.to_dict()
-            results[doc.id] = {'userId': doc.id, 'accountName': data.get('accountName'), 'email': data.get('email')}
+def _friend_entry(request_id: str, data: dict, side: str) -> dict:
+    """friend_lists entry for the request's `side` ('sender' or 'receiver'), with its denormalized profile fields."""
+    entry = {'since': datetime.now(timezone.utc), 'requestId': request_id}
+    if data.get(f'{side}DisplayName'):
+        entry['accountName'] = data[f'{side}DisplayName']
+    if data.get(f'{side}Email'):
+        entry['email'] = data[f'{side}Email']
+    return entry
 
-    except Exception:
-        logger.exception('Error querying Firestore for users')
-        raise HTTPException(status_code=500, detail='Error querying Firestore')
 
-    return list(results.values())
+def _friend_inbox_refs(*uids):
+    collection = _firestore_client.collection('friend_inboxes')
+    return [collection.document(uid) for uid in uids]
 
 
-async def _aiter_firestore_stream(stream):
-    """Helper to iterate over Firestore python synchronous stream in async context.
+def _snapshots_by_path(refs, transaction=None) -> dict:
+    """One get_all round trip; snapshots keyed by document path (refs may span collections)."""
+    return {snap.reference.path: snap for snap in _firestore_client.get_all(refs, transaction=transaction)}
 
-    Firestore Python client returns a generator; to avoid blocking the event loop, yield from it in a thread.
-    """
-    # Since firestore.stream() is blocking, run in thread and yield results
-    import asyncio
-    loop = asyncio.get_event_loop()
-    gen = stream
 
-    def _collect():
-        return list(gen)
+def _snapshot_data(snapshots: dict, ref) -> Optional[dict]:
+    snap = snapshots.get(ref.path)
+    return (snap.to_dict() or {}) if snap is not None and snap.exists else None
 
-    docs = await loop.run_in_executor(None, _collect)
-    for d in docs:
-        yield d
 
+def _query_pending(sender: str, receiver: str) -> tuple:
+    """The existing sender -> receiver and receiver -> sender request documents, or None each (blocking)."""
+    requests_ref = _firestore_client.collection('friend_requests')
+    refs = [requests_ref.document(_friend_request_id(sender, receiver)),
+            requests_ref.document(_friend_request_id(receiver, sender))]
+    snapshots = _snapshots_by_path(refs)
+    return tuple(_snapshot_data(snapshots, ref) for ref in refs)
 
-@app.get('/users/{uid}')
-async def get_user_by_uid(uid: str):
-    """Return user document stored in Firestore at users/{uid}.
 
-    Returns 404 if not found. Requires Firestore to be configured.
+def _create_friend_request_txn(sender: str, receiver: str, payload: dict) -> str:
+    """Create friend_requests/{sender}_{receiver} in a transaction (blocking).
+
+    The transaction re-reads the document, and the one in the opposite
+    direction, so two concurrent senders cannot both create it and users who
+    are already friends (or have a pending request the other way) get 409; a
+    declined request may be re-sent and is overwritten. Both users'
+    friend_inboxes are read in the same round trip and updated with it.
+    """
+    requests_ref = _firestore_client.collection('friend_requests')
+    ref = requests_ref.document(_friend_request_id(sender, receiver))
+    reverse = requests_ref.document(_friend_request_id(receiver, sender))
+
+    @firestore.transactional
+    def _create(transaction):
+        snapshots = _snapshots_by_path([ref, reverse, *_friend_inbox_refs(sender, receiver)], transaction)
+        _raise_if_duplicate(_snapshot_data(snapshots, ref), _snapshot_data(snapshots, reverse))
+        transaction.set(ref, payload)
+        inboxes = _Inboxes((sender, receiver), snapshots)
+        summary = _friend_request_summary(ref.id, payload)
+        inboxes.update(sender, counts={'sent': 1}, summary=summary)
+        inboxes.update(receiver, counts={'pending': 1}, summary=summary)
+        inboxes.write(transaction)
+
+    _create(_firestore_client.transaction())
+    return ref.id
+
+
+def _create_friend_requests_bulk_txn(sender: str, payloads: dict) -> dict:
+    """Create many requests from `sender` in one transaction (blocking). Returns receiver -> status."""
+    requests_ref = _firestore_client.collection('friend_requests')
+    refs = {r: requests_ref.document(_friend_request_id(sender, r)) for r in payloads}
+    reverses = {r: requests_ref.document(_friend_request_id(r, sender)) for r in payloads}
+
+    @firestore.transactional
+    def _create(transaction):
+        snapshots = _snapshots_by_path([*refs.values(), *reverses.values(), *_friend_inbox_refs(sender, *refs)],
+                                       transaction)
+        inboxes = _Inboxes((sender, *refs), snapshots)
+        outcome = {}
+        for receiver, ref in refs.items():
+            statuses = ((_snapshot_data(snapshots, ref) or {}).get('status'),
+                        (_snapshot_data(snapshots, reverses[receiver]) or {}).get('status'))
+            if 'accepted' in statuses:
+                outcome[receiver] = 'friends'
+            elif 'pending' in statuses:
+                outcome[receiver] = 'pending'
+            else:
+                transaction.set(ref, payloads[receiver])
+                summary = _friend_request_summary(ref.id, payloads[receiver])
+                inboxes.update(sender, counts={'sent': 1}, summary=summary)
+                inboxes.update(receiver, counts={'pending': 1}, summary=summary)
+                outcome[receiver] = 'created'
+        inboxes.write(transaction)
+        return outcome
+
+    return _create(_firestore_client.transaction())
+
+
+@app.post('/friend_requests', status_code=201, response_model=FriendRequestCreated)
+async def create_friend_request(req: FriendRequestCreate, token_payload: dict = Depends(_verify_access_token), request: Request = None):
+    """Create a friend request document in Firestore.
+
+    Rules:
+    - Caller must be authenticated.
+    - senderId must match authenticated sub (uid).
+    - senderId != receiverId.
+    - No pending or accepted request between the two users, in either direction.
+
+    The request is stored at friend_requests/{senderId}_{receiverId} and created
+    in a transaction, so duplicates are detected with one batched read of both directions.
+    """
+    # Trace: log body + auth subject early for debugging (sampled; nothing is formatted otherwise)
+    if _debug_sampled('/friend_requests'):
+        try:
+            logger.debug('create_friend_request called; sender=%s receiver=%s auth_sub=%s',
+                         req.senderId, req.receiverId, token_payload.get('sub'))
+            logger.debug('Request headers at friend_requests: %s', redact_headers(request.headers) if request is not None else None)
+        except Exception:
+            logger.debug('Failed logging friend request debug info')
+
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured on backend')
+
+    sender = (req.senderId or '').strip()
+    receiver = (req.receiverId or '').strip()
+
+    if not sender or not receiver:
+        raise HTTPException(status_code=400, detail='senderId and receiverId are required')
+
+    # Ensure the authenticated user is the sender
+    auth_sub = token_payload.get('sub')
+    if auth_sub != sender:
+        raise HTTPException(status_code=403, detail='senderId does not match authenticated user')
+
+    if sender == receiver:
+        raise HTTPException(status_code=400, detail='Cannot send friend request to yourself')
+
+    try:
+        # Fail-fast duplicate check and both profile reads run concurrently, all off the event loop.
+        # The transaction below repeats the point read, so the check stays race-free.
+        (existing, reverse), sender_profile, receiver_profile = await asyncio.gather(
+            _timed('firestore', 'friend_requests.get', _firestore_read(_query_pending, sender, receiver)),
+            _profile_data_or_none(sender),
+            _profile_data_or_none(receiver),
+        )
+        _raise_if_duplicate(existing, reverse)
+
+        payload = _friend_request_payload(sender, receiver, sender_profile, receiver_profile)
+        with _upstream.time('firestore', 'friend_requests.create'):
+            request_id = await _datastore.run(_create_friend_request_txn, sender, receiver, payload, lane='write')
+
+        return {'message': 'Friend request created', 'requestId': request_id}
+
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Failed to create friend request from %s to %s', sender, receiver)
+        raise HTTPException(status_code=500, detail='Failed to create friend request')
+
+
+@app.post('/friend_requests:batchCreate', response_model=FriendRequestBulkResponse, response_model_exclude_none=True)
+async def create_friend_requests_bulk(req: FriendRequestBulkCreate, token_payload: dict = Depends(_verify_access_token)):
+    """Send friend requests from senderId to many receivers at once.
+
+    Same rules as POST /friend_requests, applied per receiver. All creatable
+    requests are written in one Firestore transaction; the response lists a
+    status per receiver: created, pending (already pending), friends
+    (already accepted) or invalid.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured on backend')
+
+    sender = (req.senderId or '').strip()
+    if not sender:
+        raise HTTPException(status_code=400, detail='senderId is required')
+    if token_payload.get('sub') != sender:
+        raise HTTPException(status_code=403, detail='senderId does not match authenticated user')
+
+    receivers = list(dict.fromkeys(r.strip() for r in req.receiverIds if r and r.strip()))
+    if len(receivers) > FRIEND_REQUEST_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f'At most {FRIEND_REQUEST_BULK_MAX} receivers per request')
+
+    results = {r: {'receiverId': r, 'status': 'invalid'} for r in receivers}
+    receivers = [r for r in receivers if r != sender]
+    if not receivers:
+        return {'results': list(results.values())}
+
+    try:
+        profiles = await _get_profiles([sender] + receivers)
+    except Exception:
+        logger.debug('Failed to read profiles for bulk friend requests from %s', sender, exc_info=True)
+        profiles = {}
+
+    try:
+        sender_profile = profiles.get(sender)
+        payloads = {
+            r: _friend_request_payload(sender, r, sender_profile and sender_profile.data,
+                                       profiles.get(r) and profiles[r].data)
+            for r in receivers
+        }
+        outcome = await _datastore.run(_create_friend_requests_bulk_txn, sender, payloads, lane='write')
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Failed to bulk-create friend requests from %s', sender)
+        raise HTTPException(status_code=500, detail='Failed to create friend requests')
+
+    for receiver, request_status in outcome.items():
+        results[receiver]['status'] = request_status
+        if request_status == 'created':
+            results[receiver]['requestId'] = _friend_request_id(sender, receiver)
+    return {'results': list(results.values())}
+
+
+def _respond_friend_request_txn(request_id: str, uid: str, accept: bool) -> tuple:
+    """Accept or decline a pending request addressed to `uid` in a transaction (blocking); returns (status, sender).
+
+    Updates both inboxes. Accepting adds each user to the other's friend_lists
+    document and deletes a pending request in the opposite direction, as the
+    app used to do after accepting.
+    """
+    requests_ref = _firestore_client.collection('friend_requests')
+    ref = requests_ref.document(request_id)
+    # IDs are normally {sender}_{receiver}: guess the sender so one round trip reads everything.
+    # Older requests have random IDs; their parties come from the document.
+    guess = request_id[:-len(uid) - 1] if request_id.endswith('_' + uid) else None
+
+    def _related(sender):
+        reverse = requests_ref.document(_friend_request_id(uid, sender))
+        friend_lists = _friend_list_refs(sender, uid) if accept else []
+        return reverse, friend_lists, [reverse, *_friend_inbox_refs(sender, uid), *friend_lists]
+
+    @firestore.transactional
+    def _respond(transaction):
+        related = _related(guess) if guess else None
+        snapshots = _snapshots_by_path([ref, *(related[2] if related else [])], transaction)
+        data = _snapshot_data(snapshots, ref)
+        if data is None:
+            raise HTTPException(status_code=404, detail='Friend request not found')
+        sender = data.get('senderId')
+        if data.get('receiverId') != uid or not isinstance(sender, str) or not sender:
+            raise HTTPException(status_code=403, detail='Only the receiver can respond to a friend request')
+        if data.get('status') != 'pending':
+            raise HTTPException(status_code=409, detail=f"Friend request is already {data.get('status')}")
+        if sender != guess:
+            related = _related(sender)
+            snapshots.update(_snapshots_by_path(related[2], transaction))
+        reverse, friend_lists, _ = related
+
+        request_status = 'accepted' if accept else 'declined'
+        transaction.update(ref, {'status': request_status, 'respondedAt': firestore.SERVER_TIMESTAMP})
+        inboxes = _Inboxes((sender, uid), snapshots)
+        summary = _friend_request_summary(request_id, {**data, 'status': request_status})
+        accepted = 1 if accept else 0
+        inboxes.update(sender, counts={'sent': -1, 'accepted': accepted}, summary=summary)
+        inboxes.update(uid, counts={'pending': -1, 'accepted': accepted}, summary=summary)
+        if accept and (_snapshot_data(snapshots, reverse) or {}).get('status') == 'pending':
+            transaction.delete(reverse)
+            inboxes.update(uid, counts={'sent': -1}, remove=reverse.id)
+            inboxes.update(sender, counts={'pending': -1}, remove=reverse.id)
+        inboxes.write(transaction)
+        for list_ref, peer_side in zip(friend_lists, ('receiver', 'sender')):
+            friends = dict((_snapshot_data(snapshots, list_ref) or {}).get('friends') or {})
+            friends[data[f'{peer_side}Id']] = _friend_entry(request_id, data, peer_side)
+            transaction.set(list_ref, {'friends': friends, 'updatedAt': firestore.SERVER_TIMESTAMP})
+        return request_status, sender
+
+    return _respond(_firestore_client.transaction())
+
+
+async def _respond_friend_request(request_id: str, token_payload: dict, accept: bool) -> dict:
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured on backend')
+    uid = token_payload.get('sub')
+    try:
+        with _upstream.time('firestore', 'friend_requests.respond'):
+            request_status, sender = await _datastore.run(_respond_friend_request_txn, request_id, uid, accept,
+                                                          lane='write')
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Failed to respond to friend request %s', request_id)
+        raise HTTPException(status_code=500, detail='Failed to update friend request')
+    if request_status == 'accepted':
+        _friends_cache.invalidate(uid)
+        _friends_cache.invalidate(sender)
+    return {'requestId': request_id, 'status': request_status}
+
+
+@app.post('/friend_requests/{request_id}:accept', response_model=FriendRequestResponded)
+async def accept_friend_request(request_id: str, token_payload: dict = Depends(_verify_access_token)):
+    """Accept a pending request sent to the caller. 404 if missing, 403 if not the receiver, 409 if not pending."""
+    return await _respond_friend_request(request_id, token_payload, accept=True)
+
+
+@app.post('/friend_requests/{request_id}:decline', response_model=FriendRequestResponded)
+async def decline_friend_request(request_id: str, token_payload: dict = Depends(_verify_access_token)):
+    """Decline a pending request sent to the caller. The sender may send a new one later."""
+    return await _respond_friend_request(request_id, token_payload, accept=False)
+
+
+async def _load_friends(uid: str) -> list:
+    """Rows of friend_lists/{uid}, sorted by account name: one document read."""
+    with _upstream.time('firestore', 'friend_lists.get'):
+        snap = await _firestore_read(_firestore_client.collection('friend_lists').document(uid).get)
+    friends = ((snap.to_dict() or {}).get('friends') or {}) if snap.exists else {}
+    rows = [{
+        'uid': peer,
+        'accountName': entry.get('accountName'),
+        'email': entry.get('email'),
+        'since': _timestamp_iso(entry.get('since')),
+    } for peer, entry in friends.items()]
+    rows.sort(key=lambda row: ((row['accountName'] or row['email'] or '').lower(), row['uid']))
+    return rows
+
+
+# Accepting a request invalidates both users; other workers catch up within FRIENDS_CACHE_TTL
+_friends_cache = ReadThroughCache(_load_friends, FRIENDS_CACHE_SIZE, FRIENDS_CACHE_TTL, FRIENDS_CACHE_TTL)
+
+
+@app.get('/me/friends', response_model=List[FriendResponse])
+async def my_friends(token_payload: dict = Depends(_verify_access_token)):
+    """The caller's friends with denormalized accountName/email and `since`, sorted by name.
+
+    Served from the friend_lists/{uid} adjacency document maintained when
+    requests are accepted, through a per-user cache.
     """
     if not _firebase_initialized or _firestore_client is None:
         raise HTTPException(status_code=501, detail='Firestore not configured')
+    uid = token_payload.get('sub')
+    try:
+        rows = await _friends_cache.get(uid)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Error loading friends of %s', uid)
+        raise HTTPException(status_code=500, detail='Error fetching friends')
+    return rows
+
+
+def _friend_request_row(summary: dict) -> dict:
+    return {**summary, 'createdAt': _timestamp_iso(summary.get('createdAt'))}
+
+
+def _list_friend_requests(uid: str, field: str, request_status: str, limit: int, after: Optional[dict]) -> list:
+    """Requests where `field` ('receiverId' or 'senderId') is uid, newest first, strictly after `after`."""
+    query = (_firestore_client.collection('friend_requests')
+             .where(field, '==', uid)
+             .where('status', '==', request_status)
+             .order_by('createdAt', direction=firestore.Query.DESCENDING)
+             .order_by('__name__', direction=firestore.Query.DESCENDING))
+    if after is not None:
+        query = query.start_after(after)
+    return [_friend_request_summary(doc.id, doc.to_dict() or {}) for doc in query.limit(limit).stream()]
+
+
+@app.get('/me/friend_requests', response_model=FriendRequestsPage, response_model_exclude_none=True)
+async def my_friend_requests(response: Response, direction: str = 'incoming',
+                             request_status: str = Query('pending', alias='status'),
+                             limit: Optional[int] = None, cursor: Optional[str] = None,
+                             token_payload: dict = Depends(_verify_access_token)):
+    """Badge counters and a page of the caller's friend requests.
+
+    Returns {"counts": {"pending", "sent", "accepted"}, "requests": [...]}.
+    `direction` is incoming (default) or outgoing and `status` one of pending
+    (default), accepted or declined. Pages are newest first, keyset-paginated
+    on (createdAt, request ID) through X-Next-Cursor / `cursor`.
 
+    The counters and the first page usually come from the single
+    friend_inboxes/{uid} document; `limit=0` returns the counters only.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    if direction not in ('incoming', 'outgoing'):
+        raise HTTPException(status_code=400, detail='direction must be incoming or outgoing')
+    if request_status not in ('pending', 'accepted', 'declined'):
+        raise HTTPException(status_code=400, detail='status must be pending, accepted or declined')
+    limit = min(max(FRIEND_REQUESTS_DEFAULT_LIMIT if limit is None else limit, 0), FRIEND_REQUESTS_MAX_LIMIT)
+    position = _decode_cursor(cursor)
+    after = None
+    if position is not None:
+        try:
+            after = {'createdAt': datetime.fromisoformat(position['t']), '__name__': position['id']}
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+
+    uid = token_payload.get('sub')
+    field = 'receiverId' if direction == 'incoming' else 'senderId'
     try:
-        users_ref = _firestore_client.collection('users')
+        with _upstream.time('firestore', 'friend_inboxes.get'):
+            snap = await _firestore_read(_firestore_client.collection('friend_inboxes').document(uid).get)
+        inbox = (snap.to_dict() or {}) if snap.exists else {}
+
+        rows = None
+        if after is None and limit:
+            recent = inbox.get('recent') or []
+            matches = [s for s in recent if s.get(field) == uid and s.get('status') == request_status]
+            # A list shorter than the cap holds every request involving the user
+            complete = len(recent) < FRIEND_INBOX_RECENT
+            if complete or len(matches) >= limit:
+                rows, more = matches[:limit], len(matches) > limit or not complete
+        if rows is None and limit:
+            # One extra row tells whether another page exists
+            rows = await _timed('firestore', 'friend_requests.list',
+                                _firestore_read(_list_friend_requests, uid, field, request_status, limit + 1, after))
+            rows, more = rows[:limit], len(rows) > limit
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Error listing friend requests for %s', uid)
+        raise HTTPException(status_code=500, detail='Error fetching friend requests')
+
+    rows = rows or []
+    next_cursor = None
+    if limit and len(rows) == limit and more:
+        next_cursor = _encode_cursor({'t': _timestamp_iso(rows[-1].get('createdAt')), 'id': rows[-1]['id']})
+    counts = {field: int(inbox.get(field) or 0) for field in ('pending', 'sent', 'accepted')}
+    _set_next_cursor(response, next_cursor)
+    return {'counts': counts, 'requests': [_friend_request_row(r) for r in rows]}
+
+
+def _encode_cursor(position: dict) -> str:
+    """Opaque pagination token for list endpoints (URL-safe base64 of compact JSON)."""
+    raw = json.dumps(position, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _decode_cursor(token: Optional[str]) -> Optional[dict]:
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        position = json.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    return position
+
+
+def _wants_ndjson(request: Request, format: Optional[str]) -> bool:
+    if format:
+        return format.lower() == 'ndjson'
+    return 'application/x-ndjson' in request.headers.get('accept', '')
+
+
+def _list_response(rows, next_cursor: Optional[str]) -> JSONResponse:
+    """Plain JSON list body; the cursor for the next page travels in X-Next-Cursor."""
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+    return JSONResponse(content=rows, headers=headers)
+
+
+def _set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    """X-Next-Cursor for routes that return their body through a response model."""
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+
+
+def _ndjson_response(items) -> StreamingResponse:
+    """Stream an async iterable of rows as NDJSON.
+
+    The iterable may finally yield a ('cursor', token) tuple, sent as a trailing
+    {"nextCursor": ...} line. Errors after the first byte end the stream with an
+    {"error": ...} line since the status code has already been sent.
+    """
+    async def _lines():
+        try:
+            async for item in items:
+                if isinstance(item, tuple):
+                    if item[1]:
+                        yield json.dumps({'nextCursor': item[1]}) + '\n'
+                    continue
+                yield json.dumps(item, default=str) + '\n'
+        except Exception:
+            logger.exception('Error while streaming NDJSON response')
+            yield json.dumps({'error': 'Stream interrupted'}) + '\n'
+
+    return StreamingResponse(_lines(), media_type='application/x-ndjson')
+
+
+async def _search_users_firestore(q: str, limit: int, after: Optional[dict]):
+    """Case-sensitive Firestore prefix search, streamed.
+
+    Yields rows, then a final ('cursor', token) tuple. Account-name matches come
+    first, then email matches for users whose name did not match; both queries
+    are ordered by (field, document id) so a cursor can resume either one.
+    """
+    # For prefix queries, use range trick: field >= q and field <= q + '\uf8ff'
+    end = q + '\uf8ff'
+    users_ref = _firestore_client.collection('users')
+    remaining = limit
+    for phase, field in enumerate(('accountName', 'email')):
+        if after is not None and phase < after['p']:
+            continue
+        query = users_ref.where(field, '>=', q).where(field, '<=', end).order_by(field).order_by('__name__')
+        if after is not None and phase == after['p']:
+            query = query.start_after({field: after['v'], '__name__': after['id']})
+        query_limit = remaining
+        scanned = 0
+        async for doc in _aiter_firestore_stream(query.limit(query_limit).stream(), lane='search',
+                                                  operation=f'users.search.{field}'):
+            scanned += 1
+            data = doc.to_dict() or {}
+            position = {'src': 'fs', 'q': q, 'p': phase, 'v': data.get(field), 'id': doc.id}
+            if phase == 1 and (data.get('accountName') or '').startswith(q):
+                # already returned by the accountName query
+                continue
+            remaining -= 1
+            yield {'userId': doc.id, 'accountName': data.get('accountName'), 'email': data.get('email')}
+        if scanned == query_limit:
+            # this query may have more documents: resume it on the next page
+            yield ('cursor', _encode_cursor(position))
+            return
+    yield ('cursor', None)
+
+
+@app.get('/users/search', response_model=List[UserSearchResult])
+async def users_search(request: Request, response: Response, query: str, limit: int = SEARCH_DEFAULT_LIMIT,
+                       cursor: Optional[str] = None, format: Optional[str] = None):
+    """Search users by accountName or email using prefix matching.
+
+    Served from the in-process search index (case-insensitive, ranked) once it
+    has loaded. Until then, falls back to Firestore range queries, which are
+    case-sensitive: Firestore does not support arbitrary substring or
+    case-insensitive matching efficiently.
+
+    Paging: pass the `X-Next-Cursor` response header back as `cursor`.
+    `format=ndjson` (or Accept: application/x-ndjson) streams one row per line
+    followed by a {"nextCursor": ...} line when there are more results.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured on the backend')
+
+    q = (query or '').strip()
+    if not q:
+        return []
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    after = _decode_cursor(cursor)
+    if after is not None:
+        required = {'p', 'k'} if after.get('src') == 'idx' else {'p', 'v', 'id'}
+        if not required <= after.keys():
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+        if after.get('q') != q:
+            raise HTTPException(status_code=400, detail='Cursor does not match query')
+    ndjson = _wants_ndjson(request, format)
+
+    if _search_index.ready and (after is None or after.get('src') == 'idx'):
+        rows, position = _search_index.search_page(q, limit, (after['p'], after['k']) if after else None)
+        next_cursor = _encode_cursor({'src': 'idx', 'q': q, 'p': position[0], 'k': position[1]}) if position else None
+        if not ndjson:
+            _set_next_cursor(response, next_cursor)
+            return rows
+
+        async def _rows():
+            for row in rows:
+                yield row
+            yield ('cursor', next_cursor)
+        return _ndjson_response(_rows())
+
+    if after is not None and after.get('src') != 'fs':
+        raise HTTPException(status_code=400, detail='Cursor expired; restart the search')
+
+    if ndjson:
+        return _ndjson_response(_search_users_firestore(q, limit, after))
+
+    async def _collect():
+        results = []
+        next_cursor = None
+        async for item in _search_users_firestore(q, limit, after):
+            if isinstance(item, tuple):
+                next_cursor = item[1]
+            else:
+                results.append(item)
+        return results, next_cursor
 
-        import asyncio
-        loop = asyncio.get_event_loop()
+    try:
+        results, next_cursor = await _search_flight.do(('users.search', q, limit, cursor or ''), _collect,
+                                                       ttl=SEARCH_COALESCE_TTL)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Error querying Firestore for users')
+        raise HTTPException(status_code=500, detail='Error querying Firestore')
+    _set_next_cursor(response, next_cursor)
+    return results
+
+
+class _StreamFailure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_STREAM_END = object()
+
+
+async def _aiter_firestore_stream(stream, buffer_size: Optional[int] = None, lane: str = 'search',
+                                  operation: str = 'stream'):
+    """Iterate a blocking Firestore stream from async code without loading it all.
+
+    A worker thread (from the datastore pool, in `lane`) pulls documents from
+    the generator and hands them to the event loop through a queue holding at
+    most `buffer_size` documents; when the consumer falls behind, the worker
+    blocks (backpressure). If the consumer stops early, the worker stops pulling
+    and closes the underlying stream.
+
+    The whole iteration is recorded as the upstream call ('firestore', `operation`),
+    so its latency includes time the consumer spends between documents.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(buffer_size or FIRESTORE_STREAM_BUFFER)
+    stop = threading.Event()
+
+    def _deliver(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # event loop already closed
+            stop.set()
+
+    def _pump():
+        # Errors propagate to the executor (and its breaker); _pump_done hands them to the consumer.
+        try:
+            for doc in stream:
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                _deliver(doc)
+        finally:
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    logger.debug('Failed to close Firestore stream', exc_info=True)
+        _deliver(_STREAM_END)
+
+    def _pump_done(task):
+        # Stream errors, and admission failures (overload, open breaker) that never reach the pump.
+        if not task.cancelled() and task.exception() is not None:
+            queue.put_nowait(_StreamFailure(task.exception()))
+
+    pump = loop.create_task(_datastore.run(_pump, lane=lane, timeout=None))
+    pump.add_done_callback(_pump_done)
+    try:
+        with _upstream.time('firestore', operation):
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), resilience.clip(None))
+                except asyncio.TimeoutError:
+                    raise DeadlineExceeded() from None
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, _StreamFailure):
+                    raise item.error
+                slots.release()
+                yield item
+    finally:
+        stop.set()
+
+
+def _profile_body(uid: str, data: dict) -> dict:
+    """Public view of a users/{uid} document, as returned by /users/{uid} and /users:batchGet."""
+    return {'uid': uid, 'email': data.get('email'), 'accountName': data.get('accountName')}
+
+
+async def _get_all_profiles(uids: List[str]) -> dict:
+    """Resolve uids with one Firestore get_all per chunk, chunks fetched concurrently.
+
+    Returns uid -> UserProfile (or None when missing) and primes the profile cache.
+    """
+    users_ref = _firestore_client.collection('users')
+
+    def _fetch(chunk):
+        refs = [users_ref.document(uid) for uid in chunk]
+        return list(_firestore_client.get_all(refs))
+
+    chunks = [uids[i:i + BATCH_GET_CHUNK_SIZE] for i in range(0, len(uids), BATCH_GET_CHUNK_SIZE)]
+    results = await asyncio.gather(*(_timed('firestore', 'users.get_all', _firestore_read(_fetch, chunk))
+                                     for chunk in chunks))
+
+    found = {uid: None for uid in uids}
+    for snapshots in results:
+        for doc in snapshots:
+            if doc.exists:
+                found[doc.id] = UserProfile(doc.to_dict() or {}, getattr(doc, 'update_time', None))
+    for uid, profile in found.items():
+        _profile_cache.set(uid, profile)
+    return found
+
+
+async def _get_profiles(uids: List[str]) -> dict:
+    """uid -> UserProfile (None when missing): cached entries first, the rest via get_all."""
+    profiles = {}
+    to_fetch = []
+    for uid in uids:
+        cached = _profile_cache.peek(uid, _NOT_CACHED)
+        if cached is _NOT_CACHED:
+            to_fetch.append(uid)
+        else:
+            profiles[uid] = cached
+    if to_fetch:
+        profiles.update(await _get_all_profiles(to_fetch))
+    return profiles
+
+
+def _etag_for(body: dict) -> str:
+    digest = hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since (RFC 9110: If-None-Match wins when present)."""
+    inm = request.headers.get('if-none-match')
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(',')]
+        return '*' in tags or any(t.removeprefix('W/') == etag for t in tags)
+    ims = request.headers.get('if-modified-since')
+    if ims and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+@app.post('/users:batchGet', response_model=BatchGetUsersResponse)
+async def batch_get_users(req: BatchGetUsersRequest):
+    """Resolve many users in one call.
+
+    Body: {"uids": ["...", ...]} (at most BATCH_GET_MAX_UIDS).
+    Returns {"users": {uid: {uid, email, accountName}}, "notFound": [uid, ...]}.
+    Cached profiles are served from memory; the rest are read with Firestore get_all.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
 
-        def _get_doc():
-            return users_ref.document(uid).get()
+    uids = list(dict.fromkeys(u.strip() for u in req.uids if u and u.strip()))
+    if len(uids) > BATCH_GET_MAX_UIDS:
+        raise HTTPException(status_code=400, detail=f'At most {BATCH_GET_MAX_UIDS} uids per request')
 
-        doc = await loop.run_in_executor(None, _get_doc)
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail='User not found')
-        data = doc.to_dict()
-        return {'uid': uid, 'email': data.get('email'), 'accountName': data.get('accountName')}
+    try:
+        profiles = await _get_profiles(uids)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Error batch-fetching %s users from Firestore', len(uids))
+        raise HTTPException(status_code=500, detail='Error fetching users')
+
+    users = {}
+    not_found = []
+    for uid in uids:
+        profile = profiles.get(uid)
+        if profile is None:
+            not_found.append(uid)
+        else:
+            users[uid] = _profile_body(uid, profile.data)
+    return {'users': users, 'notFound': not_found}
+
+
+@app.get('/users/{uid}', response_model=UserResponse)
+async def get_user_by_uid(uid: str, request: Request, response: Response):
+    """Return user document stored in Firestore at users/{uid}.
+
+    Returns 404 if not found. Requires Firestore to be configured.
+    Responses carry ETag/Last-Modified; conditional requests get a 304.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+
+    try:
+        profile = await _profile_cache.get(uid)
     except HTTPException:
         raise
     except Exception:
         logger.exception('Error fetching user %s from Firestore', uid)
         raise HTTPException(status_code=500, detail='Error fetching user')
+    if profile is None:
+        raise HTTPException(status_code=404, detail='User not found')
+
+    body = _profile_body(uid, profile.data)
+    etag = _etag_for(body)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if profile.updated is not None:
+        headers['Last-Modified'] = format_datetime(profile.updated.astimezone(timezone.utc), usegmt=True)
+    if _not_modified(request, etag, profile.updated):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return body
+
+
+def _timestamp_iso(value) -> Optional[str]:
+    return value.isoformat() if isinstance(value, datetime) else None
+
+
+def _timestamp_seconds(value) -> float:
+    return value.timestamp() if isinstance(value, datetime) else 0.0
+
+
+def _list_chats(uid: str) -> list:
+    query = _firestore_client.collection('chats').where('participants', 'array_contains', uid)
+    return list(query.stream())
+
+
+def _message_row(doc) -> dict:
+    data = doc.to_dict() or {}
+    return {
+        'id': doc.id,
+        'senderId': data.get('senderId'),
+        'text': data.get('text'),
+        'timestamp': data.get('timestamp'),
+    }
+
+
+def _last_message(chat_id: str) -> Optional[dict]:
+    query = (_firestore_client.collection('chats').document(chat_id).collection('messages')
+             .order_by('timestamp', direction=firestore.Query.DESCENDING).limit(1))
+    for doc in query.stream():
+        return _message_row(doc)
+    return None
+
+
+async def _load_inbox(uid: str) -> list:
+    """All of `uid`'s chats, most recently active first, each with its last message and peer profile.
+
+    One query for the chats, one `limit(1)` query per chat (at most
+    CHAT_INBOX_FANOUT in flight for this request) and one batched profile read
+    for all peers.
+    """
+    chats = await _firestore_read(_list_chats, uid)
+    fanout = asyncio.Semaphore(CHAT_INBOX_FANOUT)
+
+    async def _last(chat_id):
+        async with fanout:
+            return await _firestore_read(_last_message, chat_id)
+
+    last_messages = await asyncio.gather(*(_last(doc.id) for doc in chats))
+
+    peers = {}
+    for doc in chats:
+        participants = [p for p in ((doc.to_dict() or {}).get('participants') or []) if isinstance(p, str)]
+        peers[doc.id] = next((p for p in participants if p != uid), None)
+    profiles = await _get_profiles(list({p for p in peers.values() if p}))
+
+    inbox = []
+    for doc, last in zip(chats, last_messages):
+        data = doc.to_dict() or {}
+        peer = peers[doc.id]
+        profile = profiles.get(peer) if peer else None
+        activity = last['timestamp'] if last is not None else data.get('createdAt')
+        if last is not None:
+            last = {**last, 'timestamp': _timestamp_iso(last['timestamp'])}
+        inbox.append({
+            'chatId': doc.id,
+            'participants': data.get('participants') or [],
+            'createdAt': _timestamp_iso(data.get('createdAt')),
+            'lastMessage': last,
+            'peer': _profile_body(peer, profile.data) if profile is not None else None,
+            '_activity': _timestamp_seconds(activity),
+        })
+    inbox.sort(key=lambda c: (-c['_activity'], c['chatId']))
+    return inbox
+
+
+# uid -> assembled inbox; sending a message through POST /chats/{chatId}/messages
+# invalidates every participant's entry, otherwise entries live CHAT_INBOX_CACHE_TTL seconds.
+_inbox_cache = ReadThroughCache(_load_inbox, CHAT_INBOX_CACHE_SIZE, CHAT_INBOX_CACHE_TTL, CHAT_INBOX_CACHE_TTL)
+
+
+@app.get('/me/chats')
+async def list_my_chats(limit: Optional[int] = None, cursor: Optional[str] = None,
+                        token_payload: dict = Depends(_verify_access_token)):
+    """The caller's chats, most recently active first.
+
+    Each row carries the chat's last message and the other participant's
+    profile. Pages are `limit` rows; the cursor for the next page is returned
+    in X-Next-Cursor and passed back as `cursor`.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    uid = token_payload.get('sub')
+    if not uid:
+        raise HTTPException(status_code=401, detail='Token has no subject')
+
+    limit = min(max(limit or CHAT_INBOX_DEFAULT_LIMIT, 1), CHAT_INBOX_MAX_LIMIT)
+    after = _decode_cursor(cursor)
+    if after is not None and not (isinstance(after.get('t'), (int, float)) and isinstance(after.get('id'), str)):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+    try:
+        inbox = await _inbox_cache.get(uid)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Error assembling chat inbox for %s', uid)
+        raise HTTPException(status_code=500, detail='Error fetching chats')
+
+    start = 0
+    if after is not None:
+        position = (-after['t'], after['id'])
+        start = next((i for i, c in enumerate(inbox) if (-c['_activity'], c['chatId']) > position), len(inbox))
+    page = inbox[start:start + limit]
+    next_cursor = None
+    if start + limit < len(inbox):
+        last = page[-1]
+        next_cursor = _encode_cursor({'t': last['_activity'], 'id': last['chatId']})
+    return _list_response([{k: v for k, v in c.items() if k != '_activity'} for c in page], next_cursor)
+
+
+def _add_chat_message(chat_id: str, sender: str, text: str):
+    """Append a message; returns (message_id, participants), or None when the chat does not exist."""
+    chat_ref = _firestore_client.collection('chats').document(chat_id)
+    chat = chat_ref.get()
+    if not chat.exists:
+        return None
+    participants = (chat.to_dict() or {}).get('participants') or []
+    if sender not in participants:
+        return None, participants
+    _, message_ref = chat_ref.collection('messages').add({
+        'senderId': sender,
+        'text': text,
+        'timestamp': firestore.SERVER_TIMESTAMP,
+    })
+    return message_ref.id, participants
+
+
+@app.post('/chats/{chat_id}/messages')
+async def send_chat_message(chat_id: str, req: ChatMessageCreate, token_payload: dict = Depends(_verify_access_token)):
+    """Send a message as the authenticated user and refresh the participants' inboxes."""
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    sender = token_payload.get('sub')
+    text = (req.text or '').strip()
+    if not text:
+        raise HTTPException(status_code=400, detail='text is required')
+
+    try:
+        result = await _datastore.run(_add_chat_message, chat_id, sender, text, lane='write')
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Failed to send message in chat %s', chat_id)
+        raise HTTPException(status_code=500, detail='Failed to send message')
+    if result is None:
+        raise HTTPException(status_code=404, detail='Chat not found')
+    message_id, participants = result
+    if message_id is None:
+        raise HTTPException(status_code=403, detail='Not a participant of this chat')
+
+    for uid in participants:
+        _inbox_cache.invalidate(uid)
+    return JSONResponse(status_code=201, content={'messageId': message_id})
+
+
+def _direct_chat_id(a: str, b: str) -> str:
+    """Canonical ID of the one-to-one chat between `a` and `b` (order-independent).
+
+    A digest of the JSON-encoded sorted pair: joining the uids with any
+    character would be ambiguous for uids containing it ('a_b' + 'c' vs
+    'a' + 'b_c'), and '/' cannot appear in a document ID.
+    """
+    return hashlib.sha256(json.dumps(sorted((a, b))).encode('utf-8')).hexdigest()
+
+
+def _indexed_chat_id(data: dict, participants: list) -> str:
+    """chatId of a direct_chats entry, after checking it belongs to `participants` (sorted)."""
+    if sorted(data.get('participants') or []) != participants or not data.get('chatId'):
+        logger.error('direct_chats entry %s does not match pair %s', data, participants)
+        raise HTTPException(status_code=500, detail='Direct chat index is inconsistent')
+    return data['chatId']
+
+
+def _lookup_direct_chat(pair_id: str, participants: list) -> Optional[str]:
+    snap = _firestore_client.collection('direct_chats').document(pair_id).get()
+    return _indexed_chat_id(snap.to_dict() or {}, participants) if snap.exists else None
+
+
+def _get_or_create_direct_chat_txn(a: str, b: str):
+    """Return (chat_id, created) for the pair, creating chats/{pairId} in a transaction (blocking).
+
+    direct_chats/{pairId} maps the pair to its chat. New chats use the pair ID
+    itself; chats created before the index existed are linked by
+    migrations/backfill_direct_chats.py.
+    """
+    pair_id = _direct_chat_id(a, b)
+    index_ref = _firestore_client.collection('direct_chats').document(pair_id)
+    chat_ref = _firestore_client.collection('chats').document(pair_id)
+    participants = sorted((a, b))
+
+    @firestore.transactional
+    def _create(transaction):
+        snap = index_ref.get(transaction=transaction)
+        if snap.exists:
+            return _indexed_chat_id(snap.to_dict() or {}, participants), False
+        transaction.set(chat_ref, {'participants': participants, 'createdAt': firestore.SERVER_TIMESTAMP})
+        transaction.set(index_ref, {'chatId': pair_id, 'participants': participants})
+        return pair_id, True
+
+    return _create(_firestore_client.transaction())
+
+
+@app.post('/chats/direct')
+async def get_or_create_direct_chat(req: DirectChatCreate, token_payload: dict = Depends(_verify_access_token)):
+    """Return the caller's one-to-one chat with `peerId`, creating it if needed.
+
+    Responds 200 with {"chatId", "created": false} for an existing chat and 201
+    when it was just created. Concurrent callers always get the same chat.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    uid = token_payload.get('sub')
+    peer = (req.peerId or '').strip()
+    if not uid or not peer:
+        raise HTTPException(status_code=400, detail='peerId is required')
+    if peer == uid:
+        raise HTTPException(status_code=400, detail='Cannot start a chat with yourself')
+
+    pair_id = _direct_chat_id(uid, peer)
+    try:
+        # Existing chats (the common case) cost one point read and no transaction.
+        chat_id = await _firestore_read(_lookup_direct_chat, pair_id, sorted((uid, peer)))
+        created = False
+        if chat_id is None:
+            chat_id, created = await _datastore.run(_get_or_create_direct_chat_txn, uid, peer, lane='write')
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Failed to get or create chat between %s and %s', uid, peer)
+        raise HTTPException(status_code=500, detail='Failed to get or create chat')
+
+    if created:
+        _inbox_cache.invalidate(uid)
+        _inbox_cache.invalidate(peer)
+    return JSONResponse(status_code=201 if created else 200, content={'chatId': chat_id, 'created': created})
+
+
+def _chat_participants(chat_id: str) -> Optional[list]:
+    snap = _firestore_client.collection('chats').document(chat_id).get()
+    return ((snap.to_dict() or {}).get('participants') or []) if snap.exists else None
+
+
+async def _require_participant(chat_id: str, uid: str) -> None:
+    participants = await _firestore_read(_chat_participants, chat_id)
+    if participants is None:
+        raise HTTPException(status_code=404, detail='Chat not found')
+    if uid not in participants:
+        raise HTTPException(status_code=403, detail='Not a participant of this chat')
+
+
+def _list_messages(chat_id: str, limit: int, after: Optional[dict]) -> list:
+    """Up to `limit` messages, newest first, strictly older than `after` ({'timestamp', '__name__'})."""
+    query = (_firestore_client.collection('chats').document(chat_id).collection('messages')
+             .order_by('timestamp', direction=firestore.Query.DESCENDING)
+             .order_by('__name__', direction=firestore.Query.DESCENDING))
+    if after is not None:
+        query = query.start_after(after)
+    return [_message_row(doc) for doc in query.limit(limit).stream()]
+
+
+@app.get('/chats/{chat_id}/messages')
+async def list_chat_messages(chat_id: str, limit: Optional[int] = None, cursor: Optional[str] = None,
+                             token_payload: dict = Depends(_verify_access_token)):
+    """A page of the chat's history, newest first.
+
+    Keyset-paginated on (timestamp, message ID): X-Next-Cursor points at the
+    last message of the page and is passed back as `cursor` for older messages.
+    New messages are delivered over the chat's WebSocket instead.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    limit = min(max(limit or CHAT_HISTORY_DEFAULT_LIMIT, 1), CHAT_HISTORY_MAX_LIMIT)
+    position = _decode_cursor(cursor)
+    after = None
+    if position is not None:
+        try:
+            after = {'timestamp': datetime.fromisoformat(position['t']), '__name__': position['id']}
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail='Invalid cursor')
+
+    await _require_participant(chat_id, token_payload.get('sub'))
+    try:
+        rows = await _firestore_read(_list_messages, chat_id, limit, after)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Error listing messages of chat %s', chat_id)
+        raise HTTPException(status_code=500, detail='Error fetching messages')
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = _encode_cursor({'t': rows[-1]['timestamp'].isoformat(), 'id': rows[-1]['id']})
+    for row in rows:
+        row['timestamp'] = _timestamp_iso(row['timestamp'])
+    return _list_response(rows, next_cursor)
+
+
+def _watch_new_messages(chat_id: str, emit):
+    """ChatHub source: listen for messages written from now on; returns the stop callable."""
+    query = (_firestore_client.collection('chats').document(chat_id).collection('messages')
+             .where('timestamp', '>=', datetime.now(timezone.utc)))
+
+    def _on_snapshot(docs, changes, read_time):
+        rows = []
+        for change in changes:
+            if change.type.name == 'ADDED':
+                row = _message_row(change.document)
+                row['timestamp'] = _timestamp_iso(row['timestamp'])
+                rows.append(row)
+        if rows:
+            emit(rows)
+
+    return query.on_snapshot(_on_snapshot).unsubscribe
+
+
+# One Firestore listener per chat with connected clients, shared by all of them
+_chat_hub = ChatHub(_watch_new_messages, CHAT_WS_BUFFER)
+
+
+@app.websocket('/chats/{chat_id}/ws')
+async def chat_messages_ws(websocket: WebSocket, chat_id: str, token: Optional[str] = None):
+    """Push messages sent to the chat after the connection opened, one JSON object per frame.
+
+    Authenticate with an `Authorization: Bearer <token>` header or, for clients
+    that cannot set headers, `?token=<token>`. A client that falls more than
+    CHAT_WS_BUFFER messages behind is disconnected with code 1013 and should
+    reconnect and fetch the gap from GET /chats/{id}/messages.
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        await websocket.close(code=1011)
+        return
+    try:
+        token_payload = await _verify_access_token(None, websocket.headers.get('authorization') or token)
+        await _require_participant(chat_id, token_payload.get('sub'))
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    try:
+        subscription = await _chat_hub.subscribe(chat_id)
+    except Exception:
+        logger.exception('Failed to listen for messages of chat %s', chat_id)
+        await websocket.close(code=1011)
+        return
+
+    async def _send():
+        async for message in subscription:
+            await websocket.send_json(message)
+
+    async def _receive():
+        # Clients do not send anything; this only notices the disconnect.
+        while True:
+            if (await websocket.receive())['type'] == 'websocket.disconnect':
+                return
+
+    tasks = [asyncio.ensure_future(_send()), asyncio.ensure_future(_receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
+    if subscription.dropped:
+        try:
+            await websocket.close(code=1013)
+        except (RuntimeError, WebSocketDisconnect):
+            pass
+
+async def _require_admin(token_payload: dict = Depends(_verify_access_token)) -> dict:
+    """Dependency: the caller's uid must be listed in ADMIN_UIDS."""
+    if token_payload.get('sub') not in ADMIN_UIDS:
+        raise HTTPException(status_code=403, detail='Admin access required')
+    return token_payload
+
+
+class _ImportRowError(ValueError):
+    pass
+
+
+_bulk_imports = set()
+
+
+async def _upload_lines(request: Request):
+    """Yield the lines of the request body as they arrive, without buffering the whole upload."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+async def _import_rows(request: Request):
+    """Yield (row number, row dict or _ImportRowError) from an NDJSON or CSV upload.
+
+    CSV needs a header with `email` and `password` columns (`accountName` is
+    optional) and one record per line. Blank lines are skipped.
+    """
+    is_csv = request.headers.get('content-type', '').split(';')[0].strip().lower() == 'text/csv'
+    columns = None
+    number = 0
+    async for line in _upload_lines(request):
+        if not line.strip():
+            continue
+        if is_csv and columns is None:
+            columns = [c.strip() for c in next(csv.reader([line]))]
+            if 'email' not in columns or 'password' not in columns:
+                raise HTTPException(status_code=400, detail='CSV header must include email and password')
+            continue
+        number += 1
+        try:
+            if is_csv:
+                values = next(csv.reader([line]))
+                if len(values) != len(columns):
+                    raise _ImportRowError(f'Expected {len(columns)} fields, got {len(values)}')
+                row = dict(zip(columns, values))
+            else:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    raise _ImportRowError('Invalid JSON')
+                if not isinstance(row, dict):
+                    raise _ImportRowError('Expected a JSON object')
+            if row.get('accountName') == '':
+                # empty CSV cell
+                row['accountName'] = None
+            try:
+                yield number, ImportRow(**row)
+            except ValidationError as e:
+                raise _ImportRowError('; '.join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                                                for err in e.errors()))
+        except _ImportRowError as e:
+            yield number, e
+
+
+class _UserImport:
+    """One bulkImport run.
+
+    Sign-ups run concurrently (at most BULK_IMPORT_CONCURRENCY in flight) and
+    their profiles are written with one WriteBatch commit per
+    BULK_IMPORT_BATCH_SIZE accounts. As in /register, a failed profile write
+    deletes the accounts it was for, here per batch. Results are queued as
+    NDJSON lines for the response.
+
+    The response starts once the upload has been read, so lines produced
+    before that are held (at most one per row). After that at most
+    BULK_IMPORT_RESULT_BUFFER lines are queued: a client reading slowly
+    pauses the rest of the import instead of buffering its results. If the
+    client goes away, the import finishes without it.
+    """
+
+    def __init__(self):
+        self._slots = asyncio.Semaphore(BULK_IMPORT_CONCURRENCY)
+        self._sign_ups = set()
+        self._commits = set()
+        self._batch = []
+        self._backlog = collections.deque()
+        self._lines: asyncio.Queue = asyncio.Queue(BULK_IMPORT_RESULT_BUFFER)
+        self._streaming = False
+        self._detached = False
+        self.summary = {'rows': 0, 'created': 0, 'failed': 0}
+
+    async def _put(self, line: Optional[str]) -> None:
+        if self._detached:
+            return
+        if self._streaming:
+            await self._lines.put(line)
+        else:
+            self._backlog.append(line)
+
+    async def _emit(self, item: dict) -> None:
+        await self._put(json.dumps(item) + '\n')
+
+    async def _fail(self, number: int, email, error: str) -> None:
+        self.summary['failed'] += 1
+        await self._emit({'row': number, 'email': email, 'status': 'failed', 'error': error})
+
+    async def submit(self, number: int, row) -> None:
+        """Start the sign-up for a parsed row; waits while BULK_IMPORT_CONCURRENCY sign-ups are in flight."""
+        self.summary['rows'] += 1
+        if isinstance(row, Exception):
+            await self._fail(number, None, str(row))
+            return
+        await self._slots.acquire()
+        task = asyncio.create_task(self._sign_up(number, row))
+        self._sign_ups.add(task)
+        task.add_done_callback(self._sign_ups.discard)
+
+    async def _sign_up(self, number: int, row: ImportRow) -> None:
+        email = row.email
+        try:
+            resp = await _identity_toolkit_post('signUp', {'email': email, 'password': row.password,
+                                                           'returnSecureToken': True})
+            if resp.status_code == 200:
+                data = resp.json()
+        except httpx.RequestError as e:
+            await self._fail(number, email, f'Error contacting Firebase: {e}')
+            return
+        except HTTPException as e:
+            # Identity Toolkit breaker open
+            await self._fail(number, email, e.detail)
+            return
+        except ValueError:
+            await self._fail(number, email, 'Failed to parse response from Firebase')
+            return
+        except Exception:
+            logger.exception('Bulk import sign-up failed for row %s', number)
+            await self._fail(number, email, 'Registration failed')
+            return
+        finally:
+            self._slots.release()
+        if resp.status_code != 200:
+            try:
+                msg = resp.json().get('error', {}).get('message', '')
+            except Exception:
+                msg = resp.text
+            await self._fail(number, email, f'Registration failed: {msg}')
+            return
+        if not isinstance(data, dict) or not data.get('localId'):
+            await self._fail(number, email, 'Invalid response from Firebase')
+            return
+        self._batch.append((number, data['localId'], data.get('email') or email, row.accountName or None))
+        if len(self._batch) >= BULK_IMPORT_BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.create_task(self._commit(batch))
+            self._commits.add(task)
+            task.add_done_callback(self._commits.discard)
+
+    async def _commit(self, batch) -> None:
+        def _write():
+            users_ref = _firestore_client.collection('users')
+            write_batch = _firestore_client.batch()
+            for _, uid, email, account_name in batch:
+                write_batch.set(users_ref.document(uid), {
+                    'uid': uid,
+                    'email': email,
+                    'accountName': account_name,
+                    'createdAt': firestore.SERVER_TIMESTAMP,
+                })
+            write_batch.commit()
+
+        try:
+            with _upstream.time('firestore', 'users.batch_set'):
+                await _datastore.run(_write, lane='write')
+        except Exception:
+            logger.exception('Failed to write %s imported users to Firestore; rolling back the batch', len(batch))
+            await self._roll_back(batch)
+            return
+        for number, uid, email, account_name in batch:
+            _profile_cache.invalidate(uid)
+            if _search_index.ready:
+                try:
+                    _search_index.upsert(uid, account_name, email)
+                except Exception:
+                    # the account exists either way; the users listener indexes it later
+                    logger.exception('Failed to index imported user %s', uid)
+            self.summary['created'] += 1
+            await self._emit({'row': number, 'email': email, 'status': 'created', 'uid': uid})
+
+    async def _roll_back(self, batch) -> None:
+        """Delete the batch's Firebase Auth accounts (one delete_users call, up to 1000 uids)."""
+        not_deleted = set()
+        try:
+            with _upstream.time('firebase_auth', 'delete_users'):
+                result = await _datastore.run(auth.delete_users, [uid for _, uid, _, _ in batch], lane='auth')
+            not_deleted = {error.index for error in result.errors}
+        except Exception:
+            logger.exception('Failed to delete Firebase users during bulk import rollback')
+            not_deleted = set(range(len(batch)))
+        for index, (number, uid, email, _) in enumerate(batch):
+            if index in not_deleted:
+                logger.error('Imported user %s has no profile and could not be deleted', uid)
+                await self._fail(number, email, 'Failed to persist user data; rollback failed')
+            else:
+                await self._fail(number, email, 'Failed to persist user data; user creation rolled back')
+
+    async def finish(self, error: Optional[str] = None) -> None:
+        """Wait for in-flight sign-ups, commit the last partial batch, then end the result stream."""
+        try:
+            while self._sign_ups:
+                await asyncio.gather(*self._sign_ups)
+            self._flush()
+            while self._commits:
+                await asyncio.gather(*self._commits)
+            if error:
+                await self._emit({'error': error})
+            await self._emit({'summary': self.summary})
+        finally:
+            await self._put(None)
+
+    async def lines(self):
+        self._streaming = True
+        try:
+            while self._backlog:
+                line = self._backlog.popleft()
+                if line is None:
+                    return
+                yield line
+            while True:
+                line = await self._lines.get()
+                if line is None:
+                    return
+                yield line
+        finally:
+            # Client gone (or done): stop queueing and unblock writers waiting for room.
+            self._detached = True
+            self._backlog.clear()
+            while not self._lines.empty():
+                self._lines.get_nowait()
+
+
+@app.post('/admin/users:bulkImport')
+async def bulk_import_users(request: Request, admin: dict = Depends(_require_admin)):
+    """Create accounts and profiles for an NDJSON (default) or CSV (`Content-Type: text/csv`) upload.
+
+    Each row has `email`, `password` and optionally `accountName`, validated
+    as in /register (ImportRow); invalid rows fail individually. The response
+    is NDJSON: one line per row with `status` "created" (with `uid`) or
+    "failed" (with `error`), in completion order, then a `{"summary": ...}` line.
+
+    The upload is parsed as it arrives and sign-ups start immediately; the
+    response starts once the upload has been read, so clients that finish
+    sending before reading (most HTTP/1.1 clients) do not stall.
+    """
+    if not WEB_API_KEY:
+        logger.error('FIREBASE_WEB_API_KEY not configured')
+        raise HTTPException(status_code=500, detail='FIREBASE_WEB_API_KEY not configured')
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+
+    run = _UserImport()
+    error = None
+    # An import runs far longer than REQUEST_TIMEOUT; its sign-ups and commits keep their per-call timeouts.
+    with without_deadline():
+        try:
+            async for number, row in _import_rows(request):
+                if number > BULK_IMPORT_MAX_ROWS:
+                    error = f'Upload exceeds {BULK_IMPORT_MAX_ROWS} rows; the remaining rows were not imported'
+                    break
+                await run.submit(number, row)
+        except (UnicodeDecodeError, ClientDisconnect) as e:
+            # Rows already submitted are still committed (or rolled back) below.
+            logger.warning('Bulk import upload could not be read: %r', e)
+            error = 'Upload could not be read; the remaining rows were not imported'
+        logger.info('Bulk import by uid=%s: %s rows received', admin.get('sub'), run.summary['rows'])
+
+        # Held here so the import completes even if the client goes away mid-response.
+        finishing = asyncio.create_task(run.finish(error))
+    _bulk_imports.add(finishing)
+    finishing.add_done_callback(_bulk_imports.discard)
+    return StreamingResponse(run.lines(), media_type='application/x-ndjson')
+
+
+_point_index = PointIndex(POINT_CELL_DEGREES, POINT_TOMBSTONES)
+_points_watch = None
+
+
+def _point_row_from_doc(uid: str, data: dict):
+    """(uid, lat, lng, updated, accuracy) for a points/{uid} document, or None if it is malformed."""
+    lat, lng, updated = data.get('lat'), data.get('lng'), data.get('updatedAt')
+    if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)) or not isinstance(updated, datetime):
+        return None
+    accuracy = data.get('accuracy')
+    return uid, float(lat), float(lng), updated.timestamp(), accuracy if isinstance(accuracy, (int, float)) else None
+
+
+def _on_points_snapshot(docs, changes, read_time):
+    """Firestore listener callback for `points` (runs on the listener's thread).
+
+    The first snapshot bulk-loads the index; later ones apply changes made by
+    other workers. This worker's own writes come back too and are ignored, as
+    the index already holds them (same updatedAt).
+    """
+    try:
+        if not _point_index.ready:
+            _point_index.load(row for row in (_point_row_from_doc(doc.id, doc.to_dict() or {}) for doc in docs) if row)
+            logger.info('Point index loaded (%s points)', len(_point_index))
+            return
+        for change in changes:
+            doc = change.document
+            if change.type.name == 'REMOVED':
+                _point_index.remove(doc.id, before=read_time.timestamp() if isinstance(read_time, datetime) else None)
+            else:
+                row = _point_row_from_doc(doc.id, doc.to_dict() or {})
+                if row is not None:
+                    _point_index.upsert(*row)
+    except Exception:
+        logger.exception('Failed to apply points snapshot to the point index')
+
+
+def _start_point_index():
+    global _points_watch
+    if not _firebase_initialized or _firestore_client is None:
+        return
+    try:
+        _points_watch = _firestore_client.collection('points').on_snapshot(_on_points_snapshot)
+    except Exception:
+        logger.exception('Failed to start points listener; point queries will answer 503')
+
+
+def _stop_point_index():
+    global _points_watch
+    watch, _points_watch = _points_watch, None
+    if watch is not None:
+        try:
+            watch.unsubscribe()
+        except Exception:
+            logger.debug('Failed to unsubscribe points listener', exc_info=True)
+
+
+class _PointWriter:
+    """Buffers point writes and flushes them to points/{uid} in WriteBatch commits.
+
+    Only each user's latest point (or removal) is kept, so the buffer never
+    holds more than one entry per user and Firestore sees at most one write
+    per user per flush, however often clients publish. Flushes run one at a
+    time, in the order they take the buffer, so an older point can never land
+    after a newer one. Failed commits are put back unless a newer write for
+    the user arrived meanwhile.
+    """
+
+    def __init__(self):
+        # uid -> document to set, or None to delete
+        self._pending = {}
+        self._flushes = set()
+        # held from taking the buffer until its commits finish
+        self._lock = asyncio.Lock()
+        # a size-triggered flush is scheduled but has not taken the buffer yet
+        self._scheduled = False
+        self.written = 0
+        self.coalesced = 0
+
+    def put(self, uid: str, doc: Optional[dict]) -> None:
+        if uid in self._pending:
+            self.coalesced += 1
+        self._pending[uid] = doc
+        if len(self._pending) >= POINT_FLUSH_BATCH and not self._scheduled:
+            self._scheduled = True
+            # Flushes outlive the request that triggered them.
+            with without_deadline():
+                task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def flush(self) -> None:
+        async with self._lock:
+            self._scheduled = False
+            pending, self._pending = self._pending, {}
+            items = list(pending.items())
+            # Chunks of one buffer hold distinct users, so they can commit concurrently
+            await asyncio.gather(*(self._commit(items[start:start + POINT_FLUSH_BATCH])
+                                   for start in range(0, len(items), POINT_FLUSH_BATCH)))
+
+    async def close(self) -> None:
+        """Flush the buffer and wait for flushes already in flight (on shutdown)."""
+        await self.flush()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    async def _commit(self, chunk) -> None:
+        def _write():
+            points_ref = _firestore_client.collection('points')
+            batch = _firestore_client.batch()
+            for uid, doc in chunk:
+                if doc is None:
+                    batch.delete(points_ref.document(uid))
+                else:
+                    batch.set(points_ref.document(uid), doc)
+            batch.commit()
+
+        try:
+            with _upstream.time('firestore', 'points.batch_write'):
+                await _datastore.run(_write, lane='write')
+            self.written += len(chunk)
+        except Exception:
+            logger.exception('Failed to flush %s points; will retry', len(chunk))
+            for uid, doc in chunk:
+                self._pending.setdefault(uid, doc)
+
+    def stats(self) -> dict:
+        return {'pending': len(self._pending), 'written': self.written, 'coalesced': self.coalesced}
+
+
+_point_writer = _PointWriter()
+
+
+async def _flush_points_periodically():
+    while True:
+        await asyncio.sleep(POINT_FLUSH_INTERVAL)
+        if _point_writer.stats()['pending'] and _firestore_client is not None:
+            try:
+                await _point_writer.flush()
+            except Exception:
+                logger.exception('Point flush failed')
+
+
+def _point_body(point, distance: Optional[float] = None) -> dict:
+    body = {
+        'uid': point.uid,
+        'lat': point.lat,
+        'lng': point.lng,
+        'accuracy': point.accuracy,
+        'updatedAt': datetime.fromtimestamp(point.updated, timezone.utc).isoformat(),
+    }
+    if distance is not None:
+        body['distanceKm'] = round(distance, 3)
+    return body
+
+
+def _require_point_index() -> None:
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    if not _point_index.ready:
+        raise HTTPException(status_code=503, detail='Point index loading; retry shortly', headers={'Retry-After': '1'})
+
+
+async def _friend_uids(uid: str) -> frozenset:
+    try:
+        rows = await _friends_cache.get(uid)
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception('Error loading friends of %s', uid)
+        raise HTTPException(status_code=500, detail='Error fetching friends')
+    return frozenset(row['uid'] for row in rows)
+
+
+def _parse_bbox(bbox: Optional[str]):
+    if not bbox:
+        return None
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(v) for v in bbox.split(','))
+    except ValueError:
+        raise HTTPException(status_code=400, detail='bbox must be minLat,minLng,maxLat,maxLng')
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise HTTPException(status_code=400, detail='bbox out of range')
+    return min_lat, min_lng, max_lat, max_lng
+
+
+@app.put('/me/point', status_code=202, response_model=PointResponse, response_model_exclude_none=True)
+async def put_my_point(req: PointUpdate, token_payload: dict = Depends(_verify_access_token)):
+    """Publish the caller's current location.
+
+    Friends querying this worker see it immediately; it is written to
+    points/{uid} with the next buffered flush (within POINT_FLUSH_INTERVAL).
+    """
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    uid = token_payload.get('sub')
+    point = _point_index.upsert(uid, req.lat, req.lng, time.time(), req.accuracy) or _point_index.get(uid)
+    doc = {'lat': point.lat, 'lng': point.lng, 'updatedAt': datetime.fromtimestamp(point.updated, timezone.utc)}
+    if point.accuracy is not None:
+        doc['accuracy'] = point.accuracy
+    _point_writer.put(uid, doc)
+    return _point_body(point)
+
+
+@app.delete('/me/point')
+async def delete_my_point(token_payload: dict = Depends(_verify_access_token)):
+    """Stop sharing the caller's location."""
+    if not _firebase_initialized or _firestore_client is None:
+        raise HTTPException(status_code=501, detail='Firestore not configured')
+    uid = token_payload.get('sub')
+    _point_index.remove(uid)
+    _point_writer.put(uid, None)
+    return {'message': 'Point removed'}
+
+
+@app.get('/me/friends/points', response_model=PointsPage, response_model_exclude_none=True)
+async def my_friends_points(bbox: Optional[str] = None, since: Optional[str] = None,
+                            token_payload: dict = Depends(_verify_access_token)):
+    """Friends' latest points, optionally inside `bbox` (minLat,minLng,maxLat,maxLng).
+
+    Pass the returned `version` back as `since` to receive only what changed:
+    `points` then holds new or moved points and `removed` the uids whose point
+    was removed or left the box. `full` is true when `points` is the complete
+    set instead (first poll, another worker, a changed friend list or bbox, or
+    a `since` too old to answer as a delta); the client replaces its copy.
+    """
+    _require_point_index()
+    box = _parse_bbox(bbox)
+    friends = await _friend_uids(token_payload.get('sub'))
+    # Read before querying, so changes racing with this request are sent again next time, never lost.
+    version = _point_index.version
+    scope = hashlib.blake2b(repr((sorted(friends), box)).encode(), digest_size=8).hexdigest()
+    after = _decode_cursor(since)
+    delta = None
+    if after is not None and after.get('e') == _point_index.epoch and after.get('s') == scope \
+            and isinstance(after.get('v'), int):
+        delta = _point_index.changed_since(after['v'], friends, box)
+    if delta is not None:
+        points, removed = delta
+    elif box is not None:
+        points, removed = _point_index.within(box, friends), []
+    else:
+        points, removed = [p for p in map(_point_index.get, friends) if p is not None], []
+    return {
+        'version': _encode_cursor({'e': _point_index.epoch, 'v': version, 's': scope}),
+        'full': delta is None,
+        'points': [_point_body(p) for p in points],
+        'removed': removed,
+    }
+
+
+@app.get('/me/friends/points:nearest', response_model=List[PointResponse], response_model_exclude_none=True)
+async def my_nearest_friends(lat: float, lng: float, k: int = POINT_NEAREST_DEFAULT_K,
+                             radiusKm: Optional[float] = None, token_payload: dict = Depends(_verify_access_token)):
+    """The k friends nearest to (lat, lng), nearest first, with `distanceKm`."""
+    _require_point_index()
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise HTTPException(status_code=400, detail='lat/lng out of range')
+    k = max(1, min(k, POINT_NEAREST_MAX_K))
+    friends = await _friend_uids(token_payload.get('sub'))
+    return [_point_body(point, distance) for distance, point in _point_index.nearest(lat, lng, k, friends, radiusKm)]
+
 
 # Future: add endpoints to verify token, refresh tokens, use Firebase Admin SDK, etc.
@@ -0,0 +1,262 @@
+"""
+Minimal Prometheus-style metrics: counters, gauges and histograms with labels,
+rendered in the text exposition format (version 0.0.4) by `Registry.render`.
+
+Kept deliberately small so recording stays in the low microseconds: a sample
+is a dict lookup on the label tuple plus a bisect into the bucket bounds.
+Recording is not thread-safe; record from the event loop (values produced on
+worker threads should be handed back to the loop, or exposed through a
+callback gauge that is read at scrape time).
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits (~100µs) to slow upstream calls.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, *labels, value: float) -> None:
+        self._values[labels] = value
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose samples are read from `callback()` at scrape time.
+
+    `callback` returns an iterable of (label_values_tuple, value).
+    """
+
+    def __init__(self, name, documentation, labelnames, callback: Callable[[], Iterable[Tuple[Tuple, float]]],
+                 kind: str = 'gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._callback = callback
+
+    def samples(self):
+        for labels, value in self._callback():
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class _HistogramSeries:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, _HistogramSeries] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _HistogramSeries(len(self.buckets) + 1)
+        # counts are per bucket here and made cumulative when rendered
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series.count if series is not None else 0
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series.counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series.sum)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {series.count}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, labelnames, callback, kind='gauge') -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, callback, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+class DependencyMetrics:
+    """Latency histogram, error counter and in-flight gauge for calls to upstream dependencies."""
+
+    def __init__(self, registry: Registry):
+        self.latency = registry.histogram('upstream_request_duration_seconds',
+                                          'Latency of calls to upstream dependencies.', ('dependency', 'operation'))
+        self.errors = registry.counter('upstream_errors_total',
+                                       'Failed calls to upstream dependencies.', ('dependency', 'operation'))
+        self.in_flight = registry.gauge('upstream_requests_in_flight',
+                                        'Calls to upstream dependencies in progress.', ('dependency',))
+
+    def time(self, dependency: str, operation: str) -> '_Timing':
+        """`with metrics.time('firestore', 'users.get'):` records latency; an Exception counts as an error."""
+        return _Timing(self, dependency, operation)
+
+
+class _Timing:
+    __slots__ = ('_metrics', '_dependency', '_operation', '_start', '_failed')
+
+    def __init__(self, metrics, dependency, operation):
+        self._metrics = metrics
+        self._dependency = dependency
+        self._operation = operation
+        self._failed = False
+
+    def fail(self) -> None:
+        """Count the call as an error even though it returned (e.g. an upstream 5xx)."""
+        self._failed = True
+
+    def __enter__(self):
+        self._metrics.in_flight.inc(self._dependency)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        metrics = self._metrics
+        metrics.latency.observe(time.perf_counter() - self._start, self._dependency, self._operation)
+        metrics.in_flight.dec(self._dependency)
+        # Cancellation and GeneratorExit (a consumer stopping early) are not upstream errors.
+        if self._failed or (exc_type is not None and issubclass(exc_type, Exception)):
+            metrics.errors.inc(self._dependency, self._operation)
+        return False
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route request count, latency and in-flight requests.
+
+    Routes are labelled with their path template (e.g. /users/{uid}), read from
+    the route Starlette stores in the scope, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, registry: Registry):
+        self.app = app
+        self.requests = registry.counter('http_requests_total', 'HTTP requests handled.', ('method', 'route', 'status'))
+        self.latency = registry.histogram('http_request_duration_seconds', 'HTTP request latency.', ('method', 'route'))
+        self.in_flight = registry.gauge('http_requests_in_flight', 'HTTP requests in progress.')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        self.in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight.dec()
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            method = scope['method']
+            self.latency.observe(elapsed, method, path)
+            self.requests.inc(method, path, status)
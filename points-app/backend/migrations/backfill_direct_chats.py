@@ -0,0 +1,110 @@
+"""
+Backfill direct_chats/{pairId} for one-to-one chats created before POST /chats/direct.
+
+Older clients created chats with random IDs, so POST /chats/direct cannot find
+them with a point read until they are indexed. This job streams `chats`, keeps
+every chat with exactly two participants and writes the missing index entries
+in WriteBatch commits. Run it before switching clients to the endpoint.
+
+- The pair ID is the SHA-256 hex digest of the JSON-encoded sorted pair of
+  uids (main._direct_chat_id). Entries keyed by the older '_'-joined IDs are
+  ignored by the backend; re-run this job when upgrading from that scheme.
+- If a pair has several chats (duplicates from the old client-side race), the
+  oldest one (createdAt, then ID) is indexed and the others are reported.
+- Existing index entries are never overwritten, so the job can be re-run.
+
+Usage (from backend/):
+    python migrations/backfill_direct_chats.py [--batch-size 500] [--dry-run]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger('backfill_direct_chats')
+
+# Firestore allows at most 500 writes per batch.
+MAX_BATCH_SIZE = 500
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+def direct_chat_id(a: str, b: str) -> str:
+    # Keep in sync with main._direct_chat_id.
+    return hashlib.sha256(json.dumps(sorted((a, b))).encode('utf-8')).hexdigest()
+
+
+def collect_pairs(db) -> tuple:
+    """Return ({pairId: (createdAt, chatId, participants)}, duplicates) for all one-to-one chats."""
+    pairs = {}
+    duplicates = []
+    for doc in db.collection('chats').stream():
+        participants = (doc.to_dict() or {}).get('participants') or []
+        if len(participants) != 2 or not all(isinstance(p, str) and p for p in participants):
+            continue
+        if participants[0] == participants[1]:
+            continue
+        pair_id = direct_chat_id(*participants)
+        created = (doc.to_dict() or {}).get('createdAt')
+        candidate = (created if isinstance(created, datetime) else _EPOCH, doc.id, sorted(participants))
+        current = pairs.get(pair_id)
+        if current is None:
+            pairs[pair_id] = candidate
+            continue
+        keep, drop = (current, candidate) if current[:2] <= candidate[:2] else (candidate, current)
+        pairs[pair_id] = keep
+        duplicates.append((pair_id, drop[1]))
+    return pairs, duplicates
+
+
+def backfill(db, batch_size: int = MAX_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Write missing direct_chats entries; returns counts."""
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    pairs, duplicates = collect_pairs(db)
+    for pair_id, chat_id in duplicates:
+        logger.warning('Duplicate chat %s for pair %s; not indexed', chat_id, pair_id)
+
+    index = db.collection('direct_chats')
+    pair_ids = sorted(pairs)
+    written = existing = 0
+    for start in range(0, len(pair_ids), batch_size):
+        chunk = pair_ids[start:start + batch_size]
+        refs = [index.document(pair_id) for pair_id in chunk]
+        present = {snap.id for snap in db.get_all(refs) if snap.exists}
+        batch = db.batch()
+        pending = 0
+        for ref, pair_id in zip(refs, chunk):
+            if pair_id in present:
+                existing += 1
+                continue
+            _, chat_id, participants = pairs[pair_id]
+            batch.set(ref, {'chatId': chat_id, 'participants': participants})
+            pending += 1
+        if pending and not dry_run:
+            batch.commit()
+        written += pending
+        logger.info('Processed %s/%s pairs (%s %s)', start + len(chunk), len(pair_ids), written,
+                    'to write' if dry_run else 'written')
+    return {'pairs': len(pair_ids), 'written': written, 'existing': existing, 'duplicates': len(duplicates)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='report what would be written')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    service_account_path = os.path.join(os.path.dirname(__file__), '..', 'secrets', 'firebase-admin.json')
+    firebase_admin.initialize_app(credentials.Certificate(service_account_path))
+    result = backfill(firestore.client(), args.batch_size, args.dry_run)
+    logger.info('Done: %s', result)
+
+
+if __name__ == '__main__':
+    main()
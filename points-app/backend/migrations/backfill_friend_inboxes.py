@@ -0,0 +1,108 @@
+"""
+Build friend_inboxes/{uid} from the existing friend_requests collection.
+
+The backend keeps per-user counters (pending = incoming pending, sent =
+outgoing pending, accepted) and the newest request summaries in
+friend_inboxes, updating them in the same transaction as each request.
+Requests written before that, or directly by older clients, are not counted
+until this job has run. It streams `friend_requests` once, recomputes every
+inbox from scratch and writes them in WriteBatch commits, so it can be re-run
+at any time to repair drift.
+
+Usage (from backend/):
+    python migrations/backfill_friend_inboxes.py [--recent 20] [--batch-size 500] [--dry-run]
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger('backfill_friend_inboxes')
+
+# Firestore allows at most 500 writes per batch.
+MAX_BATCH_SIZE = 500
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+# Keep in sync with main._FRIEND_REQUEST_FIELDS.
+SUMMARY_FIELDS = ('senderId', 'receiverId', 'status', 'createdAt', 'senderDisplayName', 'senderEmail',
+                  'receiverDisplayName', 'receiverEmail')
+
+
+def _summary(request_id: str, data: dict) -> dict:
+    summary = {'id': request_id}
+    summary.update((field, data[field]) for field in SUMMARY_FIELDS if data.get(field) is not None)
+    return summary
+
+
+def _order(summary: dict):
+    created = summary.get('createdAt')
+    return (created if isinstance(created, datetime) else _EPOCH, summary['id'])
+
+
+def collect_inboxes(db, recent: int) -> dict:
+    """Return {uid: inbox document} computed from every friend request."""
+    inboxes = {}
+
+    def inbox(uid):
+        return inboxes.setdefault(uid, {'pending': 0, 'sent': 0, 'accepted': 0, 'recent': []})
+
+    for doc in db.collection('friend_requests').stream():
+        data = doc.to_dict() or {}
+        sender, receiver, status = data.get('senderId'), data.get('receiverId'), data.get('status')
+        if not isinstance(sender, str) or not isinstance(receiver, str) or not sender or not receiver:
+            logger.warning('Skipping friend request %s without sender/receiver', doc.id)
+            continue
+        if status == 'pending':
+            inbox(sender)['sent'] += 1
+            inbox(receiver)['pending'] += 1
+        elif status == 'accepted':
+            inbox(sender)['accepted'] += 1
+            inbox(receiver)['accepted'] += 1
+        summary = _summary(doc.id, data)
+        inbox(sender)['recent'].append(summary)
+        inbox(receiver)['recent'].append(summary)
+
+    for doc in inboxes.values():
+        doc['recent'] = sorted(doc['recent'], key=_order, reverse=True)[:recent]
+    return inboxes
+
+
+def backfill(db, recent: int = 20, batch_size: int = MAX_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Overwrite friend_inboxes for every user with requests; returns counts."""
+    from google.cloud.firestore import SERVER_TIMESTAMP
+
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    inboxes = collect_inboxes(db, recent)
+    collection = db.collection('friend_inboxes')
+    uids = sorted(inboxes)
+    for start in range(0, len(uids), batch_size):
+        chunk = uids[start:start + batch_size]
+        if not dry_run:
+            batch = db.batch()
+            for uid in chunk:
+                batch.set(collection.document(uid), {**inboxes[uid], 'updatedAt': SERVER_TIMESTAMP})
+            batch.commit()
+        logger.info('Processed %s/%s inboxes', start + len(chunk), len(uids))
+    return {'inboxes': len(uids), 'written': 0 if dry_run else len(uids)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--recent', type=int, default=int(os.getenv('FRIEND_INBOX_RECENT', '20')),
+                        help='summaries kept per inbox (FRIEND_INBOX_RECENT)')
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='compute the inboxes without writing them')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    service_account_path = os.path.join(os.path.dirname(__file__), '..', 'secrets', 'firebase-admin.json')
+    firebase_admin.initialize_app(credentials.Certificate(service_account_path))
+    result = backfill(firestore.client(), args.recent, args.batch_size, args.dry_run)
+    logger.info('Done: %s', result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Build friend_lists/{uid} from the accepted requests in friend_requests.
+
+Accepting a request through the backend adds each user to the other's
+friend_lists document, which GET /me/friends serves. Friendships accepted
+before that (or by older clients updating friend_requests directly) are not
+listed until this job has run. It queries the accepted requests once,
+rebuilds every adjacency document and writes them in WriteBatch commits, so
+it can be re-run at any time.
+
+Usage (from backend/):
+    python migrations/backfill_friend_lists.py [--batch-size 500] [--dry-run]
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger('backfill_friend_lists')
+
+# Firestore allows at most 500 writes per batch.
+MAX_BATCH_SIZE = 500
+
+
+def _entry(request_id: str, data: dict, side: str) -> dict:
+    # Keep in sync with main._friend_entry.
+    since = data.get('respondedAt') or data.get('createdAt')
+    entry = {'requestId': request_id}
+    if isinstance(since, datetime):
+        entry['since'] = since
+    if data.get(f'{side}DisplayName'):
+        entry['accountName'] = data[f'{side}DisplayName']
+    if data.get(f'{side}Email'):
+        entry['email'] = data[f'{side}Email']
+    return entry
+
+
+def collect_friend_lists(db) -> dict:
+    """Return {uid: {friendUid: entry}} for every accepted request."""
+    lists = {}
+    for doc in db.collection('friend_requests').where('status', '==', 'accepted').stream():
+        data = doc.to_dict() or {}
+        sender, receiver = data.get('senderId'), data.get('receiverId')
+        if not isinstance(sender, str) or not isinstance(receiver, str) or not sender or not receiver:
+            logger.warning('Skipping friend request %s without sender/receiver', doc.id)
+            continue
+        lists.setdefault(sender, {})[receiver] = _entry(doc.id, data, 'receiver')
+        lists.setdefault(receiver, {})[sender] = _entry(doc.id, data, 'sender')
+    return lists
+
+
+def backfill(db, batch_size: int = MAX_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Overwrite friend_lists for every user with an accepted request; returns counts."""
+    from google.cloud.firestore import SERVER_TIMESTAMP
+
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    lists = collect_friend_lists(db)
+    collection = db.collection('friend_lists')
+    uids = sorted(lists)
+    for start in range(0, len(uids), batch_size):
+        chunk = uids[start:start + batch_size]
+        if not dry_run:
+            batch = db.batch()
+            for uid in chunk:
+                batch.set(collection.document(uid), {'friends': lists[uid], 'updatedAt': SERVER_TIMESTAMP})
+            batch.commit()
+        logger.info('Processed %s/%s friend lists', start + len(chunk), len(uids))
+    friendships = sum(len(friends) for friends in lists.values()) // 2
+    return {'users': len(uids), 'friendships': friendships, 'written': 0 if dry_run else len(uids)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='compute the lists without writing them')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    service_account_path = os.path.join(os.path.dirname(__file__), '..', 'secrets', 'firebase-admin.json')
+    firebase_admin.initialize_app(credentials.Certificate(service_account_path))
+    result = backfill(firestore.client(), args.batch_size, args.dry_run)
+    logger.info('Done: %s', result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Move friend requests stored under random IDs to friend_requests/{senderId}_{receiverId}.
+
+The backend looks requests up with a point read on {senderId}_{receiverId}
+(main._friend_request_id), so requests written by older clients with
+`add()` are invisible to its duplicate check until they are rekeyed. This
+job streams `friend_requests` once and, for every request whose ID does not
+follow the scheme, copies it to its deterministic ID and deletes the old
+document, in WriteBatch commits. Run it once after deploying the backend.
+
+- If several documents map to the same ID (duplicates from the old
+  client-side race, or a request already re-sent through the backend), one
+  is kept: accepted before pending before declined, then the newest
+  createdAt. The others are deleted and reported.
+- Summaries in friend_inboxes and requestIds in friend_lists still carry
+  the old IDs. Re-run backfill_friend_inboxes.py and backfill_friend_lists.py
+  afterwards.
+- Documents already at their deterministic ID are never touched, so the job
+  can be re-run.
+
+Usage (from backend/):
+    python migrations/rekey_friend_requests.py [--batch-size 500] [--dry-run]
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger('rekey_friend_requests')
+
+# Firestore allows at most 500 writes per batch.
+MAX_BATCH_SIZE = 500
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+_STATUS_RANK = {'accepted': 2, 'pending': 1}
+
+
+def friend_request_id(sender: str, receiver: str) -> str:
+    # Keep in sync with main._friend_request_id.
+    return f'{sender}_{receiver}'
+
+
+def _rank(doc_id: str, data: dict):
+    created = data.get('createdAt')
+    return (_STATUS_RANK.get(data.get('status'), 0), created if isinstance(created, datetime) else _EPOCH, doc_id)
+
+
+def collect_moves(db) -> dict:
+    """Return {target ID: (kept (doc ID, data), [doc IDs to delete])} for every ID that needs rekeying."""
+    groups = {}
+    for doc in db.collection('friend_requests').stream():
+        data = doc.to_dict() or {}
+        sender, receiver = data.get('senderId'), data.get('receiverId')
+        if not isinstance(sender, str) or not isinstance(receiver, str) or not sender or not receiver:
+            logger.warning('Skipping friend request %s without sender/receiver', doc.id)
+            continue
+        groups.setdefault(friend_request_id(sender, receiver), []).append((doc.id, data))
+
+    moves = {}
+    for target, docs in groups.items():
+        if all(doc_id == target for doc_id, _ in docs):
+            continue
+        docs.sort(key=lambda item: _rank(*item), reverse=True)
+        moves[target] = (docs[0], [doc_id for doc_id, _ in docs[1:] if doc_id != target])
+    return moves
+
+
+def rekey(db, batch_size: int = MAX_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """Copy legacy requests to their deterministic IDs and delete the originals; returns counts."""
+    batch_size = max(2, min(batch_size, MAX_BATCH_SIZE))
+    moves = collect_moves(db)
+    collection = db.collection('friend_requests')
+    writes = []
+    moved = dropped = 0
+    for target in sorted(moves):
+        (kept_id, data), others = moves[target]
+        if kept_id != target:
+            writes.append(('set', target, data))
+            writes.append(('delete', kept_id, None))
+            moved += 1
+        for doc_id in others:
+            logger.warning('Duplicate friend request %s for %s; deleted', doc_id, target)
+            writes.append(('delete', doc_id, None))
+            dropped += 1
+
+    for start in range(0, len(writes), batch_size):
+        chunk = writes[start:start + batch_size]
+        if not dry_run:
+            batch = db.batch()
+            for op, doc_id, data in chunk:
+                if op == 'set':
+                    batch.set(collection.document(doc_id), data)
+                else:
+                    batch.delete(collection.document(doc_id))
+            batch.commit()
+        logger.info('Processed %s/%s writes', start + len(chunk), len(writes))
+    return {'moved': moved, 'duplicates': dropped, 'written': 0 if dry_run else len(writes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='report what would be moved')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    service_account_path = os.path.join(os.path.dirname(__file__), '..', 'secrets', 'firebase-admin.json')
+    firebase_admin.initialize_app(credentials.Certificate(service_account_path))
+    result = rekey(firestore.client(), args.batch_size, args.dry_run)
+    logger.info('Done: %s', result)
+
+
+if __name__ == '__main__':
+    main()
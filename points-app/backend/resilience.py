@@ -0,0 +1,206 @@
+"""
+Tail-latency protection for upstream calls: request deadlines, hedged reads
+and circuit breakers.
+
+- Deadlines: `DeadlineMiddleware` gives every HTTP request a time budget
+  (optionally shortened by the client's `X-Request-Timeout` header, in seconds)
+  and stores the absolute deadline in a context variable. Upstream call sites
+  use `clip(timeout)` to wait no longer than what is left, so a slow first call
+  cannot make later calls outlive the request. Work that must outlive the
+  request (e.g. a bulk import) runs under `without_deadline()`.
+- Hedging: `hedged(attempt, delay)` starts a second copy of an idempotent read
+  when the first has not answered within `delay` seconds (or failed), and
+  returns whichever succeeds first.
+- Circuit breakers: `CircuitBreaker` opens after `failure_threshold`
+  consecutive upstream failures and then rejects calls with 503 and
+  Retry-After for `reset_timeout` seconds, after which one probe call decides
+  whether it closes again.
+"""
+
+import asyncio
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+
+# Absolute deadline (time.monotonic()) of the request being served, if any.
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=504, detail='Request deadline exceeded')
+
+
+class CircuitOpen(HTTPException):
+    """The dependency's breaker is open; the client should retry after Retry-After seconds."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(status_code=503, detail=f'{name} unavailable; retry later',
+                         headers={'Retry-After': str(retry_after)})
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def clip(timeout: Optional[float]) -> Optional[float]:
+    """`timeout` shortened to the time left before the deadline; raises DeadlineExceeded once it has passed."""
+    left = time_left()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left if timeout is None else min(timeout, left)
+
+
+def deadline_is_binding(timeout: Optional[float]) -> bool:
+    """True if the request deadline, not `timeout`, bounds a call started now."""
+    left = time_left()
+    return left is not None and (timeout is None or left < timeout)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Run the block with at most `seconds` left (an earlier outer deadline still applies)."""
+    candidate = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(candidate if current is None else min(current, candidate))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def without_deadline():
+    """Run the block (and tasks it creates) without the request deadline."""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class DeadlineMiddleware:
+    """Pure ASGI middleware setting the per-request deadline for HTTP requests."""
+
+    def __init__(self, app, default_timeout: float, max_timeout: Optional[float] = None,
+                 header: str = 'x-request-timeout'):
+        self.app = app
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout if max_timeout is not None else default_timeout
+        self.header = header
+
+    def _budget(self, scope) -> float:
+        requested = Headers(scope=scope).get(self.header)
+        if requested:
+            try:
+                value = float(requested)
+            except ValueError:
+                value = 0.0
+            if value > 0:
+                return min(value, self.max_timeout)
+        return self.default_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self.default_timeout <= 0:
+            await self.app(scope, receive, send)
+            return
+        with deadline(self._budget(scope)):
+            await self.app(scope, receive, send)
+
+
+async def hedged(attempt: Callable[[], Awaitable], delay: float, max_attempts: int = 2):
+    """Await `attempt()`, starting another copy after `delay` seconds (or when one fails).
+
+    Only for idempotent reads. Returns the first successful result and cancels
+    the others; if every attempt fails, re-raises the last error.
+    """
+    if delay <= 0 or max_attempts < 2:
+        return await attempt()
+    pending = {asyncio.ensure_future(attempt())}
+    started = 1
+    error = None
+    try:
+        while pending:
+            wait = delay if started < max_attempts else None
+            done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            # HTTPExceptions are local decisions (overload, open breaker, deadline): another copy would fail too.
+            if started < max_attempts and (not done or (not pending and not isinstance(error, HTTPException))):
+                pending.add(asyncio.ensure_future(attempt()))
+                started += 1
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one upstream dependency.
+
+    Callers use `allow()` before the call (raises CircuitOpen while open) and
+    then exactly one of `success()`, `failure()` or `release()` (the call ended
+    without telling anything about the dependency, e.g. it was cancelled or
+    rejected locally).
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._open_until = 0.0
+        self._probing = False
+
+    def allow(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        if self.state == self.OPEN:
+            now = self._clock()
+            if now < self._open_until:
+                self.rejected += 1
+                raise CircuitOpen(self.name, max(1, math.ceil(self._open_until - now)))
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpen(self.name, 1)
+            self._probing = True
+
+    def success(self) -> None:
+        self._probing = False
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.failure_threshold > 0 and (self.state == self.HALF_OPEN or self.failures >= self.failure_threshold):
+            if self.state != self.OPEN:
+                self.opened += 1
+            self.state = self.OPEN
+            self._open_until = self._clock() + self.reset_timeout
+
+    def release(self) -> None:
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {'state': self.state, 'failures': self.failures, 'opened': self.opened, 'rejected': self.rejected}
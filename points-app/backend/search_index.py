@@ -0,0 +1,111 @@
+"""
+In-process prefix index over users' account names and emails.
+
+Each field is kept as a sorted list of "<normalized value>\\0<uid>" strings, so
+a prefix lookup is a bisect followed by a short forward scan, and an update is
+one bisect + insert/delete. Matching is case-insensitive (str.casefold).
+
+Ranking: account-name matches first (an exact name match sorts ahead of longer
+names with that prefix), then email matches for users whose name did not match;
+within each group results are ordered by normalized value, then uid.
+
+The index is thread-safe: main.py feeds it from a Firestore on_snapshot
+listener thread while request handlers query it on the event loop.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Iterable, List, Optional, Tuple
+
+_SEP = '\x00'
+
+
+def normalize(value: Optional[str]) -> str:
+    return (value or '').strip().casefold().replace(_SEP, '')
+
+
+class UserSearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names: List[str] = []
+        self._emails: List[str] = []
+        # uid -> (accountName, email) as stored, used for results and for removing stale keys
+        self._users = {}
+        self.ready = False
+
+    def __len__(self):
+        return len(self._users)
+
+    def load(self, users: Iterable[Tuple[str, Optional[str], Optional[str]]]) -> None:
+        """Replace the contents with (uid, accountName, email) rows and mark the index ready."""
+        records = {uid: (name, email) for uid, name, email in users}
+        names = sorted(f'{normalize(name)}{_SEP}{uid}' for uid, (name, _) in records.items() if normalize(name))
+        emails = sorted(f'{normalize(email)}{_SEP}{uid}' for uid, (_, email) in records.items() if normalize(email))
+        with self._lock:
+            self._users, self._names, self._emails = records, names, emails
+            self.ready = True
+
+    def upsert(self, uid: str, account_name: Optional[str], email: Optional[str]) -> None:
+        with self._lock:
+            self._remove_locked(uid)
+            self._users[uid] = (account_name, email)
+            if normalize(account_name):
+                insort(self._names, f'{normalize(account_name)}{_SEP}{uid}')
+            if normalize(email):
+                insort(self._emails, f'{normalize(email)}{_SEP}{uid}')
+
+    def remove(self, uid: str) -> None:
+        with self._lock:
+            self._remove_locked(uid)
+
+    def _remove_locked(self, uid):
+        old = self._users.pop(uid, None)
+        if old is None:
+            return
+        for keys, value in ((self._names, old[0]), (self._emails, old[1])):
+            if not normalize(value):
+                continue
+            key = f'{normalize(value)}{_SEP}{uid}'
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def search(self, query: str, limit: int) -> List[dict]:
+        """Return up to `limit` ranked matches as {userId, accountName, email} rows."""
+        return self.search_page(query, limit)[0]
+
+    def search_page(self, query: str, limit: int,
+                    after: Optional[Tuple[int, str]] = None) -> Tuple[List[dict], Optional[Tuple[int, str]]]:
+        """Like `search`, resuming strictly after position `after`.
+
+        Returns (rows, next_position); next_position is None when the page was not full.
+        Positions are (group, key) pairs and stay valid across index updates.
+        """
+        prefix = normalize(query)
+        if not prefix or limit <= 0:
+            return [], None
+        results = []
+        position = None
+        with self._lock:
+            for group, keys in enumerate((self._names, self._emails)):
+                if after is not None and group < after[0]:
+                    continue
+                if after is not None and group == after[0]:
+                    i = bisect_right(keys, after[1])
+                else:
+                    i = bisect_left(keys, prefix)
+                while i < len(keys) and len(results) < limit:
+                    key = keys[i]
+                    i += 1
+                    if not key.startswith(prefix):
+                        break
+                    uid = key.rsplit(_SEP, 1)[1]
+                    name, email = self._users[uid]
+                    if group == 1 and normalize(name).startswith(prefix):
+                        # already ranked among the account-name matches
+                        continue
+                    results.append({'userId': uid, 'accountName': name, 'email': email})
+                    position = (group, key)
+                if len(results) >= limit:
+                    return results, position
+        return results, None
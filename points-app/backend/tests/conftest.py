@@ -0,0 +1,62 @@
+"""
+Fixtures for the API tests: the app runs in-process against the fakes in
+bench/fakes.py, without its lifespan (no Firebase credentials, no
+background tasks).
+"""
+
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.join(HERE, '..')
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.join(BACKEND, 'bench'))
+sys.path.insert(0, os.path.join(BACKEND, 'migrations'))
+
+# main reads its configuration at import time
+os.environ.update(LOG_MODE='production', LOG_LEVEL='CRITICAL', SEARCH_INDEX_ENABLED='0',
+                  TOKEN_STORE='memory', ADMIN_UIDS='admin', FIREBASE_WEB_API_KEY='test-key',
+                  JWT_SECRET='test-secret-of-at-least-thirty-two-bytes')
+
+import jwt  # noqa: E402
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import token_store  # noqa: E402
+from fakes import FakeFirestore, FakeIdentityToolkit  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    firestore = FakeFirestore()
+    monkeypatch.setattr(main, '_firestore_client', firestore)
+    monkeypatch.setattr(main, '_firebase_initialized', True)
+    monkeypatch.setattr(main, '_token_store', token_store.MemoryTokenStore())
+    for cache in (main._verified_token_cache, main._profile_cache, main._friends_cache, main._inbox_cache):
+        cache.clear()
+    return firestore
+
+
+@pytest.fixture
+def identity(db, monkeypatch):
+    toolkit = FakeIdentityToolkit(api_key=main.WEB_API_KEY)
+    monkeypatch.setattr(main, '_http_client', main._build_http_client(toolkit.transport()))
+    return toolkit
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(main.app)
+
+
+def auth(uid: str) -> dict:
+    """Authorization header with an access token for `uid`."""
+    token = jwt.encode({'sub': uid, 'exp': int(time.time()) + 600}, main.JWT_SECRET, algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+
+def seed_users(db, *uids):
+    for uid in uids:
+        db.seed('users', uid, {'uid': uid, 'email': f'{uid}@example.com', 'accountName': f'name-{uid}'})
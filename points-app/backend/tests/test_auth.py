@@ -0,0 +1,101 @@
+import pytest
+
+from conftest import auth, seed_users
+
+
+@pytest.fixture
+def account(identity, db):
+    identity.add_user('alice', 'alice@example.com', 'secret-pw', 'alice')
+    identity.add_user('bob', 'bob@example.com', 'secret-pw', 'bob')
+    seed_users(db, 'alice', 'bob')
+
+
+def _login(client, uid='alice'):
+    resp = client.post('/login', json={'email': f'{uid}@example.com', 'password': 'secret-pw'})
+    assert resp.status_code == 200
+    body = resp.json()
+    return {'Authorization': f"Bearer {body['access_token']}"}, body['refresh_token']
+
+
+def _authorized(client, headers):
+    return client.get('/me/friends', headers=headers).status_code == 200
+
+
+def test_logout_revokes_only_that_session(client, account):
+    first, first_refresh = _login(client)
+    second, second_refresh = _login(client)
+    assert _authorized(client, first)
+
+    resp = client.post('/auth/logout', json={'refresh_token': first_refresh}, headers=first)
+    assert resp.status_code == 200
+    assert not _authorized(client, first)
+    assert client.post('/refresh', json={'refresh_token': first_refresh}).status_code == 401
+
+    assert _authorized(client, second)
+    assert client.post('/refresh', json={'refresh_token': second_refresh}).status_code == 200
+
+
+def test_logout_all_revokes_every_session(client, account):
+    first, first_refresh = _login(client)
+    second, second_refresh = _login(client)
+
+    assert client.post('/auth/logout_all', headers=second).status_code == 200
+    for headers, refresh_token in ((first, first_refresh), (second, second_refresh)):
+        assert not _authorized(client, headers)
+        assert client.post('/refresh', json={'refresh_token': refresh_token}).status_code == 401
+
+    third, third_refresh = _login(client)
+    assert _authorized(client, third)
+    assert client.post('/refresh', json={'refresh_token': third_refresh}).status_code == 200
+
+
+def test_refreshed_access_token_is_revoked_with_its_session(client, account):
+    _, refresh_token = _login(client)
+    resp = client.post('/refresh', json={'refresh_token': refresh_token})
+    assert resp.status_code == 200
+    refreshed = {'Authorization': f"Bearer {resp.json()['access_token']}"}
+    assert _authorized(client, refreshed)
+
+    assert client.post('/auth/logout_all', headers=refreshed).status_code == 200
+    assert not _authorized(client, refreshed)
+
+
+def test_logout_with_unknown_refresh_token_revokes_nothing(client, account):
+    headers, _ = _login(client)
+    resp = client.post('/auth/logout', json={'refresh_token': 'not-a-refresh-token'}, headers=headers)
+    assert resp.status_code == 401
+    assert _authorized(client, headers)
+
+
+def test_logout_with_another_users_refresh_token_revokes_nothing(client, account):
+    headers, _ = _login(client)
+    _, bob_refresh = _login(client, 'bob')
+    resp = client.post('/auth/logout', json={'refresh_token': bob_refresh}, headers=headers)
+    assert resp.status_code == 403
+    assert _authorized(client, headers)
+    assert client.post('/refresh', json={'refresh_token': bob_refresh}).status_code == 200
+
+
+def test_repeated_logout_still_revokes_the_access_token(client, account):
+    first, refresh_token = _login(client)
+    assert client.post('/auth/logout', json={'refresh_token': refresh_token}, headers=first).status_code == 200
+    # a second session that still holds the (now revoked) refresh token
+    second, _ = _login(client)
+    assert client.post('/auth/logout', json={'refresh_token': refresh_token}, headers=second).status_code == 200
+    assert not _authorized(client, second)
+
+
+@pytest.mark.parametrize('header', ['', ' ', 'Bearer', 'Bearer ', 'Basic abc', 'Bearer a b', 'Bearer not-a-jwt'])
+def test_logout_rejects_malformed_authorization(client, db, header):
+    resp = client.post('/auth/logout', json={'refresh_token': 'x'}, headers={'Authorization': header})
+    assert resp.status_code == 401
+
+
+def test_logout_without_authorization(client, db):
+    assert client.post('/auth/logout', json={'refresh_token': 'x'}).status_code == 401
+
+
+def test_forged_token_is_rejected(client, db):
+    headers = auth('alice')
+    headers['Authorization'] += 'x'
+    assert not _authorized(client, headers)
@@ -0,0 +1,54 @@
+import json
+
+from conftest import auth
+
+
+def _import(client, body, content_type='application/x-ndjson'):
+    resp = client.post('/admin/users:bulkImport', content=body,
+                       headers={**auth('admin'), 'Content-Type': content_type})
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    summary = lines.pop()['summary']
+    return {line['row']: line for line in lines}, summary
+
+
+def test_requires_admin(client, identity):
+    resp = client.post('/admin/users:bulkImport', content=b'', headers=auth('alice'))
+    assert resp.status_code == 403
+
+
+def test_rows_fail_individually(client, db, identity):
+    identity.add_user('taken', 'taken@example.com', 'pw')
+    rows = [
+        json.dumps({'email': 'new@example.com', 'password': 'pw', 'accountName': '  newbie  '}),
+        '{not json',
+        json.dumps({'email': 'nopassword@example.com'}),
+        json.dumps({'email': 'not-an-email', 'password': 'pw'}),
+        json.dumps({'email': 'number@example.com', 'password': 'pw', 'accountName': 123}),
+        json.dumps({'email': 'short@example.com', 'password': 'pw', 'accountName': 'ab'}),
+        json.dumps({'email': 'taken@example.com', 'password': 'pw'}),
+        json.dumps(['email', 'password']),
+    ]
+    results, summary = _import(client, '\n'.join(rows) + '\n')
+
+    assert summary == {'rows': 8, 'created': 1, 'failed': 7}
+    assert results[1]['status'] == 'created'
+    assert db._docs[f"users/{results[1]['uid']}"]['accountName'] == 'newbie'
+    errors = {row: line['error'] for row, line in results.items() if line['status'] == 'failed'}
+    assert errors[2] == 'Invalid JSON'
+    assert errors[3].startswith('password:')
+    assert errors[4].startswith('email:')
+    assert errors[5].startswith('accountName:')
+    assert errors[6].startswith('accountName:')
+    assert 'EMAIL_EXISTS' in errors[7]
+    assert 8 in errors
+    assert sum(1 for path in db._docs if path.startswith('users/')) == 1
+
+
+def test_csv_upload(client, db, identity):
+    body = 'email,password,accountName\r\none@example.com,pw,\r\ntwo@example.com,pw,"Name, With Comma"\r\n'
+    results, summary = _import(client, body, 'text/csv')
+
+    assert summary == {'rows': 2, 'created': 2, 'failed': 0}
+    assert db._docs[f"users/{results[1]['uid']}"]['accountName'] is None
+    assert db._docs[f"users/{results[2]['uid']}"]['accountName'] == 'Name, With Comma'
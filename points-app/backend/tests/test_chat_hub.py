@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import main
+from chat_hub import ChatHub
+from conftest import auth
+
+
+class BlockingSource:
+    """Upstream listeners whose start and stop block like Firestore's (gRPC stream, thread join)."""
+
+    def __init__(self, start_delay=0.0, stop_delay=0.0, fail=False):
+        self.start_delay = start_delay
+        self.stop_delay = stop_delay
+        self.fail = fail
+        self.emitters = {}
+        self.active = self.max_active = self.started = self.stopped = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, chat_id, emit):
+        time.sleep(self.start_delay)
+        if self.fail:
+            raise RuntimeError('listen failed')
+        with self._lock:
+            self.active += 1
+            self.started += 1
+            self.max_active = max(self.max_active, self.active)
+        self.emitters[chat_id] = emit
+
+        def stop():
+            time.sleep(self.stop_delay)
+            with self._lock:
+                self.active -= 1
+                self.stopped += 1
+
+        return stop
+
+
+async def _max_loop_stall(work):
+    """Run `work` while a ticker measures the longest gap between event loop turns."""
+    gaps = []
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.005)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    task = asyncio.ensure_future(ticker())
+    try:
+        await work()
+    finally:
+        done.set()
+        await task
+    return max(gaps)
+
+
+def test_listener_start_and_stop_do_not_block_the_loop():
+    source = BlockingSource(start_delay=0.2, stop_delay=0.3)
+    hub = ChatHub(source)
+
+    async def work():
+        subscription = await hub.subscribe('chat')
+        subscription.close()
+        await hub.close()
+
+    stall = asyncio.run(_max_loop_stall(work))
+    assert stall < 0.1
+    assert (source.started, source.stopped) == (1, 1)
+
+
+def test_resubscribe_waits_for_the_previous_listener_to_stop():
+    source = BlockingSource(stop_delay=0.2)
+    hub = ChatHub(source)
+
+    async def run():
+        first = await hub.subscribe('chat')
+        first.close()
+        second = await hub.subscribe('chat')
+        assert source.stopped == 1
+        assert hub.stats() == {'chats': 1, 'subscribers': 1, 'dropped': 0}
+        second.close()
+        await hub.close()
+
+    asyncio.run(run())
+    assert source.max_active == 1
+    assert (source.started, source.stopped) == (2, 2)
+
+
+def test_leaving_while_the_listener_starts_still_stops_it():
+    source = BlockingSource(start_delay=0.2)
+    hub = ChatHub(source)
+
+    async def run():
+        pending = asyncio.ensure_future(hub.subscribe('chat'))
+        await asyncio.sleep(0.05)
+        pending.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        assert hub.stats()['chats'] == 0
+        await hub.close()
+
+    asyncio.run(run())
+    assert (source.started, source.stopped) == (1, 1)
+
+
+def test_failed_start_raises_and_is_retried():
+    source = BlockingSource(fail=True)
+    hub = ChatHub(source)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await hub.subscribe('chat')
+        assert hub.stats()['chats'] == 0
+        source.fail = False
+        subscription = await hub.subscribe('chat')
+        subscription.close()
+        await hub.close()
+
+    asyncio.run(run())
+    assert (source.started, source.stopped) == (1, 1)
+
+
+def test_fan_out_and_slow_subscriber_drop():
+    source = BlockingSource()
+    hub = ChatHub(source, buffer_size=2)
+
+    async def run():
+        fast, slow = await hub.subscribe('chat'), await hub.subscribe('chat')
+        assert source.started == 1
+        source.emitters['chat']([{'id': 1}, {'id': 2}])
+        await asyncio.sleep(0.01)
+        assert [await fast.__anext__(), await fast.__anext__()] == [{'id': 1}, {'id': 2}]
+        source.emitters['chat']([{'id': 3}])
+        await asyncio.sleep(0.01)
+        assert slow.dropped and not fast.dropped
+        assert [message async for message in slow] == []
+        assert await fast.__anext__() == {'id': 3}
+        fast.close()
+        await hub.close()
+
+    asyncio.run(run())
+    assert hub.dropped == 1
+    assert source.stopped == 1
+
+
+def test_websocket_with_blocking_unsubscribe(db, monkeypatch):
+    from fakes import FakeWatch
+    from fastapi.testclient import TestClient
+
+    unsubscribe = FakeWatch.unsubscribe
+
+    def slow_unsubscribe(self):
+        time.sleep(0.2)
+        unsubscribe(self)
+
+    monkeypatch.setattr(FakeWatch, 'unsubscribe', slow_unsubscribe)
+    db.seed('chats', 'c1', {'participants': ['alice', 'bob']})
+
+    # Entering the client runs the app on one event loop for all connections, as uvicorn does.
+    with TestClient(main.app) as client:
+        with client.websocket_connect('/chats/c1/ws', headers=auth('alice')) as ws:
+            resp = client.post('/chats/c1/messages', json={'text': 'hello'}, headers=auth('bob'))
+            assert resp.status_code == 201
+            assert ws.receive_json()['text'] == 'hello'
+        deadline = time.monotonic() + 2
+        while db._watchers.get('chats/c1/messages') and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not db._watchers.get('chats/c1/messages')
+        assert main._chat_hub.stats()['chats'] == 0
@@ -0,0 +1,133 @@
+import asyncio
+import gzip
+import json
+import zlib
+
+import pytest
+
+import compression
+from compression import CompressionMiddleware, choose_encoding
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip', 'gzip'),
+    ('', None),
+    ('identity', None),
+    ('gzip;q=0', None),
+    ('GZIP; Q=0.5', 'gzip'),
+    ('gzip;level=1;q=0', None),
+    ('gzip;q=abc', None),
+    ('identity;q=0', None),
+    ('identity;q=0, gzip;q=0.5', 'gzip'),
+    ('*', 'gzip'),
+    ('*;q=0, gzip', 'gzip'),
+    ('gzip;q=0, *', None),
+    ('br', None),
+])
+def test_choose_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(compression, 'brotli', None)
+    assert choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('br, gzip', 'br'),
+    ('gzip, br;q=0.5', 'gzip'),
+    ('br;q=0.8, gzip;q=0.8', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'br'),
+])
+def test_choose_encoding_with_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(compression, 'brotli', object())
+    assert choose_encoding(header) == expected
+    assert choose_encoding(header, allow_brotli=False) in ('gzip', None)
+
+
+def _app(body_chunks, content_type='application/json', status=200, headers=()):
+    async def app(scope, receive, send):
+        raw = [(b'content-type', content_type.encode())] + [(k.encode(), v.encode()) for k, v in headers]
+        if len(body_chunks) == 1:
+            raw.append((b'content-length', str(len(body_chunks[0])).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': raw})
+        for i, chunk in enumerate(body_chunks):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(body_chunks) - 1})
+    return app
+
+
+def _call(app, accept_encoding='gzip', minimum_size=100, on_message=None):
+    """Run the middleware around `app`; returns (response headers, list of body messages)."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+        if on_message is not None:
+            on_message(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send))
+    start, *bodies = messages
+    headers = {k.decode().lower(): v.decode() for k, v in start['headers']}
+    return headers, bodies
+
+
+def test_small_bodies_are_not_compressed():
+    body = json.dumps({'ok': True}).encode()
+    headers, bodies = _call(_app([body]))
+    assert 'content-encoding' not in headers
+    assert b''.join(m['body'] for m in bodies) == body
+
+
+def test_large_bodies_are_compressed():
+    body = json.dumps([{'id': i, 'name': 'x' * 20} for i in range(100)]).encode()
+    headers, bodies = _call(_app([body]))
+    assert headers['content-encoding'] == 'gzip'
+    assert headers['vary'] == 'Accept-Encoding'
+    compressed = b''.join(m['body'] for m in bodies)
+    assert int(headers['content-length']) == len(compressed) < len(body)
+    assert gzip.decompress(compressed) == body
+
+
+def test_without_accepted_encoding_the_body_is_untouched():
+    body = b'{"a": "' + b'x' * 500 + b'"}'
+    headers, bodies = _call(_app([body]), accept_encoding='identity')
+    assert 'content-encoding' not in headers
+    assert bodies[0]['body'] == body
+
+
+@pytest.mark.parametrize('content_type, status, extra', [
+    ('application/json', 200, [('content-encoding', 'br')]),
+    ('image/png', 200, []),
+    ('application/json', 204, []),
+])
+def test_ineligible_responses_pass_through(content_type, status, extra):
+    body = b'x' * 500
+    headers, bodies = _call(_app([body], content_type, status, extra))
+    assert headers.get('content-encoding') == dict(extra).get('content-encoding')
+    assert headers['content-length'] == '500'
+    assert bodies[0]['body'] == body
+
+
+def test_streamed_ndjson_is_flushed_per_chunk():
+    rows = [(json.dumps({'row': i}) + '\n').encode() for i in range(5)]
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    received = []
+
+    def on_message(message):
+        # every chunk must be decodable on arrival, not only at the end of the stream
+        if message['type'] == 'http.response.body':
+            received.append(decoder.decompress(message['body']))
+
+    headers, bodies = _call(_app(rows, 'application/x-ndjson'), on_message=on_message)
+    assert headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in headers
+    assert received[:len(rows)] == rows
+    assert [m['more_body'] for m in bodies] == [True] * (len(rows) - 1) + [False]
+    assert decoder.eof
+
+
+def test_app_responses_are_compressed(client):
+    resp = client.get('/openapi.json', headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['content-encoding'] == 'gzip'
+    assert resp.json()['paths']
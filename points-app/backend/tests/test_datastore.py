@@ -0,0 +1,20 @@
+import asyncio
+import threading
+
+from datastore import FirestoreExecutor
+
+
+def test_shutdown_releases_threads_and_executor_stays_usable():
+    executor = FirestoreExecutor({'read': 2})
+
+    async def call():
+        return await executor.run(threading.current_thread)
+
+    worker = asyncio.run(call())
+    executor.shutdown()
+    worker.join(1.0)
+    assert not worker.is_alive()
+
+    restarted = asyncio.run(call())
+    assert restarted is not worker and restarted.name.startswith('firestore')
+    executor.shutdown()
@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+import backfill_direct_chats
+import main
+from conftest import auth
+
+
+def _open(client, uid, peer):
+    return client.post('/chats/direct', json={'peerId': peer}, headers=auth(uid))
+
+
+def test_get_or_create_direct_chat(client, db):
+    resp = _open(client, 'alice', 'bob')
+    assert resp.status_code == 201
+    chat_id = resp.json()['chatId']
+    assert db._docs[f'chats/{chat_id}']['participants'] == ['alice', 'bob']
+
+    assert _open(client, 'alice', 'bob').json() == {'chatId': chat_id, 'created': False}
+    assert _open(client, 'bob', 'alice').json() == {'chatId': chat_id, 'created': False}
+    assert _open(client, 'alice', 'alice').status_code == 400
+
+
+def test_pair_ids_are_unambiguous():
+    assert main._direct_chat_id('a_b', 'c') != main._direct_chat_id('a', 'b_c')
+    assert main._direct_chat_id('alice', 'bob') == main._direct_chat_id('bob', 'alice')
+    assert main._direct_chat_id('a', 'b') == backfill_direct_chats.direct_chat_id('a', 'b')
+
+
+def test_uids_with_separator_get_separate_chats(client, db):
+    first = _open(client, 'a_b', 'c').json()['chatId']
+    second = _open(client, 'a', 'b_c')
+    assert second.status_code == 201
+    assert second.json()['chatId'] != first
+
+
+def test_index_entry_for_other_participants_is_not_returned(client, db):
+    db.seed('chats', 'private', {'participants': ['carol', 'dave']})
+    db.seed('direct_chats', main._direct_chat_id('alice', 'bob'),
+            {'chatId': 'private', 'participants': ['carol', 'dave']})
+
+    resp = _open(client, 'alice', 'bob')
+    assert resp.status_code == 500
+    assert 'private' not in resp.text
+
+
+def test_backfilled_chat_is_found(client, db):
+    db.seed('chats', 'legacy', {'participants': ['bob', 'alice'], 'createdAt': datetime.now(timezone.utc)})
+    assert backfill_direct_chats.backfill(db)['written'] == 1
+    assert _open(client, 'alice', 'bob').json() == {'chatId': 'legacy', 'created': False}
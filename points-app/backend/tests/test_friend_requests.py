@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta, timezone
+
+import backfill_friend_inboxes
+import rekey_friend_requests
+from conftest import auth, seed_users
+
+
+def _send(client, sender, receiver):
+    return client.post('/friend_requests', json={'senderId': sender, 'receiverId': receiver}, headers=auth(sender))
+
+
+def _friend_uids(client, uid):
+    resp = client.get('/me/friends', headers=auth(uid))
+    assert resp.status_code == 200
+    return sorted(friend['uid'] for friend in resp.json())
+
+
+def test_request_accept_lifecycle(client, db):
+    seed_users(db, 'alice', 'bob')
+
+    resp = _send(client, 'alice', 'bob')
+    assert resp.status_code == 201
+    assert resp.json()['requestId'] == 'alice_bob'
+    assert _send(client, 'alice', 'bob').status_code == 409
+
+    page = client.get('/me/friend_requests', headers=auth('bob')).json()
+    assert page['counts'] == {'pending': 1, 'sent': 0, 'accepted': 0}
+    assert [r['id'] for r in page['requests']] == ['alice_bob']
+    outgoing = client.get('/me/friend_requests', params={'direction': 'outgoing'}, headers=auth('alice')).json()
+    assert [r['id'] for r in outgoing['requests']] == ['alice_bob']
+
+    assert client.post('/friend_requests/alice_bob:accept', headers=auth('alice')).status_code == 403
+    resp = client.post('/friend_requests/alice_bob:accept', headers=auth('bob'))
+    assert resp.json() == {'requestId': 'alice_bob', 'status': 'accepted'}
+    assert client.post('/friend_requests/alice_bob:decline', headers=auth('bob')).status_code == 409
+
+    assert _friend_uids(client, 'alice') == ['bob']
+    assert _friend_uids(client, 'bob') == ['alice']
+    page = client.get('/me/friend_requests', params={'status': 'accepted'}, headers=auth('bob')).json()
+    assert page['counts'] == {'pending': 0, 'sent': 0, 'accepted': 1}
+    assert [r['id'] for r in page['requests']] == ['alice_bob']
+
+
+def test_declined_request_can_be_sent_again(client, db):
+    seed_users(db, 'alice', 'bob')
+    _send(client, 'alice', 'bob')
+
+    resp = client.post('/friend_requests/alice_bob:decline', headers=auth('bob'))
+    assert resp.json() == {'requestId': 'alice_bob', 'status': 'declined'}
+    assert _friend_uids(client, 'bob') == []
+    assert _send(client, 'alice', 'bob').status_code == 201
+
+
+def test_reverse_request_while_pending(client, db):
+    seed_users(db, 'alice', 'bob')
+    _send(client, 'alice', 'bob')
+
+    resp = _send(client, 'bob', 'alice')
+    assert resp.status_code == 409
+    assert 'accept it instead' in resp.json()['detail']
+    assert 'friend_requests/bob_alice' not in db._docs
+
+
+def test_reverse_request_after_accept(client, db):
+    seed_users(db, 'alice', 'bob')
+    _send(client, 'alice', 'bob')
+    client.post('/friend_requests/alice_bob:accept', headers=auth('bob'))
+
+    resp = _send(client, 'bob', 'alice')
+    assert resp.status_code == 409
+    assert resp.json()['detail'] == 'Users are already friends'
+
+
+def test_batch_create_checks_both_directions(client, db):
+    seed_users(db, 'alice', 'bob', 'carol', 'dave')
+    _send(client, 'bob', 'alice')
+    _send(client, 'alice', 'carol')
+    client.post('/friend_requests/alice_carol:accept', headers=auth('carol'))
+
+    resp = client.post('/friend_requests:batchCreate',
+                       json={'senderId': 'alice', 'receiverIds': ['bob', 'carol', 'dave']}, headers=auth('alice'))
+    assert resp.status_code == 200
+    assert {r['receiverId']: r['status'] for r in resp.json()['results']} == {
+        'bob': 'pending', 'carol': 'friends', 'dave': 'created'}
+
+
+def test_legacy_request_ids(client, db):
+    created = datetime.now(timezone.utc)
+    db.seed('friend_requests', 'Xk2legacy', {'senderId': 'alice', 'receiverId': 'bob', 'status': 'pending',
+                                             'createdAt': created})
+    backfill_friend_inboxes.backfill(db)
+
+    assert client.post('/friend_requests/Xk2legacy:accept', headers=auth('alice')).status_code == 403
+    resp = client.post('/friend_requests/Xk2legacy:accept', headers=auth('bob'))
+    assert resp.json() == {'requestId': 'Xk2legacy', 'status': 'accepted'}
+    assert _friend_uids(client, 'alice') == ['bob']
+
+
+def test_rekey_keeps_the_strongest_duplicate(db):
+    created = datetime.now(timezone.utc)
+    db.seed('friend_requests', 'old1', {'senderId': 'alice', 'receiverId': 'bob', 'status': 'declined',
+                                        'createdAt': created})
+    db.seed('friend_requests', 'old2', {'senderId': 'alice', 'receiverId': 'bob', 'status': 'pending',
+                                        'createdAt': created - timedelta(days=1)})
+    db.seed('friend_requests', 'carol_bob', {'senderId': 'carol', 'receiverId': 'bob', 'status': 'pending',
+                                             'createdAt': created})
+
+    assert rekey_friend_requests.rekey(db, dry_run=True) == {'moved': 1, 'duplicates': 1, 'written': 0}
+    assert rekey_friend_requests.rekey(db) == {'moved': 1, 'duplicates': 1, 'written': 3}
+    requests = {path: doc['status'] for path, doc in db._docs.items() if path.startswith('friend_requests/')}
+    assert requests == {'friend_requests/alice_bob': 'pending', 'friend_requests/carol_bob': 'pending'}
+    assert rekey_friend_requests.rekey(db) == {'moved': 0, 'duplicates': 0, 'written': 0}
@@ -0,0 +1,145 @@
+import random
+
+import pytest
+
+from geo_index import PointIndex, _in_box, haversine_km
+
+
+def _index(points, cell_degrees=1.0, **kwargs):
+    index = PointIndex(cell_degrees, **kwargs)
+    for uid, lat, lng in points:
+        index.upsert(uid, lat, lng, 1.0)
+    index.ready = True
+    return index
+
+
+def _random_points(rng, n):
+    return [(f'u{i}', rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(n)]
+
+
+def _brute_nearest(points, lat, lng, k, among=None, max_km=None):
+    pairs = sorted((haversine_km(lat, lng, p_lat, p_lng), uid) for uid, p_lat, p_lng in points
+                   if among is None or uid in among)
+    return [uid for distance, uid in pairs if max_km is None or distance <= max_km][:k]
+
+
+def test_bbox_across_the_antimeridian():
+    index = _index([('east', 0, 179.5), ('west', 0, -179.5), ('origin', 0, 0), ('north', 5, 179.9)])
+    bbox = (-1, 179, 1, -179)
+    everyone = {'east', 'west', 'origin', 'north'}
+    # no friend filter, a small one (scanned) and a large one (cells visited)
+    assert {p.uid for p in index.within(bbox)} == {'east', 'west'}
+    assert {p.uid for p in index.within(bbox, {'west', 'origin'})} == {'west'}
+    assert {p.uid for p in index.within(bbox, everyone | {f'x{i}' for i in range(100)})} == {'east', 'west'}
+    assert {p.uid for p in index.within((-1, -179, 1, 179))} == {'origin'}
+
+
+@pytest.mark.parametrize('among_size', [None, 5, 400])
+def test_within_matches_a_scan(among_size):
+    rng = random.Random(among_size)
+    points = _random_points(rng, 300)
+    index = _index(points, cell_degrees=5.0)
+    among = None if among_size is None else {f'u{rng.randrange(600)}' for _ in range(among_size)}
+    for _ in range(50):
+        min_lat = rng.uniform(-90, 80)
+        bbox = (min_lat, rng.uniform(-180, 180), rng.uniform(min_lat, 90), rng.uniform(-180, 180))
+        expected = {uid for uid, lat, lng in points if _in_box(lat, lng, bbox) and (among is None or uid in among)}
+        assert {p.uid for p in index.within(bbox, among)} == expected
+
+
+@pytest.mark.parametrize('among_size', [None, 10, 200])
+def test_nearest_matches_a_scan(among_size):
+    rng = random.Random(among_size)
+    points = _random_points(rng, 200)
+    index = _index(points, cell_degrees=2.0)
+    among = None if among_size is None else {f'u{rng.randrange(300)}' for _ in range(among_size)}
+    for k in (1, 5, 500):
+        for max_km in (None, 1000):
+            lat, lng = rng.uniform(-80, 80), rng.uniform(-180, 180)
+            found = [p.uid for _, p in index.nearest(lat, lng, k, among, max_km)]
+            assert found == _brute_nearest(points, lat, lng, k, among, max_km)
+
+
+def _count_ring_cells(index):
+    probes = [0]
+    ring_cells = index._ring_cells
+
+    def counting(*args):
+        for cell in ring_cells(*args):
+            probes[0] += 1
+            yield cell
+
+    index._ring_cells = counting
+    return probes
+
+
+def test_nearest_stops_once_every_point_is_seen():
+    index = _index([(f'u{i}', 10 + i * 0.01, 20) for i in range(5)], cell_degrees=0.05)
+    probes = _count_ring_cells(index)
+    assert [p.uid for _, p in index.nearest(10, 20, 50)] == [f'u{i}' for i in range(5)]
+    assert probes[0] < 50
+
+
+def test_nearest_scans_instead_of_searching_far_rings():
+    points = [('far', -10, 60), ('farther', -60, -120)]
+    index = _index(points, cell_degrees=0.05)
+    probes = _count_ring_cells(index)
+    assert [p.uid for _, p in index.nearest(10, 20, 1)] == _brute_nearest(points, 10, 20, 1) == ['far']
+    assert [p.uid for _, p in index.nearest(10, 20, 1, among={'farther'})] == ['farther']
+    assert probes[0] < 10
+    assert index.nearest(10, 20, 0) == []
+    assert PointIndex(0.05).nearest(10, 20, 5) == []
+
+
+def test_upsert_keeps_the_newest_write():
+    index = PointIndex(1.0)
+    assert index.upsert('alice', 1, 1, 10.0) is not None
+    assert index.upsert('alice', 2, 2, 5.0) is None
+    assert index.get('alice').lat == 1
+    assert index.upsert('alice', 50, 50, 11.0).version == 2
+    assert index.within((49, 49, 51, 51))[0].uid == 'alice'
+    assert index.within((0, 0, 2, 2)) == []
+    assert not index.remove('alice', before=10.5)
+    assert index.remove('alice', before=11.0)
+
+
+def test_changed_since_reports_moves_and_removals():
+    index = _index([('alice', 0, 0), ('bob', 0, 1), ('carol', 0, 2)])
+    version = index.version
+    index.upsert('alice', 0, 0.5, 2.0)
+    index.upsert('bob', 40, 40, 2.0)
+    index.remove('carol')
+
+    changed, removed = index.changed_since(version, {'alice', 'bob', 'carol', 'dave'})
+    assert sorted(p.uid for p in changed) == ['alice', 'bob']
+    assert removed == ['carol']
+    # bob left the box, so a client watching the box drops him
+    changed, removed = index.changed_since(version, {'alice', 'bob', 'carol'}, bbox=(-1, -1, 1, 3))
+    assert [p.uid for p in changed] == ['alice']
+    assert sorted(removed) == ['bob', 'carol']
+    assert index.changed_since(index.version, {'alice'}) == ([], [])
+    assert index.changed_since(index.version + 1, {'alice'}) is None
+
+
+def test_expired_tombstones_make_old_versions_unanswerable():
+    index = _index([('alice', 0, 0), ('bob', 0, 1), ('carol', 0, 2)], max_tombstones=2)
+    version = index.version
+    index.remove('alice')
+    after_first = index.version
+    index.remove('bob')
+    index.remove('carol')  # evicts alice's tombstone
+
+    assert index.stats()['tombstones'] == 2
+    assert index.changed_since(version, {'alice', 'bob', 'carol'}) is None
+    changed, removed = index.changed_since(after_first, {'alice', 'bob', 'carol'})
+    assert (changed, sorted(removed)) == ([], ['bob', 'carol'])
+
+
+def test_load_sets_the_horizon():
+    index = PointIndex(1.0)
+    index.upsert('early', 0, 0, 1.0)
+    index.load([('alice', 1, 1, 1.0, None), ('early', 2, 2, 0.5, None)])
+    assert index.ready
+    assert index.get('early').lat == 0
+    assert index.changed_since(0, {'alice'}) is None
+    assert index.changed_since(index.version, {'alice'}) == ([], [])
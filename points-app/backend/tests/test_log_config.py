@@ -0,0 +1,51 @@
+import logging
+
+from starlette.routing import Route
+
+from conftest import auth
+from log_config import DebugSampler, redact_headers, route_template
+
+
+def _endpoint(request):
+    pass
+
+
+def _sampler(default_rate, spec, level=logging.DEBUG):
+    logger = logging.getLogger('test_debug_sampler')
+    logger.setLevel(level)
+    return DebugSampler.from_spec(logger, default_rate, spec)
+
+
+def test_route_template_uses_the_declared_path():
+    assert route_template({'route': Route('/users/{uid}', _endpoint)}) == '/users/{uid}'
+    assert route_template({'route': Route('/files/{name:path}', _endpoint)}) == '/files/{name}'
+    assert route_template({}) == 'unmatched'
+
+
+def test_sampler_rates_match_route_templates():
+    sampled = _sampler(1.0, '/users/{uid}=0, /friend_requests = 1')
+    assert not sampled(route_template({'route': Route('/users/{uid}', _endpoint)}))
+    assert sampled('/friend_requests')
+    assert sampled('unmatched')
+
+
+def test_sampler_is_off_without_debug():
+    sampled = _sampler(1.0, '', level=logging.INFO)
+    assert not sampled('/friend_requests')
+
+
+def test_trace_is_keyed_on_the_matched_route(client, db, monkeypatch):
+    import main
+
+    routes = []
+    monkeypatch.setattr(main, '_debug_sampled', lambda route: routes.append(route) and False)
+    client.post('/friend_requests/bob_alice:accept', headers=auth('alice'))
+    assert routes == ['/friend_requests/{request_id}:accept']
+
+
+def test_redact_headers():
+    headers = {'Authorization': 'Bearer secret', 'Cookie': 'a=b', 'Accept': 'application/json'}
+    redacted = redact_headers(headers)
+    assert 'secret' not in str(redacted)
+    assert 'a=b' not in str(redacted)
+    assert redacted['Accept'] == 'application/json'
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+import main
+from conftest import auth, seed_users
+from geo_index import PointIndex
+
+
+@pytest.fixture
+def points(db, monkeypatch):
+    index = PointIndex(main.POINT_CELL_DEGREES, max_tombstones=2)
+    index.ready = True
+    monkeypatch.setattr(main, '_point_index', index)
+    monkeypatch.setattr(main, '_point_writer', main._PointWriter())
+    return index
+
+
+@pytest.fixture
+def friends(client, db):
+    seed_users(db, 'alice', 'bob', 'carol', 'dave')
+    for friend in ('bob', 'carol', 'dave'):
+        client.post('/friend_requests', json={'senderId': 'alice', 'receiverId': friend}, headers=auth('alice'))
+        client.post(f'/friend_requests/alice_{friend}:accept', headers=auth(friend))
+
+
+def _publish(client, uid, lat, lng):
+    resp = client.put('/me/point', json={'lat': lat, 'lng': lng}, headers=auth(uid))
+    assert resp.status_code == 202
+
+
+def _poll(client, **params):
+    resp = client.get('/me/friends/points', params=params, headers=auth('alice'))
+    assert resp.status_code == 200
+    body = resp.json()
+    return body['version'], body['full'], sorted(p['uid'] for p in body['points']), sorted(body.get('removed', []))
+
+
+def test_delta_polling(client, points, friends):
+    _publish(client, 'bob', 10, 20)
+    _publish(client, 'carol', 10.01, 20.01)
+    version, full, uids, _ = _poll(client)
+    assert (full, uids) == (True, ['bob', 'carol'])
+
+    _publish(client, 'bob', 10.02, 20)
+    client.delete('/me/point', headers=auth('carol'))
+    version, full, uids, removed = _poll(client, since=version)
+    assert (full, uids, removed) == (False, ['bob'], ['carol'])
+    assert _poll(client, since=version)[1:] == (False, [], [])
+
+
+def test_since_from_another_filter_or_epoch_returns_a_snapshot(client, points, friends, monkeypatch):
+    _publish(client, 'bob', 10, 20)
+    version, *_ = _poll(client)
+    assert _poll(client, since=version, bbox='9,19,11,21')[1:3] == (True, ['bob'])
+
+    restarted = PointIndex(main.POINT_CELL_DEGREES)
+    restarted.load([('bob', 10, 20, 1.0, None)])
+    monkeypatch.setattr(main, '_point_index', restarted)
+    assert _poll(client, since=version)[1:3] == (True, ['bob'])
+
+
+def test_expired_tombstones_force_a_snapshot(client, points, friends):
+    for uid in ('bob', 'carol', 'dave'):
+        _publish(client, uid, 10, 20)
+    version, *_ = _poll(client)
+    for uid in ('bob', 'carol', 'dave'):
+        client.delete('/me/point', headers=auth(uid))
+    assert _poll(client, since=version)[1:] == (True, [], [])
+
+
+def test_bbox_across_the_antimeridian(client, points, friends):
+    _publish(client, 'bob', 0, 179.9)
+    _publish(client, 'carol', 0, -179.9)
+    _publish(client, 'dave', 0, 0)
+    assert _poll(client, bbox='-1,179,1,-179')[2] == ['bob', 'carol']
+    assert client.get('/me/friends/points', params={'bbox': '1,0,-1,2'}, headers=auth('alice')).status_code == 400
+
+
+def test_nearest_friends(client, points, friends):
+    _publish(client, 'bob', 10, 20)
+    _publish(client, 'carol', -10, 60)
+    resp = client.get('/me/friends/points:nearest', params={'lat': 10, 'lng': 20, 'k': 5}, headers=auth('alice'))
+    assert [p['uid'] for p in resp.json()] == ['bob', 'carol']
+    assert resp.json()[0]['distanceKm'] == 0
+
+
+def test_writer_coalesces_writes_into_one_batch(client, db, points):
+    for lat in (1, 2, 3):
+        _publish(client, 'bob', lat, 20)
+    _publish(client, 'carol', 5, 5)
+    client.delete('/me/point', headers=auth('dave'))
+    rpcs = db.rpc_count
+
+    asyncio.run(main._point_writer.flush())
+    assert db.rpc_count - rpcs == 1
+    assert db._docs['points/bob']['lat'] == 3
+    assert db._docs['points/carol']['lat'] == 5
+    assert main._point_writer.stats() == {'pending': 0, 'written': 3, 'coalesced': 2}
+
+
+def test_failed_flush_keeps_newer_writes(db, points, monkeypatch):
+    writer = main._point_writer
+    batch = db.batch
+    calls = []
+
+    def failing_batch():
+        b = batch()
+        commit = b.commit
+
+        def fail_once():
+            calls.append(1)
+            if len(calls) == 1:
+                # a newer point arrives while the failing commit is in flight
+                writer.put('bob', {'lat': 2})
+                raise RuntimeError('unavailable')
+            commit()
+
+        b.commit = fail_once
+        return b
+
+    monkeypatch.setattr(db, 'batch', failing_batch)
+    writer.put('bob', {'lat': 1})
+    writer.put('carol', {'lat': 1})
+    asyncio.run(writer.flush())
+    assert writer.stats()['pending'] == 2
+    asyncio.run(writer.flush())
+    assert db._docs['points/bob'] == {'lat': 2}
+    assert db._docs['points/carol'] == {'lat': 1}
@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+import pytest
+
+import main
+import resilience
+from conftest import auth
+from fakes import FakeFirestore
+from resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, DeadlineMiddleware, clip, hedged
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_half_opens_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker('upstream', failure_threshold=3, reset_timeout=10, clock=clock)
+    for _ in range(2):
+        breaker.allow()
+        breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 2.5
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.allow()
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {'Retry-After': '8'}
+
+    clock.now += 7.5
+    breaker.allow()  # the probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.allow()
+    assert exc.value.headers == {'Retry-After': '1'}
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+    assert breaker.stats() == {'state': 'closed', 'failures': 0, 'opened': 1, 'rejected': 2}
+
+
+def test_failed_probe_reopens_and_released_probe_is_retried():
+    clock = Clock()
+    breaker = CircuitBreaker('upstream', failure_threshold=1, reset_timeout=5, clock=clock)
+    breaker.allow()
+    breaker.failure()
+    clock.now += 5
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    clock.now += 5
+    breaker.allow()
+    breaker.release()  # e.g. cancelled: says nothing about the dependency
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_breaker_with_zero_threshold_never_opens():
+    breaker = CircuitBreaker('upstream', failure_threshold=0)
+    for _ in range(10):
+        breaker.allow()
+        breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_breaker_answers_503_with_retry_after(client, identity, monkeypatch):
+    breaker = CircuitBreaker('identity_toolkit', failure_threshold=1, reset_timeout=30)
+    breaker.failure()
+    monkeypatch.setitem(main._breakers, 'identity_toolkit', breaker)
+
+    resp = client.post('/login', json={'email': 'alice@example.com', 'password': 'pw'})
+    assert resp.status_code == 503
+    assert 1 <= int(resp.headers['retry-after']) <= 30
+
+
+def test_hedged_read_returns_the_faster_copy_and_cancels_the_other():
+    calls = []
+    cancelled = []
+
+    async def attempt():
+        index = len(calls)
+        calls.append(index)
+        try:
+            await asyncio.sleep(1.0 if index == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        return index
+
+    async def run():
+        result = await hedged(attempt, delay=0.02)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == 1
+    assert calls == [0, 1]
+    assert cancelled == [0]
+
+
+def test_hedged_read_retries_a_failure_at_once_but_not_a_local_rejection():
+    async def run(first_error):
+        calls = []
+
+        async def attempt():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise first_error
+            return 'ok'
+
+        try:
+            return await hedged(attempt, delay=10), len(calls)
+        except Exception as exc:
+            return exc, len(calls)
+
+    assert asyncio.run(run(RuntimeError('upstream'))) == ('ok', 2)
+    error, attempts = asyncio.run(run(CircuitOpen('upstream', 1)))
+    assert isinstance(error, CircuitOpen) and attempts == 1
+
+
+def test_hedged_read_raises_the_last_error():
+    async def attempt():
+        raise RuntimeError('down')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedged(attempt, delay=0.01))
+
+
+def test_clip_follows_the_deadline():
+    assert clip(5) == 5
+    with resilience.deadline(1.0):
+        assert clip(None) <= 1.0
+        assert clip(0.5) == 0.5
+        assert 0.9 < clip(5) <= 1.0
+        with resilience.without_deadline():
+            assert clip(5) == 5
+    with resilience.deadline(-1):
+        with pytest.raises(DeadlineExceeded) as exc:
+            clip(5)
+    assert exc.value.status_code == 504
+
+
+def test_deadline_middleware_budget():
+    middleware = DeadlineMiddleware(None, default_timeout=10, max_timeout=20)
+
+    def budget(value):
+        return middleware._budget({'type': 'http', 'headers': [(b'x-request-timeout', value.encode())]})
+
+    assert budget('2.5') == 2.5
+    assert budget('60') == 20
+    assert budget('0') == 10
+    assert budget('soon') == 10
+
+
+def test_request_past_its_deadline_answers_504(client, monkeypatch):
+    db = FakeFirestore(latency=0.5)
+    monkeypatch.setattr(main, '_firestore_client', db)
+    monkeypatch.setattr(main, '_firebase_initialized', True)
+
+    started = time.monotonic()
+    resp = client.get('/users/alice', headers={**auth('alice'), 'X-Request-Timeout': '0.1'})
+    assert resp.status_code == 504
+    assert resp.json()['detail'] == 'Request deadline exceeded'
+    assert time.monotonic() - started < 0.4
+
@@ -0,0 +1,115 @@
+import sqlite3
+
+import pytest
+
+import token_store
+from token_store import RefreshEntry
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    store = token_store.create_token_store(request.param, str(tmp_path / 'tokens.sqlite3'))
+    yield store
+    store.close()
+
+
+def test_refresh_token_round_trip(store):
+    entry = RefreshEntry('alice', 'alice@example.com', 'alice', 2000, 3)
+    store.put('token-1', entry)
+    assert store.get('token-1') == entry
+    assert store.get('token-2') is None
+
+    assert store.revoke('token-1') == entry
+    assert store.get('token-1') is None
+    assert store.is_revoked('token-1')
+    assert store.revoke('token-1') is None
+
+    store.put('token-2', entry._replace(account_name=None))
+    store.delete('token-2')
+    assert store.get('token-2') is None
+    assert not store.is_revoked('token-2')
+
+
+def test_access_revocations_and_generations(store):
+    store.revoke_access('jti-1', 2000)
+    assert store.is_access_revoked('jti-1', 2000)
+    assert not store.is_access_revoked('jti-2', 2000)
+
+    assert store.generation('alice') == 0
+    assert store.bump_generation('alice') == 1
+    assert store.bump_generation('alice') == 2
+    assert store.access_state('alice', 'jti-1', 2000) == (True, 2)
+    assert store.access_state('bob', None, 2000) == (False, 0)
+
+
+def test_sweep_drops_expired_entries(store):
+    store.put('expired', RefreshEntry('alice', 'alice@example.com', None, 1000))
+    store.put('live', RefreshEntry('alice', 'alice@example.com', None, 5000))
+    store.put('revoked', RefreshEntry('alice', 'alice@example.com', None, 1000))
+    store.revoke('revoked')
+    store.revoke_access('old', 1000)
+    store.revoke_access('new', 5000)
+
+    assert store.sweep(3000) == 3
+    assert store.get('expired') is None
+    assert not store.is_revoked('revoked')
+    assert not store.is_access_revoked('old', 1000)
+    assert store.get('live') is not None
+    assert store.is_access_revoked('new', 5000)
+    assert store.sweep(3000) == 0
+
+
+def test_sqlite_store_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / 'tokens.sqlite3')
+    first, second = token_store.SQLiteTokenStore(path), token_store.SQLiteTokenStore(path)
+    try:
+        first.put('token', RefreshEntry('alice', 'alice@example.com', 'alice', 2000))
+        first.bump_generation('alice')
+        assert second.get('token') == RefreshEntry('alice', 'alice@example.com', 'alice', 2000)
+        assert second.generation('alice') == 1
+    finally:
+        first.close()
+        second.close()
+
+
+def test_sqlite_store_adds_generation_column(tmp_path):
+    path = str(tmp_path / 'tokens.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE refresh_tokens (
+            key BLOB PRIMARY KEY,
+            uid TEXT NOT NULL,
+            email TEXT NOT NULL,
+            account_name TEXT,
+            expires INTEGER NOT NULL,
+            revoked INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+    """)
+    conn.execute('INSERT INTO refresh_tokens (key, uid, email, account_name, expires) VALUES (?, ?, ?, ?, ?)',
+                 (token_store._key('old-token'), 'alice', 'alice@example.com', 'alice', 2000))
+    conn.commit()
+    conn.close()
+
+    store = token_store.SQLiteTokenStore(path)
+    try:
+        assert store.get('old-token') == RefreshEntry('alice', 'alice@example.com', 'alice', 2000, 0)
+        store.put('new-token', RefreshEntry('alice', 'alice@example.com', 'alice', 2000, 4))
+        assert store.get('new-token').generation == 4
+    finally:
+        store.close()
+    # reopening an already migrated store is a no-op
+    token_store.SQLiteTokenStore(path).close()
+
+
+def test_sqlite_store_rejects_calls_after_close(tmp_path):
+    store = token_store.SQLiteTokenStore(str(tmp_path / 'tokens.sqlite3'))
+    store.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        store.get('token')
+
+
+def test_create_token_store_rejects_unknown_kinds():
+    with pytest.raises(ValueError):
+        token_store.create_token_store('redis')
+    with pytest.raises(ValueError):
+        token_store.create_token_store('sqlite', None)
@@ -0,0 +1,315 @@
+"""
+Refresh-token storage backends.
+
+- MemoryTokenStore: process-local; entries are evicted at their expiry by a
+  min-heap that `sweep()` drains (main.py runs it from a background task).
+- SQLiteTokenStore: a shared on-disk store (WAL mode) so several uvicorn
+  workers on one host see the same refresh tokens and revocations.
+
+Tokens are stored by SHA-256 digest, never in clear text. Revoked tokens are
+only remembered until they would have expired anyway.
+
+The stores also hold access-token revocations (by `jti`, see RevocationShards)
+and per-user token generations: bumping a user's generation invalidates every
+access and refresh token issued before it without storing anything per token.
+"""
+
+import hashlib
+import heapq
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+
+class RefreshEntry(NamedTuple):
+    uid: str
+    email: str
+    account_name: Optional[str]
+    expires: int
+    # user's token generation when the refresh token was issued
+    generation: int = 0
+
+
+def _key(token: str) -> bytes:
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+def _jti_key(jti: str) -> int:
+    """64-bit signed int for a jti: compact in memory and fits an SQLite INTEGER key."""
+    return int.from_bytes(hashlib.blake2b(jti.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+class RevocationShards:
+    """Revoked access-token IDs grouped into fixed windows of their expiry time.
+
+    A lookup hashes the jti and checks the one set covering the token's expiry;
+    once a window has passed, `sweep` drops its whole set at once, so nothing is
+    kept for tokens that would be rejected as expired anyway.
+    """
+
+    def __init__(self, shard_seconds: int = 300):
+        self.shard_seconds = shard_seconds
+        self._shards: Dict[int, Set[int]] = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, jti: str, expires: int) -> None:
+        shard = self._shards.setdefault(expires // self.shard_seconds, set())
+        before = len(shard)
+        shard.add(_jti_key(jti))
+        self._size += len(shard) - before
+
+    def contains(self, jti: str, expires: int) -> bool:
+        shard = self._shards.get(expires // self.shard_seconds)
+        return shard is not None and _jti_key(jti) in shard
+
+    def sweep(self, now: int) -> int:
+        # a shard holds expiries up to (index + 1) * shard_seconds - 1
+        cutoff = now // self.shard_seconds
+        removed = 0
+        for index in [i for i in self._shards if i < cutoff]:
+            removed += len(self._shards.pop(index))
+        self._size -= removed
+        return removed
+
+
+class TokenStore:
+    """Interface shared by the refresh-token backends."""
+
+    # True if calls do blocking I/O and should be kept off the event loop.
+    blocking = False
+
+    def put(self, token: str, entry: RefreshEntry) -> None:
+        raise NotImplementedError
+
+    def get(self, token: str) -> Optional[RefreshEntry]:
+        """Return the live (not revoked) entry for `token`, or None."""
+        raise NotImplementedError
+
+    def delete(self, token: str) -> None:
+        raise NotImplementedError
+
+    def revoke(self, token: str) -> Optional[RefreshEntry]:
+        """Revoke `token` and return its entry, or None if it was not live."""
+        raise NotImplementedError
+
+    def is_revoked(self, token: str) -> bool:
+        raise NotImplementedError
+
+    def revoke_access(self, jti: str, expires: int) -> None:
+        """Reject the access token with this `jti` until `expires` (its exp, plus any leeway)."""
+        raise NotImplementedError
+
+    def is_access_revoked(self, jti: str, expires: int) -> bool:
+        raise NotImplementedError
+
+    def generation(self, uid: str) -> int:
+        """Current token generation of `uid` (0 until the first bump)."""
+        raise NotImplementedError
+
+    def bump_generation(self, uid: str) -> int:
+        """Invalidate all of `uid`'s existing tokens. Returns the new generation."""
+        raise NotImplementedError
+
+    def access_state(self, uid: str, jti: Optional[str], expires: int) -> Tuple[bool, int]:
+        """(whether access token `jti` is revoked, `uid`'s generation): both checks made per request."""
+        return jti is not None and self.is_access_revoked(jti, expires), self.generation(uid)
+
+    def sweep(self, now: Optional[int] = None) -> int:
+        """Drop everything whose expiry has passed. Returns the number of entries removed."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryTokenStore(TokenStore):
+    def __init__(self, revocation_shard_seconds: int = 300):
+        self._live = {}
+        self._revoked = {}
+        # (expires, key) pairs; stale pairs (already deleted/re-put) are skipped lazily
+        self._heap = []
+        self._access_revoked = RevocationShards(revocation_shard_seconds)
+        # only users who have bumped their generation have an entry
+        self._generations: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self._live) + len(self._revoked) + len(self._access_revoked)
+
+    def put(self, token, entry):
+        key = _key(token)
+        self._live[key] = entry
+        heapq.heappush(self._heap, (entry.expires, key))
+
+    def get(self, token):
+        return self._live.get(_key(token))
+
+    def delete(self, token):
+        self._live.pop(_key(token), None)
+
+    def revoke(self, token):
+        key = _key(token)
+        entry = self._live.pop(key, None)
+        if entry is not None:
+            self._revoked[key] = entry.expires
+        return entry
+
+    def is_revoked(self, token):
+        return _key(token) in self._revoked
+
+    def revoke_access(self, jti, expires):
+        self._access_revoked.add(jti, expires)
+
+    def is_access_revoked(self, jti, expires):
+        return self._access_revoked.contains(jti, expires)
+
+    def generation(self, uid):
+        return self._generations.get(uid, 0)
+
+    def bump_generation(self, uid):
+        generation = self._generations[uid] = self._generations.get(uid, 0) + 1
+        return generation
+
+    def sweep(self, now=None):
+        now = int(time.time()) if now is None else now
+        heap = self._heap
+        removed = self._access_revoked.sweep(now)
+        while heap and heap[0][0] < now:
+            expires, key = heapq.heappop(heap)
+            entry = self._live.get(key)
+            if entry is not None and entry.expires == expires:
+                del self._live[key]
+                removed += 1
+            if self._revoked.get(key) == expires:
+                del self._revoked[key]
+                removed += 1
+        return removed
+
+
+class SQLiteTokenStore(TokenStore):
+    blocking = True
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
+            key BLOB PRIMARY KEY,
+            uid TEXT NOT NULL,
+            email TEXT NOT NULL,
+            account_name TEXT,
+            expires INTEGER NOT NULL,
+            revoked INTEGER NOT NULL DEFAULT 0,
+            generation INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS refresh_tokens_expires ON refresh_tokens (expires);
+        CREATE TABLE IF NOT EXISTS access_revocations (
+            key INTEGER PRIMARY KEY,
+            expires INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS access_revocations_expires ON access_revocations (expires);
+        CREATE TABLE IF NOT EXISTS token_generations (
+            uid TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.executescript(self._SCHEMA)
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(refresh_tokens)')}
+        if 'generation' not in columns:
+            # store created before token generations existed
+            self._conn.execute('ALTER TABLE refresh_tokens ADD COLUMN generation INTEGER NOT NULL DEFAULT 0')
+
+    def put(self, token, entry):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO refresh_tokens (key, uid, email, account_name, expires, revoked, generation) '
+                'VALUES (?, ?, ?, ?, ?, 0, ?)',
+                (_key(token), entry.uid, entry.email, entry.account_name, entry.expires, entry.generation),
+            )
+
+    def get(self, token):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT uid, email, account_name, expires, generation FROM refresh_tokens WHERE key = ? AND revoked = 0',
+                (_key(token),),
+            ).fetchone()
+        return RefreshEntry(*row) if row else None
+
+    def delete(self, token):
+        with self._lock:
+            self._conn.execute('DELETE FROM refresh_tokens WHERE key = ?', (_key(token),))
+
+    def revoke(self, token):
+        key = _key(token)
+        with self._lock:
+            row = self._conn.execute(
+                'UPDATE refresh_tokens SET revoked = 1 WHERE key = ? AND revoked = 0 '
+                'RETURNING uid, email, account_name, expires, generation',
+                (key,),
+            ).fetchone()
+        return RefreshEntry(*row) if row else None
+
+    def is_revoked(self, token):
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM refresh_tokens WHERE key = ? AND revoked = 1', (_key(token),)).fetchone()
+        return row is not None
+
+    def revoke_access(self, jti, expires):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO access_revocations (key, expires) VALUES (?, ?)',
+                               (_jti_key(jti), expires))
+
+    def is_access_revoked(self, jti, expires):
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM access_revocations WHERE key = ?', (_jti_key(jti),)).fetchone()
+        return row is not None
+
+    def generation(self, uid):
+        with self._lock:
+            row = self._conn.execute('SELECT generation FROM token_generations WHERE uid = ?', (uid,)).fetchone()
+        return row[0] if row else 0
+
+    def bump_generation(self, uid):
+        with self._lock:
+            row = self._conn.execute(
+                'INSERT INTO token_generations (uid, generation) VALUES (?, 1) '
+                'ON CONFLICT (uid) DO UPDATE SET generation = generation + 1 RETURNING generation',
+                (uid,),
+            ).fetchone()
+        return row[0]
+
+    def access_state(self, uid, jti, expires):
+        with self._lock:
+            revoked = jti is not None and self._conn.execute(
+                'SELECT 1 FROM access_revocations WHERE key = ?', (_jti_key(jti),)).fetchone() is not None
+            row = self._conn.execute('SELECT generation FROM token_generations WHERE uid = ?', (uid,)).fetchone()
+        return revoked, row[0] if row else 0
+
+    def sweep(self, now=None):
+        now = int(time.time()) if now is None else now
+        with self._lock:
+            removed = self._conn.execute('DELETE FROM refresh_tokens WHERE expires < ?', (now,)).rowcount
+            removed += self._conn.execute('DELETE FROM access_revocations WHERE expires < ?', (now,)).rowcount
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_token_store(kind: str, path: Optional[str] = None) -> TokenStore:
+    """Build a store from configuration: kind is 'memory' or 'sqlite'."""
+    kind = (kind or 'memory').lower()
+    if kind == 'memory':
+        return MemoryTokenStore()
+    if kind == 'sqlite':
+        if not path:
+            raise ValueError('TOKEN_STORE_PATH is required for the sqlite token store')
+        return SQLiteTokenStore(path)
+    raise ValueError(f'Unknown token store: {kind}')